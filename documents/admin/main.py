@@ -2,12 +2,23 @@ from documents.models import Document_main
 from django.contrib import admin
 from unfold.admin import ModelAdmin
 
+from documents.views.batch_export import batch_export_response
+
 
 @admin.register(Document_main)
 class DocumentAdmin(ModelAdmin):
     list_display = ('title', 'student_name', 'supervisor', 'created_at')
     search_fields = ('title', 'student_name', 'supervisor')
-    list_filter = ('work_type', 'year')
+    list_filter = ('work_type', 'year', 'department_name')
     ordering = ('-created_at',)
     date_hierarchy = 'created_at'
-    list_per_page = 20
\ No newline at end of file
+    list_per_page = 20
+    actions = ('export_zip_docx', 'export_zip_pdf')
+
+    @admin.action(description='Скачать выбранные документы в ZIP (DOCX)')
+    def export_zip_docx(self, request, queryset):
+        return batch_export_response(queryset, 'docx')
+
+    @admin.action(description='Скачать выбранные документы в ZIP (PDF)')
+    def export_zip_pdf(self, request, queryset):
+        return batch_export_response(queryset, 'pdf')
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'documents'
+
+    def ready(self):
+        # Разбираем DOCX-шаблоны титульных листов один раз при старте процесса
+        from documents.services.docx_templates import template_cache
+        template_cache.warm()
+
+        # Прогрев экспорта после сохранения документов (EXPORT_WARM_AHEAD)
+        from documents.signals import connect_signals
+        connect_signals()
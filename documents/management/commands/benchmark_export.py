@@ -0,0 +1,669 @@
+import base64
+import difflib
+import io
+import os
+import re
+import time
+import tracemalloc
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models.main import Document_main
+
+# Образцы HTML в том виде, в каком их сохраняет CKEditor (включая вставку из Word)
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'html_corpus')
+
+
+def make_sample_html(pages, images_per_page=0):
+    """
+    Генерирует HTML, похожий на вывод CKEditor: заголовки, абзацы с отступами,
+    списки, таблицы и (по желанию) встроенные base64-изображения.
+    Одна «страница» — примерно 1800 символов текста.
+    """
+    image_tag = ''
+    if images_per_page:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), (40, 90, 160)).save(buffer, 'PNG')
+        encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+        image_tag = f'<p><img src="data:image/png;base64,{encoded}" /></p>'
+
+    sentence = 'Текст основной части работы с <strong>выделением</strong> и <em>курсивом</em>. '
+    chunks = []
+    for page in range(pages):
+        chunks.append(f'<h2>Раздел {page + 1}</h2>')
+        for _ in range(4):
+            chunks.append(f'<p style="text-indent: 1.25cm">{sentence * 5}</p>')
+        chunks.append('<ul><li>Первый пункт</li><li>Второй пункт</li></ul>')
+        chunks.append('<table><tr><td>Параметр</td><td>Значение</td></tr><tr><td>A</td><td>1</td></tr></table>')
+        chunks.append(image_tag * images_per_page)
+    return ''.join(chunks)
+
+
+def make_sample_document(pages, images_per_page=0):
+    """Создает несохраненный Document_main с синтетическим содержимым."""
+    return Document_main(
+        work_type='MAG_DIPLOMA',
+        title='Исследование производительности экспорта',
+        student_name='Иванов И.И.',
+        supervisor='Петров П.П.',
+        data=make_sample_html(pages, images_per_page),
+        references_doi='',
+    )
+
+
+def summarize_body(docx_document):
+    """
+    Структура тела документа для сравнения путей преобразования: непустые
+    абзацы (стиль, текст, число изображений) и таблицы (тексты ячеек).
+    Пустые абзацы не учитываются, неразрывные пробелы приравниваются к обычным.
+    """
+    from docx.oxml.ns import qn
+
+    def text_of(element):
+        text = ''.join(t.text or '' for t in element.iter(qn('w:t')))
+        return re.sub(r'\s+', ' ', text.replace('\u00A0', ' ')).strip()
+
+    summary = []
+    for element in docx_document.element.body:
+        if element.tag == qn('w:p'):
+            style = element.find(f"{qn('w:pPr')}/{qn('w:pStyle')}")
+            drawings = len(element.findall(f".//{qn('w:drawing')}"))
+            text = text_of(element)
+            if text or drawings:
+                summary.append(f"p [{style.get(qn('w:val')) if style is not None else ''}] {text!r} {drawings}")
+        elif element.tag == qn('w:tbl'):
+            cells = [text_of(tc) for tc in element.iter(qn('w:tc'))]
+            drawings = len(element.findall(f".//{qn('w:drawing')}"))
+            summary.append(f"tbl {len(element.findall(qn('w:tr')))} {cells!r} {drawings}")
+    return summary
+
+
+def measure(func, repeat, setup=None):
+    """
+    Выполняет func repeat раз и возвращает среднее время (с) и пиковый объем
+    памяти Python-кучи по tracemalloc (байты). Время и память снимаются в
+    отдельных прогонах, чтобы трассировка не искажала замер времени. Память,
+    выделенная внутри libxml2, tracemalloc не видит. Если задан setup, его
+    результат передается в func, а сам setup в замер не входит.
+    """
+    def call(trace):
+        args = (setup(),) if setup else ()
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - started
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return elapsed, peak
+
+    call(trace=False)  # прогрев
+    timings = [call(trace=False)[0] for _ in range(repeat)]
+    peak = call(trace=True)[1]
+    return sum(timings) / repeat, peak
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время и память этапов экспорта DOCX на синтетическом документе'
+
+    scenarios = ('compose', 'parse', 'emitter', 'conformance', 'formatting', 'merge', 'fields', 'sections', 'queries', 'batch', 'pdf', 'fast_pdf', 'prototype', 'title')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=self.scenarios)
+        parser.add_argument('--pages', type=int, default=120)
+        parser.add_argument('--images-per-page', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--images', type=int, nargs='+', default=[250, 500, 1000, 2000])
+        parser.add_argument('--fields', type=int, nargs='+', default=[100, 200, 400])
+        parser.add_argument('--documents', type=int, default=500)
+
+    def handle(self, *args, **options):
+        document = make_sample_document(options['pages'], options['images_per_page'])
+        handler = getattr(self, f"bench_{options['scenario']}")
+        results = handler(document, options)
+        for name, (seconds, peak) in results:
+            self.stdout.write(f"{name:<24} {seconds * 1000:10.1f} мс {peak / 1024 / 1024:10.1f} МБ")
+
+    def bench_compose(self, document, options):
+        """Сборка титульного листа и основной части: прежний режим и однопроходный."""
+        from docx import Document
+        from documents.services.docx_templates import render_template, template_cache
+        from documents.views.export import build_body_document, compose_export_document
+
+        body_io = io.BytesIO()
+        build_body_document(document).save(body_io)
+        body_bytes = body_io.getvalue()
+
+        def setup():
+            doc_title = render_template(template_cache.get_template('magitr_dissertation'), {'TITLE': document.title.upper()})
+            return doc_title, Document(io.BytesIO(body_bytes))
+
+        def run(single_pass):
+            def compose(prepared):
+                doc_title, doc_body = prepared
+                doc_title = compose_export_document(doc_title, doc_body, single_pass=single_pass)
+                doc_title.save(io.BytesIO())
+            return compose
+
+        return [
+            ('legacy (3 сохранения)', measure(run(False), options['repeat'], setup)),
+            ('single-pass', measure(run(True), options['repeat'], setup)),
+        ]
+
+    def bench_parse(self, document, options):
+        """Разбор HTML: только фронтенд (lxml + сбор метаданных) и полное преобразование в DOCX."""
+        from docx import Document
+        from documents.services.html_frontend import parse_html
+        from documents.views.export import process_html_to_docx
+
+        html = document.data
+        self.stdout.write(f"HTML: {len(html) / 1024 / 1024:.1f} МБ")
+
+        def frontend():
+            parsed = parse_html(html)
+            for _ in parsed.segments(set(range(len(parsed.images))), str):
+                pass
+
+        return [
+            ('frontend', measure(frontend, options['repeat'])),
+            ('process_html_to_docx', measure(lambda: process_html_to_docx(html, Document()), options['repeat'])),
+        ]
+
+    def bench_emitter(self, document, options):
+        """
+        Преобразование HTML в DOCX: htmldocx и собственный эмиттер OOXML.
+        Замеряются сам вывод элементов (разбор + эмиттер) и весь
+        process_html_to_docx; пропускная способность — в абзацах в секунду.
+        """
+        from docx import Document
+        from docx.oxml.ns import qn
+        from documents.services.html_frontend import parse_html
+        from documents.services.ooxml_emitter import OoxmlEmitter
+        from documents.views.export import add_segments_with_htmldocx, image_placeholder_text, process_html_to_docx
+
+        html = document.data
+        sample = Document()
+        process_html_to_docx(html, sample, emitter='native')
+        paragraphs = len(sample.element.body.findall(f".//{qn('w:p')}"))
+        self.stdout.write(f"HTML: {len(html) / 1024 / 1024:.1f} МБ, абзацев: {paragraphs}")
+
+        def emit_htmldocx():
+            add_segments_with_htmldocx(parse_html(html), {}, Document())
+
+        def emit_native():
+            OoxmlEmitter(Document(), {}, image_placeholder_text).emit(parse_html(html))
+
+        repeat = options['repeat']
+        results = [
+            ('emit: htmldocx', measure(emit_htmldocx, repeat)),
+            ('emit: native', measure(emit_native, repeat)),
+            ('process: htmldocx', measure(lambda: process_html_to_docx(html, Document(), emitter='htmldocx'), repeat)),
+            ('process: native', measure(lambda: process_html_to_docx(html, Document(), emitter='native'), repeat)),
+        ]
+        for name, (seconds, _) in results:
+            self.stdout.write(f"{name:<24} {paragraphs / seconds:10.0f} абзацев/с")
+        return results
+
+    def bench_conformance(self, document, options):
+        """
+        Сравнивает результат собственного эмиттера с htmldocx на образцах
+        из html_corpus: тексты и стили абзацев, таблицы и изображения.
+        Ожидаемые расхождения — ошибки htmldocx: строки вложенных таблиц
+        попадают во внешнюю, текст div/blockquote дописывается к предыдущему
+        абзацу, изображения из ячеек выносятся за таблицу.
+        """
+        from docx import Document
+        from documents.views.export import ensure_basic_styles, process_html_to_docx
+
+        mismatches = 0
+        for name in sorted(os.listdir(CORPUS_DIR)):
+            if not name.endswith('.html'):
+                continue
+            with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+                html = f.read()
+
+            summaries = {}
+            for emitter in ('htmldocx', 'native'):
+                docx_document = Document()
+                ensure_basic_styles(docx_document)
+                process_html_to_docx(html, docx_document, emitter=emitter)
+                summaries[emitter] = summarize_body(docx_document)
+
+            diff = list(difflib.unified_diff(summaries['htmldocx'], summaries['native'], lineterm='', n=0))
+            if diff:
+                mismatches += 1
+                self.stdout.write(f"{name}: расхождения")
+                for line in diff[2:]:
+                    self.stdout.write(f"    {line[:200]}")
+            else:
+                self.stdout.write(f"{name}: совпадает ({len(summaries['native'])} элементов)")
+
+        self.stdout.write(f"Файлов с расхождениями: {mismatches}")
+        return []
+
+    def bench_formatting(self, document, options):
+        """
+        Оформление собранного документа по ГОСТ: прежнее прямое форматирование
+        каждого абзаца и прогона против оформления через стили. Замеряются само
+        оформление, сохранение DOCX, размеры document.xml и styles.xml и (если
+        доступен конвертер) время получения PDF.
+        """
+        from docx import Document
+        from documents.services.docx_templates import render_template, template_cache
+        from documents.views.export import (
+            PdfConversionError, apply_formatting_to_paragraphs, build_body_document,
+            compose_export_document, convert_docx_to_pdf,
+        )
+
+        body_io = io.BytesIO()
+        build_body_document(document).save(body_io)
+        body_bytes = body_io.getvalue()
+
+        def setup():
+            doc_title = render_template(template_cache.get_template('magitr_dissertation'), {'TITLE': document.title.upper()})
+            return compose_export_document(doc_title, Document(io.BytesIO(body_bytes)))
+
+        def formatted(style_driven):
+            def prepare():
+                doc = setup()
+                apply_formatting_to_paragraphs(doc, style_driven=style_driven)
+                return doc
+            return prepare
+
+        def save(doc):
+            output = io.BytesIO()
+            doc.save(output)
+            return output.getvalue()
+
+        repeat = options['repeat']
+        results = []
+        for label, style_driven in (('direct', False), ('styles', True)):
+            results.append((f"format: {label}", measure(
+                lambda doc, style_driven=style_driven: apply_formatting_to_paragraphs(doc, style_driven=style_driven),
+                repeat, setup,
+            )))
+            results.append((f"save: {label}", measure(save, repeat, formatted(style_driven))))
+
+            content = save(formatted(style_driven)())
+            with zipfile.ZipFile(io.BytesIO(content)) as package:
+                document_xml = package.getinfo('word/document.xml').file_size
+                styles_xml = package.getinfo('word/styles.xml').file_size
+            self.stdout.write(
+                f"{label}: document.xml {document_xml / 1024:.0f} КБ, styles.xml {styles_xml / 1024:.0f} КБ, "
+                f"DOCX {len(content) / 1024:.0f} КБ"
+            )
+            try:
+                started = time.perf_counter()
+                convert_docx_to_pdf(content)
+                self.stdout.write(f"{label}: PDF {(time.perf_counter() - started) * 1000:.0f} мс")
+            except PdfConversionError as e:
+                self.stdout.write(f"{label}: PDF недоступен ({e})")
+        return results
+
+    def bench_merge(self, document, options):
+        """
+        Сборка документа из четырех фрагментов с изображениями (DocxComposer).
+        Изображения повторяются: уникальных вдвое меньше, чем вставок, и
+        в итоговом документе должна остаться одна часть на каждое уникальное.
+        Размеры задаются через --images; время на изображение при линейном
+        росте должно оставаться примерно постоянным.
+        """
+        from docx import Document
+        from docx.shared import Cm
+        from PIL import Image
+        from documents.services.docx_composer import compose_documents
+
+        def make_png(index):
+            buffer = io.BytesIO()
+            Image.new('RGB', (4, 4), (index % 256, index // 256 % 256, 128)).save(buffer, 'PNG')
+            return buffer.getvalue()
+
+        results = []
+        for count in options['images']:
+            blobs = [make_png(index) for index in range(count // 2)]
+
+            def setup(count=count, blobs=blobs):
+                fragments = []
+                for part_no in range(4):
+                    fragment = Document()
+                    for index in range(part_no * count // 4, (part_no + 1) * count // 4):
+                        fragment.add_paragraph(f"Рисунок {index + 1}")
+                        fragment.add_picture(io.BytesIO(blobs[index % len(blobs)]), width=Cm(1))
+                    fragments.append(fragment)
+                return fragments
+
+            def merge(fragments):
+                compose_documents(Document(), fragments, move=True)
+
+            seconds, peak = measure(merge, options['repeat'], setup)
+            results.append((f"merge: {count} изобр.", (seconds, peak)))
+
+            merged = compose_documents(Document(), setup(), move=True)
+            rels = merged.part.rels
+            embeds = merged.element.body.xpath('.//a:blip/@r:embed')
+            self.stdout.write(
+                f"{count} изобр.: {seconds / count * 1e6:.0f} мкс на изображение, "
+                f"частей {len(merged.part.package.image_parts)} из {len(blobs)} уникальных, "
+                f"ссылок без связи {sum(1 for rId in embeds if rId not in rels)}"
+            )
+        return results
+
+    def bench_fields(self, document, options):
+        """
+        Замена полей в шаблоне (replace_document_fields) для разного числа полей.
+        В шаблоне поля разбиты на несколько прогонов с разным форматированием,
+        есть абзацы без полей, таблица и колонтитулы. После замены проверяется,
+        что полей не осталось, а число прогонов и их форматирование не изменились.
+        """
+        from docx import Document
+        from documents.views.export import replace_document_fields
+
+        def make_template(count):
+            template = Document()
+            section = template.sections[0]
+            section.header.add_paragraph('{{FIELD_0}}')
+            section.footer.add_paragraph('Страница {{FIELD_1}}')
+            for index in range(count):
+                paragraph = template.add_paragraph('Поле: ')
+                paragraph.add_run(f"{{{{FIELD_{index}")
+                paragraph.add_run('}} и текст после поля').bold = True
+                template.add_paragraph(f"Текст без полей {index} " * 5)
+            table = template.add_table(rows=count // 4, cols=2)
+            for index, row in enumerate(table.rows):
+                row.cells[0].text = f"{{{{FIELD_{index}}}}}"
+            return template
+
+        def run_formats(template):
+            return [(run.text != '', run.bold) for paragraph in template.paragraphs for run in paragraph.runs]
+
+        results = []
+        for count in options['fields']:
+            replacements = {f"{{{{FIELD_{index}}}}}": f"Значение {index}" for index in range(count)}
+            results.append((f"fields: {count}", measure(
+                lambda template: replace_document_fields(template, replacements),
+                options['repeat'], lambda count=count: make_template(count),
+            )))
+
+            template = make_template(count)
+            runs_before = run_formats(template)
+            replaced = replace_document_fields(template, replacements)
+            section = template.sections[0]
+            texts = [p.text for p in template.paragraphs + section.header.paragraphs + section.footer.paragraphs]
+            texts += [cell.text for row in template.tables[0].rows for cell in row.cells]
+            self.stdout.write(
+                f"{count} полей: заменено {replaced}, осталось {sum(text.count('{{') for text in texts)}, "
+                f"прогоны сохранены: {'да' if run_formats(template) == runs_before else 'нет'}"
+            )
+        return results
+
+    def bench_sections(self, document, options):
+        """
+        Основная часть по разделам с кэшем фрагментов (один раздел — одна
+        «страница» с заголовком h2): без кэша, с пустым кэшем, с заполненным
+        кэшем и после правки одного слова в одном разделе. Кэш фрагментов
+        размещается во временном каталоге.
+        """
+        import tempfile
+        from django.test import override_settings
+        from documents.services.fragment_cache import fragment_cache
+        from documents.views.export import build_body_document
+
+        pages = options['pages']
+        edited = make_sample_document(pages, options['images_per_page'])
+        marker = 'Текст основной части'
+        position = edited.data.index(marker, edited.data.index(f'Раздел {pages // 2 + 1}<'))
+        edited.data = edited.data[:position] + 'Исправленный текст' + edited.data[position + len(marker):]
+
+        def run(document_obj):
+            before = fragment_cache.stats()
+            started = time.perf_counter()
+            build_body_document(document_obj)
+            elapsed = time.perf_counter() - started
+            after = fragment_cache.stats()
+            return elapsed, after['hits'] - before['hits'], after['misses'] - before['misses']
+
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(EXPORT_FRAGMENT_CACHE=False):
+                started = time.perf_counter()
+                build_body_document(document)
+                results.append(('без кэша фрагментов', (time.perf_counter() - started, 0)))
+
+            with override_settings(EXPORT_FRAGMENT_CACHE_DIR=directory):
+                for name, document_obj in (('пустой кэш', document), ('заполненный кэш', document),
+                                           ('правка одного раздела', edited)):
+                    elapsed, hits, misses = run(document_obj)
+                    self.stdout.write(f"{name}: из кэша {hits}, преобразовано {misses}")
+                    results.append((name, (elapsed, 0)))
+        return results
+
+    def bench_queries(self, document, options):
+        """
+        Число запросов к БД при экспорте DOCX документов Main, ГОСТ и СТО:
+        загрузка через адаптер и рендеринг, для документа с 2 и с 20 частями
+        каждого вида (разделы, источники, приложения и т. д.). Данные создаются
+        в транзакции, которая затем откатывается. Если число запросов зависит
+        от размера документа, команда завершается ошибкой.
+        """
+        from django.contrib.auth.models import User
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+        from documents.models import gost, sto
+        from documents.services.export_adapters import get_export_adapter
+        from documents.views.export import render_docx
+
+        def create_main(user, count):
+            return Document_main.objects.create(
+                owner=user, work_type='COURSE', title='Документ Main', supervisor='Петров П.П.',
+                student_name='Иванов И.И.', data=make_sample_html(count), references_doi='',
+            )
+
+        def create_gost(user, count):
+            doc = gost.Document.objects.create(user=user, title='Отчет ГОСТ', template_type='gost')
+            gost.TitlePage.objects.create(document=doc, department='Кафедра', head_full_name='Петров П.П.')
+            gost.Abstract.objects.create(document=doc, content='<p>Реферат</p>')
+            for i in range(count):
+                gost.Performer.objects.create(document=doc, full_name=f'Исполнитель {i}', position='Инженер', degree='')
+                gost.Term.objects.create(document=doc, term=f'Термин {i}', definition='Определение')
+                gost.Abbreviation.objects.create(document=doc, abbreviation=f'С{i}', meaning='Сокращение')
+                gost.Reference.objects.create(document=doc, citation=f'Источник {i}', order=i)
+                gost.Appendix.objects.create(document=doc, label=str(i), title='Приложение',
+                                             content='<p>Текст</p>', order=i)
+            return doc
+
+        def create_sto(user, count):
+            doc = sto.Document_sto.objects.create(work_type='COURSE', title='Документ СТО',
+                                                  supervisor='Петров П.П.', student_name='Иванов И.И.')
+            sto.Abstract_sto.objects.create(
+                document=doc, page_count=1, illustrations_count=0, tables_count=0, formulas_count=0,
+                appendices_count=count, references_count=count, graphic_sheets=0,
+                keywords='экспорт', text='<p>Реферат</p>',
+            )
+            for i in range(count):
+                sto.Section.objects.create(document=doc, type='MAIN', order=i, title=f'Раздел {i}',
+                                           content='<p>Текст раздела</p>')
+                sto.BibliographyEntry.objects.create(document=doc, order=i, entry_text=f'Источник {i}')
+                sto.Appendix_sto.objects.create(document=doc, label=str(i), title='Приложение', content='Текст')
+            return doc
+
+        factories = (('main', create_main), ('gost', create_gost), ('sto', create_sto))
+        results = []
+        mismatched = []
+        with transaction.atomic():
+            user = User.objects.create(username='benchmark-export-queries')
+            for kind, create in factories:
+                adapter = get_export_adapter(kind)
+                counts = []
+                for size in (2, 20):
+                    pk = create(user, size).pk
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        render_docx(adapter.get_queryset(user).get(pk=pk))
+                        elapsed = time.perf_counter() - started
+                    counts.append(len(queries.captured_queries))
+                    results.append((f'{kind}, частей: {size}', (elapsed, 0)))
+                self.stdout.write(f"{adapter.label}: запросов {counts[0]} и {counts[1]}")
+                if counts[0] != counts[1]:
+                    mismatched.append(adapter.label)
+            transaction.set_rollback(True)
+
+        if mismatched:
+            raise CommandError(f"Число запросов зависит от размера документа: {', '.join(mismatched)}")
+        return results
+
+    def bench_batch(self, document, options):
+        """
+        Пакетный экспорт --documents документов Main (по 2 «страницы») в
+        потоковый ZIP через пул экспорта: общее время, пиковая память
+        Python-кучи потребителя потока и наибольшая часть потока. Документы
+        создаются в БД (воркеры пула не видят незафиксированных транзакций)
+        и удаляются после замера; к пакету добавляется несуществующий ID,
+        чтобы проверить запись ошибки в manifest.json.
+        """
+        import json
+        import tempfile
+        import uuid
+        from django.contrib.auth.models import User
+        from documents.services.batch_export import MANIFEST_NAME, stream_batch_zip
+        from documents.services.export_jobs import export_pool
+
+        count = options['documents']
+        # Уникальная метка, чтобы файлы не брались из кэша экспорта прошлых прогонов
+        marker = uuid.uuid4().hex[:8]
+        user = User.objects.create(username=f'benchmark-batch-{marker}')
+        try:
+            html = make_sample_html(2)
+            Document_main.objects.bulk_create(
+                Document_main(owner=user, work_type='COURSE', title=f'Работа {i} {marker}',
+                              supervisor='Петров П.П.', student_name=f'Студент {i}', data=html, references_doi='')
+                for i in range(count)
+            )
+            pks = list(Document_main.objects.filter(owner=user).values_list('pk', flat=True))
+            missing = max(pks) + 1000
+
+            with tempfile.TemporaryFile() as output:
+                largest = 0
+                tracemalloc.start()
+                started = time.perf_counter()
+                for chunk in stream_batch_zip(pks + [missing], 'docx'):
+                    largest = max(largest, len(chunk))
+                    output.write(chunk)
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+                size = output.tell()
+                output.seek(0)
+                with zipfile.ZipFile(output) as archive:
+                    manifest = json.loads(archive.read(MANIFEST_NAME))
+                    entries = len(archive.namelist()) - 1
+            self.stdout.write(
+                f"воркеров {export_pool.max_workers}; архив {size / 1024 / 1024:.1f} МБ, файлов {entries}, "
+                f"с ошибками {manifest['failed']}; наибольшая часть потока {largest / 1024:.0f} КБ"
+            )
+        finally:
+            user.delete()
+        return [(f'ZIP, документов: {count}', (elapsed, peak))]
+
+    def bench_pdf(self, document, options):
+        """
+        Пропускная способность пула LibreOffice: 8 одновременных конвертаций
+        одного DOCX при размере пула 1, 2 и 4. Первая конвертация каждого
+        пула (запуск процессов) в замер не входит.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from django.test import override_settings
+        from documents.services.pdf_backends import LibreOfficePool
+        from documents.views.export import build_body_document
+
+        if not LibreOfficePool.available():
+            raise CommandError("soffice не найден: установите LibreOffice или задайте EXPORT_PDF_SOFFICE")
+
+        body_io = io.BytesIO()
+        build_body_document(document).save(body_io)
+        docx_content = body_io.getvalue()
+        conversions = 8
+
+        results = []
+        for size in (1, 2, 4):
+            with override_settings(EXPORT_PDF_WORKERS=size, EXPORT_PDF_QUEUE_DEPTH=conversions):
+                pool = LibreOfficePool()
+                try:
+                    with ThreadPoolExecutor(size) as executor:
+                        list(executor.map(lambda _: pool.convert(docx_content), range(size)))  # прогрев
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(conversions) as executor:
+                        list(executor.map(lambda _: pool.convert(docx_content), range(conversions)))
+                    elapsed = time.perf_counter() - started
+                finally:
+                    pool.shutdown()
+            self.stdout.write(f"пул {size}: {conversions / elapsed:.2f} документа/с")
+            results.append((f'пул {size}, {conversions} конв.', (elapsed, 0)))
+        return results
+
+    def bench_fast_pdf(self, document, options):
+        """
+        Быстрый PDF из HTML (engine=fast) против пути через DOCX: сборка DOCX
+        и, если бэкенд PDF доступен, его конвертация. Память конвертера
+        (отдельный процесс LibreOffice или Word) в замер не входит.
+        """
+        from documents.services.pdf_backends import PdfBackendError, get_pdf_backend
+        from documents.views.export import render_docx, render_fast_pdf
+
+        results = [
+            ('быстрый PDF', measure(lambda: render_fast_pdf(document), options['repeat'])),
+            ('DOCX', measure(lambda: render_docx(document), options['repeat'])),
+        ]
+        backend = get_pdf_backend()
+        try:
+            results.append((
+                f'DOCX + {backend.name}',
+                measure(lambda: backend.convert(render_docx(document)), options['repeat']),
+            ))
+        except PdfBackendError as e:
+            self.stdout.write(f"Конвертация DOCX в PDF не замеряется: {e}")
+        return results
+
+    def bench_prototype(self, document, options):
+        """
+        Подготовка пустой основной части: новый Document() с настройкой стилей
+        на каждый экспорт против копии прототипа профиля оформления.
+        """
+        from docx import Document
+        from documents.services.body_prototypes import body_prototypes
+        from documents.views.export import apply_document_formatting, ensure_basic_styles
+
+        standart = 'ГОСТ 7.32-2017'
+        repeat = options['repeat'] * 10
+
+        def fresh():
+            doc_body = Document()
+            ensure_basic_styles(doc_body)
+            apply_document_formatting(doc_body, standart)
+
+        body_prototypes.get_raw(standart)
+        return [
+            ('Document() + стили', measure(fresh, repeat)),
+            ('копия прототипа', measure(lambda: body_prototypes.get_document(standart), repeat)),
+        ]
+
+    def bench_title(self, document, options):
+        """
+        Титульный лист: рендеринг шаблона через DocxTemplate против копии
+        отрендеренного листа из кэша фрагментов (метаданные не менялись).
+        """
+        from django.test import override_settings
+        from documents.views.export import render_title_page
+
+        repeat = options['repeat'] * 10
+        with override_settings(EXPORT_FRAGMENT_CACHE=False):
+            rendered = measure(lambda: render_title_page(document), repeat)
+        render_title_page(document)
+        return [
+            ('DocxTemplate.render', rendered),
+            ('из кэша', measure(lambda: render_title_page(document), repeat)),
+        ]
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from documents.services.export_jobs import cleanup_export_jobs, fail_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Помечает прерванные задачи экспорта и удаляет устаревшие задачи вместе с файлами'
+
+    def handle(self, *args, **options):
+        failed = fail_stale_jobs()
+        deleted = cleanup_export_jobs()
+        self.stdout.write(f"Прервано задач: {failed}, удалено задач: {deleted}")
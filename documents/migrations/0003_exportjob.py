@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:39
+
+import django.db.models.deletion
+import documents.models.export
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_document_main_references_doi'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('docx', 'DOCX'), ('pdf', 'PDF')], max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('export_key', models.CharField(blank=True, max_length=64, verbose_name='Ключ экспорта')),
+                ('file', models.FileField(blank=True, storage=documents.models.export.export_job_storage, upload_to='%Y/%m/%d', verbose_name='Файл')),
+                ('filename', models.CharField(blank=True, max_length=255, verbose_name='Имя файла')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='documents.document_main')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Задача экспорта',
+                'verbose_name_plural': 'Задачи экспорта',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
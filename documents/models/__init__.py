@@ -1,3 +1,4 @@
 from .gost import *
 from .sto import *
-from .main import *
\ No newline at end of file
+from .main import *
+from .export import *
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.contrib.auth.models import User
+
+from .main import Document_main
+
+
+def export_job_storage():
+    """Хранилище готовых файлов фоновых экспортов (вне MEDIA_ROOT, не раздается напрямую)."""
+    return FileSystemStorage(location=getattr(settings, 'EXPORT_JOBS_DIR', settings.BASE_DIR / 'export_jobs'))
+
+
+class ExportJob(models.Model):
+    """Фоновая задача экспорта документа в DOCX или PDF."""
+    FORMATS = [
+        ('docx', 'DOCX'),
+        ('pdf', 'PDF'),
+    ]
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    owner       = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    document    = models.ForeignKey(Document_main, on_delete=models.CASCADE, related_name='export_jobs')
+    format      = models.CharField('Формат', max_length=10, choices=FORMATS)
+    status      = models.CharField('Статус', max_length=10, choices=STATUSES, default=STATUS_PENDING)
+    export_key  = models.CharField('Ключ экспорта', max_length=64, blank=True)
+    file        = models.FileField('Файл', storage=export_job_storage, upload_to='%Y/%m/%d', blank=True)
+    filename    = models.CharField('Имя файла', max_length=255, blank=True)
+    error       = models.TextField('Ошибка', blank=True)
+
+    created_at  = models.DateTimeField(auto_now_add=True)
+    started_at  = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Задача экспорта'
+        verbose_name_plural = 'Задачи экспорта'
+
+    def __str__(self):
+        return f"Экспорт {self.document_id} в {self.format} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
@@ -0,0 +1,168 @@
+import json
+import logging
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.db import close_old_connections
+
+from documents.services.export_jobs import export_pool
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# Фильтры пакетного экспорта: параметр запроса -> поле модели
+BATCH_FILTERS = {
+    'work_type': 'work_type',
+    'year': 'year',
+    'department': 'department_name',
+}
+
+
+def filter_batch_queryset(queryset, params):
+    """
+    Применяет фильтры пакетного экспорта (вид работы, год, кафедра).
+
+    Args:
+        queryset (QuerySet): Исходный набор документов
+        params (dict): Параметры запроса; пустые значения игнорируются
+
+    Returns:
+        QuerySet: Отфильтрованный набор документов
+    """
+    filters = {
+        field: params[name]
+        for name, field in BATCH_FILTERS.items()
+        if params.get(name)
+    }
+    return queryset.filter(**filters)
+
+
+def render_batch_entry(kind, pk, export_format):
+    """
+    Строит файл одного документа пакета в воркере пула.
+
+    Ошибки возвращаются в результате, а не выбрасываются: исключение из
+    процесса пула может не сериализоваться, а пакет должен продолжиться.
+
+    Returns:
+        dict: filename и content, либо error; warning при замене PDF на DOCX
+    """
+    from documents.services.export_adapters import get_export_adapter
+    from documents.views.export import PdfConversionError, export_document, get_export_filename
+
+    close_old_connections()
+    try:
+        document = get_export_adapter(kind).get_queryset().get(pk=pk)
+        extension = export_format
+        warning = ''
+        try:
+            content, _ = export_document(document, export_format)
+        except PdfConversionError as pdf_error:
+            # Как и одиночный экспорт, при недоступной конвертации отдаем DOCX
+            warning = str(pdf_error)
+            extension = 'docx'
+            content, _ = export_document(document, extension)
+        return {
+            'title': document.title,
+            'filename': get_export_filename(document, extension),
+            'content': content,
+            'warning': warning,
+        }
+    except Exception as e:
+        logger.error(f"Ошибка пакетного экспорта документа {pk}: {e}", exc_info=True)
+        return {'error': f"{type(e).__name__}: {e}"}
+    finally:
+        close_old_connections()
+
+
+class _StreamBuffer:
+    """
+    Файлоподобный объект без seek для zipfile: записанные байты копятся до
+    следующего pop. ZipFile на таком потоке пишет размеры записей в
+    дескрипторах данных, поэтому архив не нужно держать целиком.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_batch_zip(pks, export_format, kind='main', window=None):
+    """
+    Генератор ZIP-архива с файлами документов в порядке готовности.
+
+    Документы рендерятся в пуле экспорта (export_pool). В работе одновременно
+    не больше window документов, и каждый готовый файл сразу уходит клиенту,
+    поэтому память не растет с размером пакета. В конце архива — manifest.json
+    со статусом и ошибкой по каждому документу.
+
+    Args:
+        pks (list): ID документов
+        export_format (str): Формат файлов ('docx', 'pdf')
+        kind (str): Тип документов ('main', 'gost', 'sto')
+        window (int): Число документов в работе; по умолчанию вдвое больше воркеров
+
+    Yields:
+        bytes: Очередная часть ZIP-архива
+    """
+    window = window or export_pool.max_workers * 2
+    remaining = iter(pks)
+    pending = {}
+    manifest = []
+    buffer = _StreamBuffer()
+
+    def fill():
+        while len(pending) < window:
+            pk = next(remaining, None)
+            if pk is None:
+                return
+            pending[export_pool.submit_call(render_batch_entry, kind, pk, export_format)] = pk
+
+    # Файлы DOCX и PDF уже сжаты, поэтому записи архива не сжимаются
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        try:
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Сбой самого воркера (например, поврежденный пул процессов)
+                        result = {'error': f"{type(e).__name__}: {e}"}
+
+                    entry = {'id': pk, 'title': result.get('title', ''), 'file': None, 'error': result.get('error', '')}
+                    if not entry['error']:
+                        entry['file'] = f"{pk}_{result['filename']}"
+                        entry['warning'] = result['warning']
+                        archive.writestr(entry['file'], result['content'])
+                    manifest.append(entry)
+                    yield buffer.pop()
+                fill()
+
+            failed = sum(1 for entry in manifest if entry['error'])
+            logger.info(f"Пакетный экспорт завершен: документов {len(manifest)}, с ошибками {failed}")
+            archive.writestr(MANIFEST_NAME, json.dumps({
+                'format': export_format,
+                'total': len(manifest),
+                'failed': failed,
+                'documents': manifest,
+            }, ensure_ascii=False, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+        finally:
+            # Клиент мог оборвать загрузку: не рендерим оставшиеся документы впустую
+            for future in pending:
+                future.cancel()
+    yield buffer.pop()
@@ -0,0 +1,110 @@
+import io
+import logging
+import threading
+
+from docx import Document
+
+logger = logging.getLogger(__name__)
+
+# Профили оформления основной части: признак в названии стандарта -> профиль.
+# Стандарт Document_main — произвольный текст, поэтому прототипы строятся
+# только для известных профилей, а остальные стандарты получают профиль по умолчанию
+PROFILE_MARKERS = (
+    ('7.32', 'gost_7_32'),
+    ('2.105', 'gost_2_105'),
+    ('4.2', 'sto_4_2'),
+)
+DEFAULT_PROFILE = 'default'
+
+
+def get_profile(standart):
+    """
+    Возвращает профиль оформления по названию стандарта.
+
+    Args:
+        standart (str): Стандарт оформления (например, "ГОСТ 7.32-2017") или None
+
+    Returns:
+        str: Название профиля
+    """
+    for marker, profile in PROFILE_MARKERS:
+        if standart and marker in standart:
+            return profile
+    return DEFAULT_PROFILE
+
+
+class BodyPrototypeCache:
+    """
+    Процессный кэш прототипов основной части.
+
+    Прототип — пустой документ со стилями и полями по ГОСТ и стандарту. Он
+    строится один раз на профиль оформления и хранится как байты DOCX-пакета,
+    а каждый экспорт получает собственный документ, разобранный из этих байтов.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _build(self, standart):
+        from documents.views.export import apply_document_formatting, ensure_basic_styles
+
+        document = Document()
+        ensure_basic_styles(document)
+        if standart:
+            apply_document_formatting(document, standart)
+        output = io.BytesIO()
+        document.save(output)
+        return output.getvalue()
+
+    def get_raw(self, standart):
+        """Возвращает байты прототипа для профиля стандарта, строя его при первом обращении."""
+        profile = get_profile(standart)
+        raw = self._entries.get(profile)
+        if raw is not None:
+            with self._lock:
+                self.hits += 1
+            return raw
+
+        with self._lock:
+            # Другой поток мог уже построить прототип, пока мы ждали блокировку
+            raw = self._entries.get(profile)
+            if raw is None:
+                raw = self._build(standart)
+                self._entries[profile] = raw
+                self.misses += 1
+                logger.info(f"Построен прототип основной части: {profile} ({len(raw)} байт)")
+            else:
+                self.hits += 1
+            return raw
+
+    def get_document(self, standart):
+        """
+        Возвращает новый документ основной части для стандарта.
+
+        Args:
+            standart (str): Стандарт оформления или None
+
+        Returns:
+            Document: Независимая копия прототипа
+        """
+        return Document(io.BytesIO(self.get_raw(standart)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Возвращает счётчики попаданий и промахов кэша."""
+        return {
+            'profiles': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+body_prototypes = BodyPrototypeCache()
@@ -0,0 +1,527 @@
+import copy
+import hashlib
+import logging
+import posixpath
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part, XmlPart
+from docx.oxml.ns import nsdecls, nsmap, qn
+from docx.oxml.parser import parse_xml
+from docx.parts.image import ImagePart
+from docx.parts.numbering import NumberingPart
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+_NAMESPACES = {'w': nsmap['w'], 'r': nsmap['r']}
+
+# Запросы компилируются один раз: по ним находятся ссылки на стили,
+# нумерацию, сноски и связи (r:embed, r:link, r:id и т.п.) во фрагментах
+_STYLE_REFS = etree.XPath('.//w:pStyle | .//w:rStyle | .//w:tblStyle', namespaces=_NAMESPACES)
+_STYLE_CHAIN = etree.XPath('./w:basedOn | ./w:link | ./w:next', namespaces=_NAMESPACES)
+_NUM_IDS = etree.XPath('.//w:numPr/w:numId', namespaces=_NAMESPACES)
+_REL_ATTRS = etree.XPath(f".//@*[namespace-uri()='{nsmap['r']}']")
+
+# Сноски и концевые сноски: тип связи, тип содержимого, имя части и теги
+NOTE_KINDS = {
+    'footnote': (RT.FOOTNOTES, CT.WML_FOOTNOTES, '/word/footnotes.xml'),
+    'endnote': (RT.ENDNOTES, CT.WML_ENDNOTES, '/word/endnotes.xml'),
+}
+_NOTE_REFS = {
+    kind: etree.XPath(f'.//w:{kind}Reference', namespaces=_NAMESPACES)
+    for kind in NOTE_KINDS
+}
+
+STYLE_TYPES = ('paragraph', 'character', 'table', 'numbering')
+
+# Общие части документа: ссылка на такую часть фрагмента переводится на часть
+# приемника с тем же именем. Остальные части (диаграммы, внедренные объекты,
+# колонтитулы) у каждого фрагмента свои и копируются
+SHARED_RELTYPES = frozenset({
+    RT.STYLES, RT.NUMBERING, RT.SETTINGS, RT.WEB_SETTINGS, RT.THEME, RT.FONT_TABLE,
+})
+
+
+def _related_part(part, reltype):
+    """Часть, связанная с part связью reltype, или None."""
+    try:
+        return part.part_related_by(reltype)
+    except KeyError:
+        return None
+
+
+def _max_int(values, default=0):
+    numbers = [int(value) for value in values if value is not None and value.lstrip('-').isdigit()]
+    return max(numbers, default=default)
+
+
+class _Relations:
+    """
+    Индекс связей одной части приемника: существующие цели и следующий
+    свободный rId. Связи python-docx ищутся перебором, что при тысячах
+    изображений делает сборку квадратичной.
+    """
+
+    def __init__(self, part):
+        self.part = part
+        self.rels = part.rels
+        self.targets = {}
+        for rId, rel in self.rels.items():
+            key = (rel.reltype, rel.target_ref if rel.is_external else id(rel.target_part))
+            self.targets.setdefault(key, rId)
+        self.next_number = _max_int(rId[3:] for rId in self.rels if rId.startswith('rId')) + 1
+
+    def relate(self, reltype, target, is_external=False):
+        key = (reltype, target if is_external else id(target))
+        rId = self.targets.get(key)
+        if rId is None:
+            rId = f"rId{self.next_number}"
+            self.next_number += 1
+            self.rels.add_relationship(reltype, target, rId, is_external)
+            self.targets[key] = rId
+        return rId
+
+
+class DocxComposer:
+    """
+    Собирает итоговый DOCX из нескольких фрагментов (титульный лист, основная
+    часть, приложения, список литературы) за один проход по каждому фрагменту.
+
+    Элементы тела фрагмента добавляются перед секционными свойствами
+    документа-приемника. Вместе с ними переносятся стили (полные определения
+    с цепочками basedOn/link/next), нумерация списков, сноски и связи частей:
+    изображения объединяются по SHA-256 содержимого, общие части (стили,
+    настройки, тема) берутся из приемника, остальные части копируются под
+    свободными именами, внешние ссылки переносятся как внешние связи. Индексы
+    стилей, изображений и связей строятся один раз, поэтому время сборки
+    растет линейно с объемом.
+
+    Attributes:
+        document (Document): Документ-приемник python-docx
+        stats (dict): Счетчики фрагментов, элементов, стилей и изображений
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.part = document.part
+        self.package = self.part.package
+        self.stats = {'fragments': 0, 'elements': 0, 'styles': 0, 'images': 0, 'images_reused': 0}
+
+        styles = document.styles.element
+        self._styles = styles
+        self._style_ids = {style.get(qn('w:styleId')) for style in styles.findall(qn('w:style'))}
+        self._default_styles = {}
+        for style_type in STYLE_TYPES:
+            default = styles.default_for(style_type)
+            if default is not None:
+                self._default_styles[style_type] = default.get(qn('w:styleId'))
+
+        self._relations = {}
+        self._partnames = None
+        self._partname_numbers = {}
+        self._copies = {}
+        self._media = {}
+        self._media_number = 0
+        self._media_seen = 0
+        self._numbering = None
+        self._notes = {}
+
+    def append(self, fragment, move=False):
+        """
+        Добавляет фрагмент в конец документа-приемника.
+
+        Args:
+            fragment (Document): Документ python-docx с содержимым фрагмента
+            move (bool): Переносить элементы вместо глубокого копирования.
+                Фрагмент после этого использовать нельзя.
+
+        Returns:
+            DocxComposer: self, чтобы вызовы можно было объединять в цепочку
+        """
+        elements = [
+            element if move else copy.deepcopy(element)
+            for element in fragment.element.body
+            if element.tag != qn('w:sectPr')
+        ]
+
+        styles = self._merge_styles(fragment, elements)
+        self._merge_numbering(fragment, elements + styles)
+        for kind in NOTE_KINDS:
+            self._merge_notes(fragment, kind, elements)
+        self._merge_relationships(fragment.part.rels, self.part, elements)
+        self._insert(elements)
+
+        logger.info(
+            f"Добавлен фрагмент: элементов {len(elements)}, стилей скопировано {len(styles)}; "
+            f"всего изображений {self.stats['images']}, повторно использовано {self.stats['images_reused']}"
+        )
+        return self
+
+    def append_elements(self, elements, rels):
+        """
+        Добавляет готовые элементы тела (например, из кэша фрагментов).
+
+        Стили и нумерация, на которые ссылаются элементы, должны уже быть
+        в приемнике; переносятся только связи (изображения и внешние ссылки).
+
+        Args:
+            elements (list): Элементы w:p / w:tbl
+            rels (Relationships): Связи, на которые ссылаются атрибуты r:* элементов
+
+        Returns:
+            DocxComposer: self
+        """
+        self._merge_relationships(rels, self.part, elements)
+        self._insert(elements)
+        return self
+
+    def _insert(self, elements):
+        """Вставляет элементы в конец тела приемника, перед секционными свойствами."""
+        body = self.document.element.body
+        sectPr = body.find(qn('w:sectPr'))
+        for element in elements:
+            if sectPr is not None:
+                sectPr.addprevious(element)
+            else:
+                body.append(element)
+        self.stats['fragments'] += 1
+        self.stats['elements'] += len(elements)
+
+    def _merge_styles(self, fragment, elements):
+        """
+        Копирует определения стилей, на которые ссылаются элементы фрагмента.
+
+        Стили, которые уже есть в приемнике, не заменяются. Стили по умолчанию
+        фрагмента сопоставляются со стилями по умолчанию приемника (в русских
+        шаблонах Normal может иметь идентификатор 'a').
+
+        Returns:
+            list: Скопированные элементы w:style
+        """
+        source = fragment.styles.element
+        source_styles = {}
+        for style in source.findall(qn('w:style')):
+            source_styles.setdefault(style.get(qn('w:styleId')), style)
+
+        style_map = {}
+        for style_type, target_default in self._default_styles.items():
+            source_default = source.default_for(style_type)
+            if source_default is not None and source_default.get(qn('w:styleId')) != target_default:
+                style_map[source_default.get(qn('w:styleId'))] = target_default
+
+        refs = [ref for element in elements for ref in _STYLE_REFS(element)]
+        pending = [ref.get(qn('w:val')) for ref in refs]
+        copied = []
+        while pending:
+            style_id = pending.pop()
+            if style_id in style_map or style_id in self._style_ids or style_id not in source_styles:
+                continue
+            self._style_ids.add(style_id)
+
+            new_style = copy.deepcopy(source_styles[style_id])
+            new_style.attrib.pop(qn('w:default'), None)
+            for ref in _STYLE_CHAIN(new_style):
+                ref_id = ref.get(qn('w:val'))
+                if ref_id in style_map:
+                    ref.set(qn('w:val'), style_map[ref_id])
+                else:
+                    pending.append(ref_id)
+            self._styles.append(new_style)
+            copied.append(new_style)
+
+        if style_map:
+            for ref in refs:
+                if ref.get(qn('w:val')) in style_map:
+                    ref.set(qn('w:val'), style_map[ref.get(qn('w:val'))])
+        self.stats['styles'] += len(copied)
+        return copied
+
+    def _target_numbering(self):
+        """Элемент w:numbering приемника; часть numbering.xml создается при необходимости."""
+        if self._numbering is None:
+            part = _related_part(self.part, RT.NUMBERING)
+            if part is None:
+                part = NumberingPart(
+                    PackURI('/word/numbering.xml'),
+                    CT.WML_NUMBERING,
+                    parse_xml(f"<w:numbering {nsdecls('w')}/>"),
+                    self.package,
+                )
+                self._relations_for(self.part).relate(RT.NUMBERING, part)
+            self._numbering = part.element
+        return self._numbering
+
+    def _merge_numbering(self, fragment, roots):
+        """
+        Копирует определения списков (w:abstractNum и w:num), на которые
+        ссылаются элементы и стили фрагмента, с новыми идентификаторами.
+        """
+        num_refs = [ref for root in roots for ref in _NUM_IDS(root) if ref.get(qn('w:val')) != '0']
+        if not num_refs:
+            return
+
+        source_part = _related_part(fragment.part, RT.NUMBERING)
+        if source_part is None:
+            # Ссылаться не на что: убираем нумерацию, чтобы не указывать на чужие списки
+            for ref in num_refs:
+                numPr = ref.getparent()
+                numPr.getparent().remove(numPr)
+            return
+
+        source = source_part.element
+        source_nums = {num.get(qn('w:numId')): num for num in source.findall(qn('w:num'))}
+        source_abstracts = {
+            abstract.get(qn('w:abstractNumId')): abstract for abstract in source.findall(qn('w:abstractNum'))
+        }
+
+        target = self._target_numbering()
+        abstracts = target.findall(qn('w:abstractNum'))
+        nums = target.findall(qn('w:num'))
+        next_abstract = _max_int(a.get(qn('w:abstractNumId')) for a in abstracts) + 1
+        next_num = _max_int(n.get(qn('w:numId')) for n in nums) + 1
+        last_abstract = abstracts[-1] if abstracts else None
+        tail = target.find(qn('w:numIdMacAtCleanup'))
+
+        abstract_map = {}
+        num_map = {}
+        for ref in num_refs:
+            num_id = ref.get(qn('w:val'))
+            if num_id not in num_map:
+                num = source_nums.get(num_id)
+                if num is None:
+                    continue
+                abstract_id = num.find(qn('w:abstractNumId')).get(qn('w:val'))
+                if abstract_id not in abstract_map and abstract_id in source_abstracts:
+                    new_abstract = copy.deepcopy(source_abstracts[abstract_id])
+                    new_abstract.set(qn('w:abstractNumId'), str(next_abstract))
+                    abstract_map[abstract_id] = str(next_abstract)
+                    next_abstract += 1
+                    # Порядок по схеме: все w:abstractNum идут перед w:num
+                    if last_abstract is not None:
+                        last_abstract.addnext(new_abstract)
+                    elif target.find(qn('w:num')) is not None:
+                        target.find(qn('w:num')).addprevious(new_abstract)
+                    elif tail is not None:
+                        tail.addprevious(new_abstract)
+                    else:
+                        target.append(new_abstract)
+                    last_abstract = new_abstract
+
+                new_num = copy.deepcopy(num)
+                new_num.set(qn('w:numId'), str(next_num))
+                new_num.find(qn('w:abstractNumId')).set(qn('w:val'), abstract_map.get(abstract_id, abstract_id))
+                num_map[num_id] = str(next_num)
+                next_num += 1
+                if tail is not None:
+                    tail.addprevious(new_num)
+                else:
+                    target.append(new_num)
+            if num_id in num_map:
+                ref.set(qn('w:val'), num_map[num_id])
+
+    def _notes_root(self, part):
+        """Корневой элемент части сносок (python-docx не разбирает ее сам)."""
+        if isinstance(part, XmlPart):
+            return part.element
+        return etree.fromstring(part.blob)
+
+    def _merge_notes(self, fragment, kind, elements):
+        """
+        Переносит сноски (kind='footnote') или концевые сноски ('endnote'),
+        на которые ссылаются элементы фрагмента, с новыми идентификаторами.
+        """
+        refs = [ref for element in elements for ref in _NOTE_REFS[kind](element)]
+        if not refs:
+            return
+        reltype, content_type, partname = NOTE_KINDS[kind]
+        source_part = _related_part(fragment.part, reltype)
+        if source_part is None:
+            return
+        source_root = self._notes_root(source_part)
+        source_notes = {note.get(qn('w:id')): note for note in source_root.findall(qn(f'w:{kind}'))}
+
+        if kind not in self._notes:
+            part = _related_part(self.part, reltype)
+            if part is None:
+                # Новая часть: разделители сносок берутся из фрагмента
+                root = copy.deepcopy(source_root)
+                for note in root.findall(qn(f'w:{kind}')):
+                    if note.get(qn('w:type')) is None:
+                        root.remove(note)
+                part = XmlPart(PackURI(partname), content_type, root, self.package)
+                self._relations_for(self.part).relate(reltype, part)
+            self._notes[kind] = (part, self._notes_root(part))
+        part, root = self._notes[kind]
+
+        next_id = _max_int(note.get(qn('w:id')) for note in root.findall(qn(f'w:{kind}'))) + 1
+        id_map = {}
+        copied = []
+        for ref in refs:
+            note_id = ref.get(qn('w:id'))
+            if note_id not in id_map and note_id in source_notes:
+                note = copy.deepcopy(source_notes[note_id])
+                note.set(qn('w:id'), str(next_id))
+                id_map[note_id] = str(next_id)
+                next_id += 1
+                root.append(note)
+                copied.append(note)
+            if note_id in id_map:
+                ref.set(qn('w:id'), id_map[note_id])
+
+        self._merge_relationships(source_part.rels, part, copied)
+        if not isinstance(part, XmlPart):
+            part._blob = etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    def _relations_for(self, part):
+        if id(part) not in self._relations:
+            self._relations[id(part)] = _Relations(part)
+        return self._relations[id(part)]
+
+    def _merge_relationships(self, source_rels, target_part, elements):
+        """
+        Переносит связи, на которые ссылаются атрибуты r:* элементов,
+        из source_rels (связи части-источника) в target_part и переписывает
+        идентификаторы.
+        """
+        attrs = [attr for element in elements for attr in _REL_ATTRS(element)]
+        if not attrs:
+            return
+        relations = self._relations_for(target_part)
+        rel_map = {}
+        for attr in attrs:
+            rId = str(attr)
+            if rId not in rel_map:
+                rel = source_rels.get(rId)
+                if rel is None:
+                    continue
+                if rel.is_external:
+                    rel_map[rId] = relations.relate(rel.reltype, rel.target_ref, is_external=True)
+                elif rel.reltype == RT.IMAGE:
+                    rel_map[rId] = relations.relate(RT.IMAGE, self._image_part(rel.target_part))
+                elif rel.reltype in SHARED_RELTYPES:
+                    target = self._part_by_name(rel.target_part)
+                    if target is not rel.target_part:
+                        # Часть с таким именем уже есть: ссылка переводится на нее
+                        logger.info(f"Связь {rel.reltype} указывает на существующую часть {target.partname}")
+                    rel_map[rId] = relations.relate(rel.reltype, target)
+                else:
+                    rel_map[rId] = relations.relate(rel.reltype, self._copy_part(rel.target_part))
+            if rId in rel_map:
+                attr.getparent().set(attr.attrname, rel_map[rId])
+
+    def _partname_index(self):
+        """Части приемника по именам (строится один раз, дополняется сборщиком)."""
+        if self._partnames is None:
+            self._partnames = {existing.partname: existing for existing in self.package.iter_parts()}
+        return self._partnames
+
+    def _part_by_name(self, part):
+        """
+        Часть приемника с тем же именем, что и part, или сама part, если
+        такого имени в приемнике еще нет (тогда имя закрепляется за ней).
+        """
+        return self._partname_index().setdefault(part.partname, part)
+
+    def _next_partname(self, partname):
+        """
+        Следующее свободное имя по образцу partname: /word/charts/chart1.xml →
+        /word/charts/chart2.xml. Как package.next_partname, но учитывает и части,
+        которые еще не связаны с пакетом, и не перебирает пакет при каждом вызове.
+        """
+        base, ext = posixpath.splitext(partname)
+        template = f"{base.rstrip('0123456789')}%d{ext}"
+        partnames = self._partname_index()
+        number = self._partname_numbers.get(template, 0)
+        while True:
+            number += 1
+            candidate = PackURI(template % number)
+            if candidate not in partnames:
+                self._partname_numbers[template] = number
+                return candidate
+
+    def _copy_part(self, source_part):
+        """
+        Копия части фрагмента (диаграмма, внедренный объект, колонтитул и т.п.)
+        вместе со связанными с ней частями. Если имя уже занято, копия получает
+        следующее свободное имя: у двух фрагментов может быть своя
+        /word/charts/chart1.xml с разным содержимым.
+        """
+        copied = self._copies.get(id(source_part))
+        if copied is not None:
+            return copied[1]
+
+        partname = source_part.partname
+        partnames = self._partname_index()
+        if partname in partnames:
+            partname = self._next_partname(partname)
+        if isinstance(source_part, XmlPart):
+            part = type(source_part)(partname, source_part.content_type, copy.deepcopy(source_part.element), self.package)
+        else:
+            part = Part(partname, source_part.content_type, source_part.blob, self.package)
+        partnames[partname] = part
+        # Источник хранится вместе с копией, чтобы его id не достался другой части
+        self._copies[id(source_part)] = (source_part, part)
+
+        # Идентификаторы связей сохраняются: XML копии на них ссылается
+        for rId, rel in source_part.rels.items():
+            if rel.is_external:
+                part.rels.add_relationship(rel.reltype, rel.target_ref, rId, is_external=True)
+            elif rel.reltype == RT.IMAGE:
+                part.rels.add_relationship(rel.reltype, self._image_part(rel.target_part), rId)
+            elif rel.reltype in SHARED_RELTYPES:
+                part.rels.add_relationship(rel.reltype, self._part_by_name(rel.target_part), rId)
+            else:
+                part.rels.add_relationship(rel.reltype, self._copy_part(rel.target_part), rId)
+        if partname != source_part.partname:
+            logger.info(f"Часть {source_part.partname} скопирована как {partname}")
+        return part
+
+    def _image_part(self, source_part):
+        """
+        Часть изображения в приемнике с тем же содержимым (по SHA-256)
+        или новая часть с очередным именем /word/media/imageN.
+        """
+        image_parts = self.package.image_parts
+        if self._media_seen < len(image_parts):
+            # Учитываем и части, добавленные в приемник в обход сборщика (add_picture)
+            new_parts = list(image_parts)[self._media_seen:]
+            for part in new_parts:
+                self._media.setdefault(hashlib.sha256(part.blob).hexdigest(), part)
+            self._media_number = max(self._media_number, _max_int(str(part.partname.idx) for part in new_parts))
+            self._media_seen = len(image_parts)
+
+        blob = source_part.blob
+        digest = hashlib.sha256(blob).hexdigest()
+        part = self._media.get(digest)
+        if part is not None:
+            self.stats['images_reused'] += 1
+            return part
+
+        self._media_number += 1
+        ext = posixpath.splitext(source_part.partname)[1]
+        part = ImagePart(PackURI(f"/word/media/image{self._media_number}{ext}"), source_part.content_type, blob)
+        image_parts.append(part)
+        self._media_seen += 1
+        self._media[digest] = part
+        self.stats['images'] += 1
+        return part
+
+
+def compose_documents(document, fragments, move=False):
+    """
+    Добавляет в document фрагменты по порядку.
+
+    Args:
+        document (Document): Документ-приемник
+        fragments (iterable): Документы python-docx
+        move (bool): Переносить элементы вместо копирования
+
+    Returns:
+        Document: Документ-приемник
+    """
+    composer = DocxComposer(document)
+    for fragment in fragments:
+        composer.append(fragment, move=move)
+    return document
@@ -0,0 +1,374 @@
+import logging
+import re
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml.ns import qn
+from docx.shared import Cm, Pt
+
+logger = logging.getLogger(__name__)
+
+GOST_FONT = 'Times New Roman'
+
+# Оформление по ГОСТ, которое должно получиться у абзацев итогового документа.
+# Значения — в единицах OOXML: отступы в twips, размер шрифта в половинах пункта,
+# межстрочный интервал — пара (line, lineRule); 360/auto — полуторный.
+BODY_FORMAT = {
+    'paragraph': {
+        'jc': 'both',
+        'first_line': Cm(1.25).twips,
+        'line': ('360', 'auto'),
+        'after': '0',
+    },
+    'run': {
+        'font': GOST_FONT,
+        'size': '24',
+    },
+}
+HEADING_SIZES = {1: '32', 2: '28', 3: '26'}
+
+# Стиль основного текста, на который переназначаются абзацы со стилем по умолчанию
+BODY_STYLE_NAME = 'Body Text'
+
+_HEADING_RE = re.compile(r'^heading (\d)$')
+_FALSE_VALUES = ('0', 'false', 'off')
+_W_VAL = qn('w:val')
+
+
+def heading_format(level):
+    """Оформление заголовка уровня level (1 — по центру, остальные — слева)."""
+    return {
+        'paragraph': {
+            'jc': 'center' if level == 1 else 'left',
+            'line': ('360', 'auto'),
+        },
+        'run': {
+            'font': GOST_FONT,
+            'bold': True,
+            'size': HEADING_SIZES.get(level, '24'),
+        },
+    }
+
+
+def set_style_font(style, name):
+    """
+    Задает шрифт стиля и убирает ссылки на шрифты темы: атрибуты
+    asciiTheme/hAnsiTheme имеют приоритет над явным шрифтом.
+    """
+    style.font.name = name
+    rFonts = style.element.rPr.rFonts
+    for attr in ('w:asciiTheme', 'w:hAnsiTheme', 'w:eastAsiaTheme', 'w:cstheme'):
+        rFonts.attrib.pop(qn(attr), None)
+
+
+def ensure_body_text_style(document):
+    """
+    Создает (или настраивает) стиль основного текста Body Text с оформлением
+    по ГОСТ. Все свойства задаются в самом стиле, поэтому результат не зависит
+    от стиля Normal шаблона, на котором он основан.
+
+    Returns:
+        str: Идентификатор стиля
+    """
+    styles = document.styles
+    if BODY_STYLE_NAME in styles:
+        style = styles[BODY_STYLE_NAME]
+    else:
+        style = styles.add_style(BODY_STYLE_NAME, WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = styles.default(WD_STYLE_TYPE.PARAGRAPH)
+
+    set_style_font(style, GOST_FONT)
+    style.font.size = Pt(12)
+    pPr = style.element.get_or_add_pPr()
+    pPr.jc_val = None
+    pPr.get_or_add_jc().set(_W_VAL, BODY_FORMAT['paragraph']['jc'])
+    ind = pPr.get_or_add_ind()
+    ind.attrib.pop(qn('w:hanging'), None)
+    ind.set(qn('w:firstLine'), str(BODY_FORMAT['paragraph']['first_line']))
+    spacing = pPr.get_or_add_spacing()
+    line, line_rule = BODY_FORMAT['paragraph']['line']
+    spacing.set(qn('w:line'), line)
+    spacing.set(qn('w:lineRule'), line_rule)
+    spacing.set(qn('w:after'), BODY_FORMAT['paragraph']['after'])
+    return style.style_id
+
+
+class StyleResolver:
+    """
+    Вычисляет действующие значения свойств абзаца и символов для стилей
+    документа: по цепочке basedOn и затем по docDefaults. Результаты
+    запоминаются, поэтому XML стилей разбирается один раз на документ.
+    """
+
+    def __init__(self, document):
+        styles_element = document.styles.element
+        self.styles = {}
+        self.names = {}
+        self.default_paragraph_style = None
+        for style in styles_element.findall(qn('w:style')):
+            style_id = style.get(qn('w:styleId'))
+            self.styles[style_id] = style
+            name = style.find(qn('w:name'))
+            self.names[style_id] = name.get(_W_VAL).lower() if name is not None else ''
+            if style.get(qn('w:type')) == 'paragraph' and style.get(qn('w:default')) in ('1', 'true', 'on'):
+                self.default_paragraph_style = style_id
+
+        defaults = styles_element.find(qn('w:docDefaults'))
+        self._default_pPr = defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}") if defaults is not None else None
+        self._default_rPr = defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}") if defaults is not None else None
+        self._values = {}
+
+    def heading_level(self, style_id):
+        """Уровень заголовка для стиля 'heading N' или None."""
+        match = _HEADING_RE.match(self.names.get(style_id or self.default_paragraph_style, ''))
+        return int(match.group(1)) if match else None
+
+    def _chain(self, style_id):
+        chain = []
+        style_id = style_id or self.default_paragraph_style
+        while style_id in self.styles and style_id not in chain:
+            chain.append(style_id)
+            based_on = self.styles[style_id].find(qn('w:basedOn'))
+            style_id = based_on.get(_W_VAL) if based_on is not None else None
+        return chain
+
+    def value(self, style_id, kind, prop):
+        """Действующее значение свойства prop ('paragraph' или 'run') для стиля."""
+        key = (style_id, kind, prop)
+        if key not in self._values:
+            getter = PARAGRAPH_PROPS[prop][0] if kind == 'paragraph' else RUN_PROPS[prop][0]
+            result = None
+            for chain_id in self._chain(style_id):
+                container = self.styles[chain_id].find(qn('w:pPr' if kind == 'paragraph' else 'w:rPr'))
+                result = getter(container) if container is not None else None
+                if result is not None:
+                    break
+            if result is None:
+                default = self._default_pPr if kind == 'paragraph' else self._default_rPr
+                result = getter(default) if default is not None else None
+            self._values[key] = result
+        return self._values[key]
+
+
+# Чтение, запись и удаление отдельных свойств в w:pPr / w:rPr. Чтение
+# возвращает None, если свойство на этом уровне не задано.
+
+def _get_jc(pPr):
+    jc = pPr.find(qn('w:jc'))
+    if jc is None:
+        return None
+    value = jc.get(_W_VAL)
+    return {'start': 'left', 'end': 'right'}.get(value, value)
+
+
+def _set_jc(pPr, value):
+    pPr.jc_val = None
+    pPr.get_or_add_jc().set(_W_VAL, value)
+
+
+def _remove_jc(pPr):
+    pPr.jc_val = None
+
+
+def _get_first_line(pPr):
+    ind = pPr.find(qn('w:ind'))
+    if ind is None:
+        return None
+    if ind.get(qn('w:hanging')) is not None:
+        return -int(ind.get(qn('w:hanging')))
+    if ind.get(qn('w:firstLine')) is not None:
+        return int(ind.get(qn('w:firstLine')))
+    return None
+
+
+def _set_first_line(pPr, value):
+    ind = pPr.get_or_add_ind()
+    ind.attrib.pop(qn('w:hanging'), None)
+    ind.set(qn('w:firstLine'), str(value))
+
+
+def _remove_first_line(pPr):
+    _remove_attributes(pPr, 'w:ind', ('w:firstLine', 'w:hanging'))
+
+
+def _get_line(pPr):
+    spacing = pPr.find(qn('w:spacing'))
+    if spacing is None or spacing.get(qn('w:line')) is None:
+        return None
+    return spacing.get(qn('w:line')), spacing.get(qn('w:lineRule')) or 'auto'
+
+
+def _set_line(pPr, value):
+    spacing = pPr.get_or_add_spacing()
+    spacing.set(qn('w:line'), value[0])
+    spacing.set(qn('w:lineRule'), value[1])
+
+
+def _remove_line(pPr):
+    _remove_attributes(pPr, 'w:spacing', ('w:line', 'w:lineRule'))
+
+
+def _get_after(pPr):
+    spacing = pPr.find(qn('w:spacing'))
+    return spacing.get(qn('w:after')) if spacing is not None else None
+
+
+def _set_after(pPr, value):
+    pPr.get_or_add_spacing().set(qn('w:after'), value)
+
+
+def _remove_after(pPr):
+    _remove_attributes(pPr, 'w:spacing', ('w:after',))
+
+
+def _get_font(rPr):
+    fonts = rPr.find(qn('w:rFonts'))
+    if fonts is None:
+        return None
+    if fonts.get(qn('w:asciiTheme')) is not None:
+        return f"theme:{fonts.get(qn('w:asciiTheme'))}"
+    return fonts.get(qn('w:ascii'))
+
+
+def _set_font(rPr, value):
+    fonts = rPr.get_or_add_rFonts()
+    fonts.set(qn('w:ascii'), value)
+    fonts.set(qn('w:hAnsi'), value)
+
+
+def _remove_font(rPr):
+    _remove_attributes(rPr, 'w:rFonts', ('w:ascii', 'w:hAnsi'))
+
+
+def _get_size(rPr):
+    sz = rPr.find(qn('w:sz'))
+    return sz.get(_W_VAL) if sz is not None else None
+
+
+def _set_size(rPr, value):
+    rPr.get_or_add_sz().set(_W_VAL, value)
+
+
+def _remove_size(rPr):
+    rPr._remove_sz()
+
+
+def _get_bold(rPr):
+    b = rPr.find(qn('w:b'))
+    if b is None:
+        return None
+    return b.get(_W_VAL, 'true').lower() not in _FALSE_VALUES
+
+
+def _set_bold(rPr, value):
+    b = rPr.get_or_add_b()
+    b.attrib.pop(_W_VAL, None)
+
+
+def _remove_bold(rPr):
+    rPr._remove_b()
+
+
+def _remove_attributes(parent, tag, attributes):
+    """Удаляет атрибуты дочернего элемента и сам элемент, если он опустел."""
+    element = parent.find(qn(tag))
+    if element is None:
+        return
+    for attr in attributes:
+        element.attrib.pop(qn(attr), None)
+    if not len(element.attrib) and not len(element):
+        parent.remove(element)
+
+
+PARAGRAPH_PROPS = {
+    'jc': (_get_jc, _set_jc, _remove_jc),
+    'first_line': (_get_first_line, _set_first_line, _remove_first_line),
+    'line': (_get_line, _set_line, _remove_line),
+    'after': (_get_after, _set_after, _remove_after),
+}
+RUN_PROPS = {
+    'font': (_get_font, _set_font, _remove_font),
+    'size': (_get_size, _set_size, _remove_size),
+    'bold': (_get_bold, _set_bold, _remove_bold),
+}
+
+
+def _reconcile(container, get_or_add, style_value, target, getter, setter, remover, counters):
+    """
+    Приводит одно свойство к целевому значению с минимумом прямого форматирования:
+    если стиль уже дает нужное значение, прямое форматирование удаляется,
+    иначе записывается только это свойство.
+    """
+    direct = getter(container) if container is not None else None
+    if style_value == target:
+        if direct is not None:
+            remover(container)
+            counters['removed'] += 1
+    elif direct != target:
+        setter(container if container is not None else get_or_add(), target)
+        counters['written'] += 1
+
+
+def _paragraph_text(p):
+    return ''.join(p.xpath('./w:r/w:t/text() | ./w:hyperlink/w:r/w:t/text()'))
+
+
+def apply_style_formatting(document):
+    """
+    Оформляет абзацы документа по ГОСТ через стили.
+
+    Непустые абзацы со стилем по умолчанию переводятся на стиль Body Text,
+    настроенный по ГОСТ; заголовки оформляются своими стилями Heading N.
+    Прямое форматирование абзацев и прогонов остается только там, где
+    стиль дает другое значение (например, у стилей шаблона титульного
+    листа), а совпадающее со стилем удаляется. Как и прежде, форматируются
+    абзацы верхнего уровня; пустые абзацы не трогаются.
+
+    Args:
+        document (Document): Документ python-docx
+
+    Returns:
+        dict: Счетчики: абзацев оформлено, свойств записано и удалено
+    """
+    body_style_id = ensure_body_text_style(document)
+    resolver = StyleResolver(document)
+    heading_formats = {}
+    counters = {'paragraphs': 0, 'written': 0, 'removed': 0}
+
+    for p in document.element.body.iterchildren(qn('w:p')):
+        if not _paragraph_text(p).strip():
+            continue
+        pPr = p.pPr
+        style_id = pPr.style if pPr is not None else None
+
+        level = resolver.heading_level(style_id)
+        if level is not None:
+            if level not in heading_formats:
+                heading_formats[level] = heading_format(level)
+            target = heading_formats[level]
+        else:
+            target = BODY_FORMAT
+            if style_id is None or style_id == resolver.default_paragraph_style:
+                # Абзац со стилем по умолчанию получает стиль основного текста
+                p.get_or_add_pPr().style = body_style_id
+                pPr = p.pPr
+                style_id = body_style_id
+
+        counters['paragraphs'] += 1
+        for prop, value in target['paragraph'].items():
+            getter, setter, remover = PARAGRAPH_PROPS[prop]
+            _reconcile(pPr, p.get_or_add_pPr, resolver.value(style_id, 'paragraph', prop),
+                       value, getter, setter, remover, counters)
+
+        for r in p.iterchildren(qn('w:r')):
+            rPr = r.rPr
+            for prop, value in target['run'].items():
+                getter, setter, remover = RUN_PROPS[prop]
+                _reconcile(rPr, r.get_or_add_rPr, resolver.value(style_id, 'run', prop),
+                           value, getter, setter, remover, counters)
+                rPr = r.rPr
+
+    logger.info(
+        f"Оформление через стили: {counters['paragraphs']} абзацев, прямого форматирования "
+        f"записано {counters['written']}, удалено {counters['removed']}"
+    )
+    return counters
@@ -0,0 +1,235 @@
+import copy
+import glob
+import io
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docxtpl import DocxTemplate
+
+logger = logging.getLogger(__name__)
+
+# Шаблон, который используется, если запрошенный не найден
+DEFAULT_TEMPLATE_NAME = 'diplo_project'
+
+
+def get_templates_dir():
+    """Возвращает каталог с DOCX-шаблонами титульных листов."""
+    return os.path.join(settings.BASE_DIR, 'templates', 'docx')
+
+
+def resolve_template_path(template_name):
+    """
+    Возвращает путь к шаблону DOCX с откатом на стандартный шаблон.
+
+    Args:
+        template_name (str): Название шаблона (без расширения)
+
+    Returns:
+        str: Путь к файлу шаблона или None, если шаблон не найден
+    """
+    template_path = os.path.join(get_templates_dir(), f"{template_name}.docx")
+    if os.path.exists(template_path):
+        return template_path
+
+    logger.warning(f"Шаблон не найден: {template_path}")
+    default_path = os.path.join(get_templates_dir(), f"{DEFAULT_TEMPLATE_NAME}.docx")
+    if os.path.exists(default_path):
+        logger.info(f"Используется стандартный шаблон: {default_path}")
+        return default_path
+
+    logger.error("Стандартный шаблон не найден")
+    return None
+
+
+def remove_duplicate_core_properties(docx):
+    """
+    Убирает из пакета лишнюю часть свойств документа (docProps/core.xml).
+
+    В части шаблонов свойства связаны с пакетом связью нестандартного типа
+    (.../officedocument/... в нижнем регистре). python-docx ее не узнает и при
+    рендеринге свойств в DocxTemplate создает вторую часть с тем же именем,
+    и в сохраненном DOCX оказываются две записи docProps/core.xml. Остается
+    часть со стандартной связью: в нее docxtpl записал отрендеренные свойства.
+
+    Args:
+        docx (Document): Документ python-docx
+    """
+    package = docx.part.package
+    core_part = package._core_properties_part
+    for rId, rel in list(package.rels.items()):
+        if rel.is_external or rel.reltype == RT.CORE_PROPERTIES:
+            continue
+        if rel.target_part is not core_part and rel.target_part.partname == core_part.partname:
+            package.rels.pop(rId)
+            package.rels._target_parts_by_rId.pop(rId, None)
+            logger.info(f"Удалена повторная часть свойств документа {core_part.partname} (связь {rel.reltype})")
+
+
+def render_template(template, context):
+    """
+    Рендерит DocxTemplate и возвращает его документ python-docx без
+    повторной части свойств документа (см. remove_duplicate_core_properties).
+
+    Args:
+        template (DocxTemplate): Копия шаблона из кэша
+        context (dict): Контекст рендеринга
+
+    Returns:
+        Document: Отрендеренный документ
+    """
+    template.render(context)
+    # get_docx() перечитал бы шаблон после рендеринга, поэтому берем docx напрямую
+    docx = template.docx
+    remove_duplicate_core_properties(docx)
+    return docx
+
+
+class _CachedTemplate:
+    """Разобранный шаблон вместе с версией файла, из которого он загружен."""
+
+    def __init__(self, path, mtime, size, raw, document):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.raw = raw
+        self.document = document
+        # Когда (time.monotonic) версия файла проверялась в последний раз
+        self.checked_at = time.monotonic()
+
+    @property
+    def version(self):
+        return f"{os.path.basename(self.path)}:{self.mtime}:{self.size}"
+
+
+class DocxTemplateCache:
+    """
+    Процессный кэш DOCX-шаблонов титульных листов.
+
+    Каждый шаблон разбирается один раз и хранится в памяти. Файл перечитывается
+    только если изменились его mtime или размер; версия файла проверяется не
+    чаще раза в check_interval секунд, поэтому за один экспорт (ключ кэша,
+    ключ титульного листа, сам шаблон) выполняется один stat. Запрос получает
+    собственную копию разобранного документа, поэтому рендеринг не
+    затрагивает кэш.
+    """
+
+    check_interval = 1.0
+
+    def __init__(self):
+        self._entries = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, path, stat):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        document = Document(io.BytesIO(raw))
+        return _CachedTemplate(path, stat.st_mtime_ns, stat.st_size, raw, document)
+
+    def _get_entry(self, template_name, count=True):
+        """
+        Возвращает запись кэша для шаблона. count=False — без учета
+        попадания (запрос одной лишь версии); загрузка файла всегда
+        считается промахом.
+        """
+        entry = self._names.get(template_name)
+        if entry is not None and time.monotonic() - entry.checked_at < self.check_interval:
+            if count:
+                with self._lock:
+                    self.hits += 1
+            return entry
+
+        # Один stat и для проверки наличия файла, и для его версии
+        path = os.path.join(get_templates_dir(), f"{template_name}.docx")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            path = resolve_template_path(template_name)
+            if not path:
+                return None
+            stat = os.stat(path)
+
+        entry = self._entries.get(path)
+        if entry and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked_at = time.monotonic()
+            self._names[template_name] = entry
+            if count:
+                with self._lock:
+                    self.hits += 1
+            return entry
+
+        with self._lock:
+            # Другой поток мог уже перечитать файл, пока мы ждали блокировку
+            entry = self._entries.get(path)
+            if entry and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+                if count:
+                    self.hits += 1
+            else:
+                entry = self._load(path, stat)
+                self._entries[path] = entry
+                self.misses += 1
+                logger.info(f"Шаблон загружен в кэш: {path}")
+            entry.checked_at = time.monotonic()
+            self._names[template_name] = entry
+            return entry
+
+    def get_template(self, template_name):
+        """
+        Возвращает готовый к рендерингу DocxTemplate.
+
+        Args:
+            template_name (str): Название шаблона (без расширения)
+
+        Returns:
+            DocxTemplate: Независимая копия шаблона или None, если шаблон не найден
+        """
+        entry = self._get_entry(template_name)
+        if entry is None:
+            return None
+
+        template = DocxTemplate(io.BytesIO(entry.raw))
+        template.docx = copy.deepcopy(entry.document)
+        return template
+
+    def get_version(self, template_name):
+        """
+        Возвращает строку версии файла шаблона (имя, mtime, размер).
+        Запрос версии не учитывается как попадание в кэш.
+        """
+        entry = self._get_entry(template_name, count=False)
+        return entry.version if entry else None
+
+    def warm(self):
+        """Заранее загружает все шаблоны из каталога templates/docx."""
+        for path in sorted(glob.glob(os.path.join(get_templates_dir(), '*.docx'))):
+            template_name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                self._get_entry(template_name)
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить шаблон {path} в кэш: {e}")
+        logger.info(f"Кэш шаблонов прогрет: {len(self._entries)} шаблонов")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._names.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Возвращает счётчики попаданий и промахов кэша."""
+        return {
+            'templates': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+template_cache = DocxTemplateCache()
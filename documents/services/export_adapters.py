@@ -0,0 +1,365 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch
+from django.utils.html import escape
+
+from documents.models.gost import Abbreviation, Document, Performer, Term
+from documents.models.main import Document_main
+from documents.models.sto import Document_sto
+from documents.services.export_cache import model_fingerprint_data
+
+# Шаблон титульного листа по типу работы
+WORK_TYPE_TEMPLATES = {
+    'MAG_DIPLOMA': 'magitr_dissertation',
+    'DIPLOMA': 'diplom_work',
+    'BACHELOR': 'bachelor_work',
+    'COURSE': 'kursovaya',
+    'CALC_GRAPH': 'diplo_project',  # используем общий шаблон
+    'PRACTICE': 'otchet_praktika',
+    'LAB': 'laba_work',
+    'REF': 'referat',
+}
+
+DEFAULT_TEMPLATE_NAME = 'diplo_project'
+DEFAULT_INSTITUTE = 'Институт космических и информационных технологий'
+DEFAULT_UNIVERSITY = 'СИБИРСКИЙ ФЕДЕРАЛЬНЫЙ УНИВЕРСИТЕТ'
+
+
+def _related_one(document_obj, name):
+    """Возвращает связанный объект OneToOne или None, если его нет."""
+    try:
+        return getattr(document_obj, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def _fingerprint_list(objects):
+    return [model_fingerprint_data(obj) for obj in objects]
+
+
+def _section_html(title, content=''):
+    """Раздел верхнего уровня: заголовок h1 и HTML содержимого."""
+    return f'<h1>{escape(title)}</h1>{content or ""}'
+
+
+def _text_html(text):
+    """Абзацы простого текста (без разметки) в HTML."""
+    return ''.join(f'<p>{escape(line)}</p>' for line in (text or '').splitlines() if line.strip())
+
+
+def student_work_title_context(document_obj):
+    """
+    Контекст титульного листа студенческой работы (Document_main и Document_sto).
+    Поля, которых нет у модели, заполняются пустыми значениями.
+    """
+    def field(name, default=''):
+        return getattr(document_obj, name, default) or default
+
+    year = str(document_obj.year) if document_obj.year else ''
+    return {
+        'TITLE': document_obj.title.upper(),
+        'TitleContinue': "",
+        'YEAR': year,
+        'YearShort': year[-2:] if year else '__',
+        'STUDENT_NAME': document_obj.student_name or '',
+        'SUPERVISOR': document_obj.supervisor or '',
+        'SupervisorPosition': field('supervisor_position'),
+        'SupervisorSignature': '_________',
+        'StudentSignature': '_________',
+        'Institut': field('institute_name', DEFAULT_INSTITUTE),
+        'institut': field('institute_name', DEFAULT_INSTITUTE),  # вариант с маленькой буквы
+        'Kafedra': field('department_name'),
+        'ZavKaf': field('head_of_department'),
+        'Podpis': '_________',
+        'Day': field('day', '___'),
+        'Month': field('month', '________'),
+        'Speciality': f"{field('specialty_code')} {field('specialty_name')}".strip(),
+        'UNIVERSITY': field('university_name', DEFAULT_UNIVERSITY).upper(),
+        'code': field('specialty_code'),
+        'head_of_department': field('head_of_department'),
+        'speciality_full': f"{field('specialty_code_full')} {field('specialty_name')}".strip(),
+        'record_number': field('record_number'),
+        'reviewer': field('reviewer'),
+        'reviewer_position': field('reviewer_position'),
+        'factory_supervisor': field('factory_supervisor'),
+    }
+
+
+class ExportAdapter:
+    """
+    Адаптер модели документа к общему конвейеру экспорта.
+
+    Адаптер знает, как одним планом select_related/prefetch_related загрузить
+    документ со всеми связанными частями, и отдает конвейеру то, что от модели
+    зависит: контекст титульного листа, HTML основной части и данные для ключа
+    кэша. После загрузки через get_queryset экспорт не делает запросов к БД,
+    поэтому число запросов не зависит от числа разделов, источников и приложений.
+
+    Attributes:
+        kind (str): Короткое имя типа документа в URL ('main', 'gost', 'sto')
+        label (str): Название типа документа для логов
+        model (Model): Модель документа
+        owner_field (str): Поле владельца или None, если у модели его нет
+        detail_url (str): Имя URL карточки документа для возврата при ошибке
+        doi_references (bool): Список литературы строится по DOI (references_doi)
+    """
+
+    kind = None
+    label = ''
+    model = None
+    owner_field = None
+    detail_url = None
+    select_related = ()
+    prefetch_related = ()
+    doi_references = False
+
+    def get_queryset(self, user=None):
+        """Queryset документов с планом загрузки связанных частей."""
+        queryset = self.model.objects.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.owner_field and user is not None:
+            queryset = queryset.filter(**{self.owner_field: user})
+        return queryset
+
+    def template_name(self, document_obj):
+        """Название шаблона титульного листа."""
+        return WORK_TYPE_TEMPLATES.get(getattr(document_obj, 'work_type', None), DEFAULT_TEMPLATE_NAME)
+
+    def title_context(self, document_obj):
+        """Контекст DocxTemplate для титульного листа."""
+        raise NotImplementedError
+
+    def body_html(self, document_obj):
+        """HTML основной части; разделы начинаются с заголовков h1/h2."""
+        raise NotImplementedError
+
+    def standart(self, document_obj):
+        """Стандарт оформления основной части или None."""
+        return None
+
+    def fingerprint_data(self, document_obj):
+        """Значения полей документа и его частей для ключа кэша экспорта."""
+        return model_fingerprint_data(document_obj)
+
+    def filename_base(self, document_obj):
+        """Основа имени файла экспорта."""
+        return document_obj.title
+
+
+class MainExportAdapter(ExportAdapter):
+    """Документ Main: все содержимое хранится в поле data."""
+
+    kind = 'main'
+    label = 'Main'
+    model = Document_main
+    owner_field = 'owner'
+    detail_url = 'documents:main_detail'
+    doi_references = True
+
+    def title_context(self, document_obj):
+        return student_work_title_context(document_obj)
+
+    def body_html(self, document_obj):
+        return document_obj.data or ''
+
+    def standart(self, document_obj):
+        return document_obj.standart
+
+    def filename_base(self, document_obj):
+        return document_obj.document_name or document_obj.title
+
+
+class GostExportAdapter(ExportAdapter):
+    """
+    Отчет по ГОСТ 7.32: титульный лист, реферат, исполнители, термины,
+    сокращения, разделы отчета, источники и приложения из связанных моделей.
+    Отдельного шаблона титульного листа ГОСТ нет, используется общий.
+    """
+
+    kind = 'gost'
+    label = 'ГОСТ'
+    model = Document
+    owner_field = 'user'
+    detail_url = 'documents:gost_detail'
+    select_related = ('title_page', 'abstract')
+    prefetch_related = (
+        # У этих моделей нет ordering, порядок задаем явно, чтобы ключ кэша был стабильным
+        Prefetch('performers', queryset=Performer.objects.order_by('pk')),
+        Prefetch('terms', queryset=Term.objects.order_by('pk')),
+        Prefetch('abbreviations', queryset=Abbreviation.objects.order_by('pk')),
+        'references',
+        'appendices',
+    )
+
+    def title_context(self, document_obj):
+        title_page = _related_one(document_obj, 'title_page')
+        performers = document_obj.performers.all()
+        head_position = ''
+        if title_page:
+            head_position = ', '.join(filter(None, [title_page.head_position, title_page.head_degree]))
+        year = str(document_obj.year)
+        return {
+            'TITLE': document_obj.title.upper(),
+            'TitleContinue': document_obj.get_report_type_display().upper() + ' ОТЧЁТ',
+            'YEAR': year,
+            'YearShort': year[-2:],
+            'STUDENT_NAME': ', '.join(performer.full_name for performer in performers),
+            'SUPERVISOR': title_page.head_full_name if title_page else '',
+            'SupervisorPosition': head_position,
+            'SupervisorSignature': '_________',
+            'StudentSignature': '_________',
+            'Institut': DEFAULT_INSTITUTE,
+            'institut': DEFAULT_INSTITUTE,
+            'Kafedra': title_page.department if title_page else '',
+            'ZavKaf': '',
+            'Podpis': '_________',
+            'Day': '___',
+            'Month': '________',
+            'Speciality': '',
+            'UNIVERSITY': DEFAULT_UNIVERSITY,
+            'code': title_page.program_code if title_page else '',
+            'head_of_department': '',
+            'speciality_full': '',
+            'record_number': title_page.registration_number_nioktr if title_page else '',
+            'reviewer': '',
+            'reviewer_position': '',
+            'factory_supervisor': '',
+        }
+
+    def body_html(self, document_obj):
+        parts = []
+
+        performers = document_obj.performers.all()
+        if performers:
+            rows = ''.join(
+                f'<tr><td>{escape(", ".join(filter(None, [p.position, p.degree])))}</td>'
+                f'<td>{escape(p.full_name)}</td><td>{escape(p.participation)}</td></tr>'
+                for p in performers
+            )
+            parts.append(_section_html('СПИСОК ИСПОЛНИТЕЛЕЙ', f'<table>{rows}</table>'))
+
+        abstract = _related_one(document_obj, 'abstract')
+        parts.append(_section_html('РЕФЕРАТ', abstract.content if abstract else ''))
+
+        terms = document_obj.terms.all()
+        if terms:
+            parts.append(_section_html('ТЕРМИНЫ И ОПРЕДЕЛЕНИЯ', ''.join(
+                f'<p><strong>{escape(t.term)}</strong> — {escape(t.definition)}</p>' for t in terms
+            )))
+
+        abbreviations = document_obj.abbreviations.all()
+        if abbreviations:
+            parts.append(_section_html('ПЕРЕЧЕНЬ СОКРАЩЕНИЙ И ОБОЗНАЧЕНИЙ', ''.join(
+                f'<p>{escape(a.abbreviation)} — {escape(a.meaning)}</p>' for a in abbreviations
+            )))
+
+        parts.append(_section_html('ВВЕДЕНИЕ', document_obj.introduction))
+        parts.append(_section_html('ОСНОВНАЯ ЧАСТЬ', document_obj.main_part))
+        parts.append(_section_html('ЗАКЛЮЧЕНИЕ', document_obj.conclusion))
+
+        references = document_obj.references.all()
+        items = ''.join(f'<li>{escape(reference.citation)}</li>' for reference in references)
+        parts.append(_section_html('СПИСОК ИСПОЛЬЗОВАННЫХ ИСТОЧНИКОВ', f'<ol>{items}</ol>' if items else ''))
+
+        for appendix in document_obj.appendices.all():
+            title = f'<p style="text-align: center"><strong>{escape(appendix.title)}</strong></p>' if appendix.title else ''
+            parts.append(_section_html(f'ПРИЛОЖЕНИЕ {appendix.label}', title + (appendix.content or '')))
+        return ''.join(parts)
+
+    def fingerprint_data(self, document_obj):
+        title_page = _related_one(document_obj, 'title_page')
+        abstract = _related_one(document_obj, 'abstract')
+        return {
+            'document': model_fingerprint_data(document_obj),
+            'title_page': model_fingerprint_data(title_page) if title_page else None,
+            'abstract': model_fingerprint_data(abstract) if abstract else None,
+            'performers': _fingerprint_list(document_obj.performers.all()),
+            'terms': _fingerprint_list(document_obj.terms.all()),
+            'abbreviations': _fingerprint_list(document_obj.abbreviations.all()),
+            'references': _fingerprint_list(document_obj.references.all()),
+            'appendices': _fingerprint_list(document_obj.appendices.all()),
+        }
+
+    def standart(self, document_obj):
+        return document_obj.get_template_type_display()
+
+
+class StoExportAdapter(ExportAdapter):
+    """
+    Документ по СТО 4.2–07–2008: реферат, разделы, список источников и
+    приложения из связанных моделей. Поля владельца у модели нет, поэтому
+    документ ищется только по pk (как и в карточке документа).
+    """
+
+    kind = 'sto'
+    label = 'СТО'
+    model = Document_sto
+    detail_url = 'documents:sto_detail'
+    select_related = ('abstract',)
+    prefetch_related = ('sections', 'biblio', 'appendices')
+
+    def title_context(self, document_obj):
+        return student_work_title_context(document_obj)
+
+    def body_html(self, document_obj):
+        parts = []
+
+        abstract = _related_one(document_obj, 'abstract')
+        if abstract:
+            summary = (
+                f'Работа содержит {abstract.page_count} с., {abstract.illustrations_count} рис., '
+                f'{abstract.tables_count} табл., {abstract.formulas_count} формул, '
+                f'{abstract.appendices_count} прил., {abstract.references_count} источников, '
+                f'{abstract.graphic_sheets} листов графического материала.'
+            )
+            parts.append(_section_html('РЕФЕРАТ', (
+                f'<p>{escape(summary)}</p>'
+                f'<p>{escape(abstract.keywords.upper())}</p>'
+                f'{abstract.text or ""}'
+            )))
+
+        for section in document_obj.sections.all():
+            parts.append(_section_html(section.title, section.content))
+
+        entries = ''.join(f'<li>{entry.entry_text}</li>' for entry in document_obj.biblio.all())
+        if entries:
+            parts.append(_section_html('СПИСОК ИСПОЛЬЗОВАННЫХ ИСТОЧНИКОВ', f'<ol>{entries}</ol>'))
+
+        for appendix in document_obj.appendices.all():
+            title = f'<p style="text-align: center"><strong>{escape(appendix.title)}</strong></p>' if appendix.title else ''
+            parts.append(_section_html(f'ПРИЛОЖЕНИЕ {appendix.label}', title + _text_html(appendix.content)))
+        return ''.join(parts)
+
+    def standart(self, document_obj):
+        return 'СТО 4.2–07–2008'
+
+    def fingerprint_data(self, document_obj):
+        abstract = _related_one(document_obj, 'abstract')
+        return {
+            'document': model_fingerprint_data(document_obj),
+            'abstract': model_fingerprint_data(abstract) if abstract else None,
+            'sections': _fingerprint_list(document_obj.sections.all()),
+            'biblio': _fingerprint_list(document_obj.biblio.all()),
+            'appendices': _fingerprint_list(document_obj.appendices.all()),
+        }
+
+
+EXPORT_ADAPTERS = {
+    adapter.kind: adapter
+    for adapter in (MainExportAdapter(), GostExportAdapter(), StoExportAdapter())
+}
+
+
+def get_export_adapter(kind):
+    """Возвращает адаптер по короткому имени типа документа."""
+    return EXPORT_ADAPTERS[kind]
+
+
+def adapter_for(document_obj):
+    """Возвращает адаптер для экземпляра модели документа."""
+    for adapter in EXPORT_ADAPTERS.values():
+        if isinstance(document_obj, adapter.model):
+            return adapter
+    raise LookupError(f"Нет адаптера экспорта для {type(document_obj).__name__}")
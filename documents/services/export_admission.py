@@ -0,0 +1,301 @@
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'export_admission'
+
+
+class ExportRejected(Exception):
+    """
+    Экспорт не допущен: очередь заполнена ('full'), у пользователя уже идут
+    экспорты ('user') или экспорт ждет своей очереди ('queued', тогда
+    известна позиция).
+    """
+
+    def __init__(self, message, status=429, retry_after=30, position=None, reason='full'):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.position = position
+        self.reason = reason
+
+
+class ExportLease:
+    """Занятые слоты экспорта; освобождаются при выходе из блока with."""
+
+    def __init__(self, admission, keys, token):
+        self.admission = admission
+        self.keys = keys
+        self.token = token
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+    def release(self):
+        self.admission.release(self.keys, self.token)
+        self.keys = []
+
+
+class ExportAdmission:
+    """
+    Допуск тяжелых экспортов по бюджету памяти.
+
+    Одновременно выполняется не больше EXPORT_MEMORY_BUDGET_MB //
+    EXPORT_MEMORY_PER_EXPORT_MB экспортов и не больше EXPORT_USER_CONCURRENCY
+    на пользователя. Если свободного слота нет, запрос получает билет в
+    очереди. Билеты выдаются счетчиком (cache.incr), поэтому позиция
+    соответствует порядку прихода, и слоты достаются билетам по порядку.
+    Запрос ждет слота не дольше EXPORT_QUEUE_WAIT секунд, затем получает 503
+    с позицией и Retry-After; билет закреплен за пользователем, и повторный
+    запрос сохраняет место. Билет, по которому не повторили запрос за
+    EXPORT_QUEUE_TICKET_TIMEOUT секунд, выбывает. Если ожидают уже
+    EXPORT_QUEUE_LENGTH билетов, новые запросы получают 429.
+
+    Слоты, билеты и счетчики очереди — ключи кэша Django; слоты занимаются
+    через cache.add. Поэтому допуск общий для всех процессов, если кэш
+    EXPORT_ADMISSION_CACHE общий (Redis, Memcached, база данных). У слотов
+    есть срок жизни, так что слоты процесса, завершившегося аварийно,
+    освобождаются сами.
+    """
+
+    # Как часто ожидающий запрос проверяет, не освободился ли слот (с)
+    poll_interval = 0.5
+    # Блокировка очереди: срок жизни (с), сколько ее ждать (с) и как часто проверять
+    queue_lock_timeout = 5
+    queue_lock_wait = 1
+    queue_lock_interval = 0.01
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'EXPORT_ADMISSION_CACHE', 'default')]
+
+    @property
+    def slots(self):
+        budget = getattr(settings, 'EXPORT_MEMORY_BUDGET_MB', 2048)
+        per_export = getattr(settings, 'EXPORT_MEMORY_PER_EXPORT_MB', 256)
+        return max(1, budget // per_export)
+
+    @property
+    def per_user(self):
+        return getattr(settings, 'EXPORT_USER_CONCURRENCY', 1)
+
+    @property
+    def queue_length(self):
+        return getattr(settings, 'EXPORT_QUEUE_LENGTH', 20)
+
+    @property
+    def queue_wait(self):
+        return getattr(settings, 'EXPORT_QUEUE_WAIT', 10)
+
+    @property
+    def retry_after(self):
+        return getattr(settings, 'EXPORT_QUEUE_RETRY_AFTER', 5)
+
+    @property
+    def ticket_timeout(self):
+        return getattr(settings, 'EXPORT_QUEUE_TICKET_TIMEOUT', 60)
+
+    @property
+    def lease_timeout(self):
+        return getattr(settings, 'EXPORT_ADMISSION_LEASE', 600)
+
+    def _slot_keys(self):
+        return [f"{KEY_PREFIX}:slot:{i}" for i in range(self.slots)]
+
+    def _user_keys(self, user):
+        return [f"{KEY_PREFIX}:user:{user.pk}:{i}" for i in range(self.per_user)]
+
+    def _ticket_key(self, ticket):
+        return f"{KEY_PREFIX}:queue:ticket:{ticket}"
+
+    def _user_ticket_key(self, user):
+        return f"{KEY_PREFIX}:queue:user:{user.pk}"
+
+    def _take(self, keys, token, timeout):
+        """Занимает первый свободный ключ из keys; возвращает его или None."""
+        for key in keys:
+            if self.cache.add(key, token, timeout):
+                return key
+        return None
+
+    def release(self, keys, token):
+        for key in keys:
+            if self.cache.get(key) == token:
+                self.cache.delete(key)
+
+    def _counter(self, name):
+        """
+        Счетчик очереди: 'tail' — последний выданный билет, 'head' — число
+        билетов, которые уже обслужены или выбыли.
+        """
+        key = f"{KEY_PREFIX}:queue:{name}"
+        self.cache.add(key, 0, None)
+        return self.cache.get(key, 0)
+
+    def _incr(self, name):
+        key = f"{KEY_PREFIX}:queue:{name}"
+        self.cache.add(key, 0, None)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Счетчик вытеснен из кэша между add и incr
+            self.cache.add(key, 1, None)
+            return self.cache.get(key, 1)
+
+    @contextmanager
+    def _queue_lock(self):
+        """
+        Короткая блокировка очереди на выдачу билета и сдвиг ее начала:
+        иначе начало могло бы сдвинуться за билет, ключ которого еще не записан.
+        Возвращает True, если блокировка получена.
+        """
+        key = f"{KEY_PREFIX}:queue:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.queue_lock_wait
+        while not (locked := self.cache.add(key, token, self.queue_lock_timeout)):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(self.queue_lock_interval)
+        try:
+            yield locked
+        finally:
+            if locked:
+                self.release([key], token)
+
+    def _advance_head(self):
+        """
+        Сдвигает начало очереди за билеты, которые уже обслужены или выбыли
+        (их ключи удалены или истекли), и возвращает его.
+        """
+        with self._queue_lock() as locked:
+            head = self._counter('head')
+            if not locked:
+                return head
+            tail = self._counter('tail')
+            while head < tail and self.cache.get(self._ticket_key(head + 1)) is None:
+                head = self._incr('head')
+            return head
+
+    def state(self):
+        """Текущая занятость: выполняется и ожидает (для логов и мониторинга)."""
+        return {
+            'running': len(self.cache.get_many(self._slot_keys())),
+            'slots': self.slots,
+            'waiting': max(0, self._counter('tail') - self._counter('head')),
+            'queue_length': self.queue_length,
+        }
+
+    def admit(self, user, wait=None, wait_for_user=False):
+        """
+        Допускает экспорт пользователя: занимает слот пользователя и общий
+        слот. Если слот достается не ему, выдает (или продлевает) билет
+        в очереди и ждет своей очереди не дольше wait секунд.
+
+        Args:
+            user (User): Пользователь, запросивший экспорт
+            wait (float): Сколько ждать слота; None — EXPORT_QUEUE_WAIT
+            wait_for_user (bool): Ждать и слота пользователя, если у него уже
+                идут экспорты (фоновые задачи), вместо немедленного 429
+
+        Returns:
+            ExportLease: Занятые слоты (контекстный менеджер)
+
+        Raises:
+            ExportRejected: Очередь заполнена, превышен лимит пользователя (429)
+                или экспорт все еще ожидает в очереди (503 с позицией)
+        """
+        deadline = time.monotonic() + (self.queue_wait if wait is None else wait)
+        while True:
+            try:
+                return self._try_admit(user)
+            except ExportRejected as rejection:
+                waiting = rejection.status == 503 or (wait_for_user and rejection.reason == 'user')
+                if not waiting or time.monotonic() + self.poll_interval > deadline:
+                    raise
+            time.sleep(self.poll_interval)
+
+    def _try_admit(self, user):
+        """Одна попытка допуска (см. admit); без слота — ExportRejected."""
+        # Значение ключей — владелец слотов: release не удалит чужой слот,
+        # если свой уже истек и был занят заново
+        token = uuid.uuid4().hex
+        lease_timeout = self.lease_timeout
+
+        user_key = self._take(self._user_keys(user), token, lease_timeout)
+        if user_key is None:
+            raise ExportRejected(
+                "У вас уже выполняется экспорт. Дождитесь его завершения и повторите попытку.",
+                retry_after=10,
+                reason='user',
+            )
+
+        user_ticket_key = self._user_ticket_key(user)
+        ticket = self.cache.get(user_ticket_key)
+        if ticket is not None and self.cache.get(self._ticket_key(ticket)) is None:
+            # Билет выбыл: запрос не повторили вовремя
+            ticket = None
+
+        head = self._advance_head()
+        if ticket is None:
+            # Без очереди слот занимается сразу; если в очереди уже ждут,
+            # новый экспорт встает за ними
+            ahead = max(0, self._counter('tail') - head)
+        else:
+            ahead = ticket - head - 1
+
+        # Слот достается тем, кто ближе к началу очереди
+        free = self.slots - len(self.cache.get_many(self._slot_keys()))
+        if ahead < free:
+            slot_key = self._take(self._slot_keys(), token, lease_timeout)
+            if slot_key is not None:
+                if ticket is not None:
+                    self.cache.delete_many([self._ticket_key(ticket), user_ticket_key])
+                    self._advance_head()
+                return ExportLease(self, [user_key, slot_key], token)
+        self.release([user_key], token)
+
+        if ticket is None:
+            with self._queue_lock() as locked:
+                if not locked:
+                    # Без блокировки начало очереди могло бы сдвинуться за новый билет
+                    raise ExportRejected(
+                        f"Очередь экспорта занята. Повторите запрос через {self.retry_after} с.",
+                        status=503,
+                        retry_after=self.retry_after,
+                        reason='queued',
+                    )
+                head = self._counter('head')
+                if self._counter('tail') - head >= self.queue_length:
+                    logger.warning(f"Очередь экспорта заполнена: {self.state()}")
+                    raise ExportRejected(
+                        "Сервер перегружен экспортом документов, очередь заполнена. Повторите попытку позже.",
+                        retry_after=self.retry_after * self.queue_length,
+                    )
+                ticket = self._incr('tail')
+                self.cache.set(self._ticket_key(ticket), user.pk, self.ticket_timeout)
+            logger.info(f"Экспорт пользователя {user.pk} поставлен в очередь, билет {ticket}")
+        else:
+            self.cache.touch(self._ticket_key(ticket), self.ticket_timeout)
+        self.cache.set(user_ticket_key, ticket, self.ticket_timeout)
+
+        position = ticket - head
+        raise ExportRejected(
+            f"Экспорт ожидает в очереди (позиция {position}). Повторите запрос через {self.retry_after} с.",
+            status=503,
+            retry_after=self.retry_after,
+            position=position,
+            reason='queued',
+        )
+
+
+export_admission = ExportAdmission()
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def fingerprint(*parts):
+    """
+    Возвращает SHA-256 от JSON-представления переданных частей ключа.
+    Значения, которые JSON не умеет сериализовать (даты, Decimal), приводятся к str.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def model_fingerprint_data(instance, exclude=('created_at', 'updated_at')):
+    """Собирает значения всех полей модели (кроме служебных) для ключа кэша."""
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+        if field.name not in exclude
+    }
+
+
+class ExportResultCache:
+    """
+    Дисковый кэш готовых файлов экспорта с адресацией по содержимому.
+
+    Ключ — отпечаток всего, от чего зависит результат, поэтому записи никогда
+    не устаревают и не требуют инвалидации. Суммарный размер ограничен:
+    при переполнении удаляются файлы, к которым дольше всего не обращались
+    (время обращения хранится в mtime файла).
+
+    Размер кэша процесс ведет сам (прибавляет размер каждой записи), а каталог
+    обходит только при превышении лимита и не чаще раза в rescan_interval
+    секунд, чтобы учесть записи других процессов. Вытеснение освобождает кэш
+    до evict_low_water от лимита, поэтому следующие записи не приводят
+    к новому обходу сразу.
+    """
+
+    # Имена настроек и подпись в логах; переопределяются в наследниках
+    directory_setting = 'EXPORT_CACHE_DIR'
+    max_bytes_setting = 'EXPORT_CACHE_MAX_BYTES'
+    default_dirname = 'gost_docs_export_cache'
+    label = 'Кэш экспорта'
+
+    # Доля лимита, до которой освобождается кэш при вытеснении
+    evict_low_water = 0.9
+    # Интервал (с) обязательного пересчета размера обходом каталога
+    rescan_interval = 300
+
+    def __init__(self, directory=None, max_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        # Размер кэша по последнему обходу плюс записи этого процесса;
+        # None — каталог еще не обходили
+        self._size = None
+        self._next_scan = 0
+
+    @property
+    def directory(self):
+        directory = self._directory or getattr(settings, self.directory_setting, None)
+        if not directory:
+            directory = os.path.join(tempfile.gettempdir(), self.default_dirname)
+        return str(directory)
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, self.max_bytes_setting, DEFAULT_MAX_BYTES)
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key[:2], f"{key}.{extension}")
+
+    def get(self, key, extension):
+        """
+        Возвращает содержимое файла из кэша или None.
+
+        Args:
+            key (str): Ключ (отпечаток) экспорта
+            extension (str): Формат файла ('docx', 'pdf')
+
+        Returns:
+            bytes: Содержимое файла или None при промахе
+        """
+        path = self._path(key, extension)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            # Отмечаем обращение для LRU-вытеснения
+            os.utime(path, None)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"{self.label}: не удалось прочитать файл {path}: {e}")
+            return None
+        logger.info(f"{self.label}: попадание {key[:12]}.{extension}")
+        return content
+
+    def put(self, key, extension, content):
+        """Сохраняет файл в кэш атомарно (через временный файл и os.replace)."""
+        path = self._path(key, extension)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"{self.label}: не удалось сохранить файл {path}: {e}")
+            return
+        logger.info(f"{self.label}: сохранено {key[:12]}.{extension} ({len(content)} байт)")
+
+        with self._lock:
+            if self._size is not None:
+                self._size += len(content) - replaced
+            scan_due = (
+                self._size is None
+                or self._size > self.max_bytes
+                or time.monotonic() >= self._next_scan
+            )
+        if scan_due:
+            self.evict()
+
+    def evict(self):
+        """
+        Пересчитывает размер кэша обходом каталога и, если лимит превышен,
+        удаляет наименее востребованные файлы до evict_low_water от лимита.
+        """
+        # Обход идет под отдельной блокировкой: параллельные записи только
+        # обновляют счетчик размера и не ждут окончания обхода
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.tmp'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total > self.max_bytes:
+                target = self.max_bytes * self.evict_low_water
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                        logger.info(f"{self.label}: вытеснен {os.path.basename(path)}")
+                    except OSError:
+                        pass
+
+            with self._lock:
+                self._size = total
+                self._next_scan = time.monotonic() + self.rescan_interval
+        finally:
+            self._evict_lock.release()
+
+export_cache = ExportResultCache()
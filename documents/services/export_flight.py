@@ -0,0 +1,119 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from documents.services.export_admission import ExportRejected
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'export_flight'
+
+# Счетчики: построено файлов, запросов получили чужой результат, запросов
+# не дождались результата и получили 503
+COUNTERS = ('leaders', 'coalesced', 'timeouts')
+
+
+class ExportSingleFlight:
+    """
+    Объединение одинаковых экспортов, выполняемых одновременно.
+
+    Первый запрос на ключ (тип и id документа, формат, версия документа)
+    занимает блокировку в общем кэше (cache.add) и строит файл, остальные
+    ждут, пока блокировка не снимется, и берут готовый файл из кэша
+    экспорта. Если первый запрос завершился ошибкой или его блокировка
+    истекла, файл строит следующий. Ожидающий не строит файл повторно, когда
+    его время ожидания вышло: он получает 503 с Retry-After, как при допуске.
+    Кэш тот же, что и у допуска экспортов (EXPORT_ADMISSION_CACHE), поэтому
+    объединение работает между процессами, если кэш общий.
+    """
+
+    poll_interval = 0.2
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'EXPORT_ADMISSION_CACHE', 'default')]
+
+    @property
+    def lock_timeout(self):
+        return getattr(settings, 'EXPORT_FLIGHT_LOCK_TIMEOUT', 600)
+
+    @property
+    def wait(self):
+        return getattr(settings, 'EXPORT_FLIGHT_WAIT', 10)
+
+    @property
+    def retry_after(self):
+        return getattr(settings, 'EXPORT_QUEUE_RETRY_AFTER', 5)
+
+    def _count(self, name):
+        key = f"{KEY_PREFIX}:stats:{name}"
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Счетчик вытеснен из кэша между add и incr
+            self.cache.add(key, 1, None)
+
+    def run(self, key, render, load, wait=None):
+        """
+        Выполняет render один раз на ключ для всех одновременных запросов.
+
+        Args:
+            key (str): Ключ экспорта (документ, формат, версия)
+            render (callable): Строит файл и сохраняет его туда, откуда читает load
+            load (callable): Возвращает готовый файл или None
+            wait (float): Сколько ждать чужой результат; None — EXPORT_FLIGHT_WAIT.
+                Фоновым построениям стоит ждать lock_timeout: за это время
+                блокировка либо снимется, либо истечет
+
+        Returns:
+            bytes: Содержимое файла
+
+        Raises:
+            ExportRejected: Файл все еще строит другой запрос (503)
+        """
+        lock_key = f"{KEY_PREFIX}:lock:{key}"
+        deadline = time.monotonic() + (self.wait if wait is None else wait)
+        while True:
+            token = uuid.uuid4().hex
+            if self.cache.add(lock_key, token, self.lock_timeout):
+                self._count('leaders')
+                try:
+                    return render()
+                finally:
+                    if self.cache.get(lock_key) == token:
+                        self.cache.delete(lock_key)
+
+            logger.info(f"Экспорт {key} уже выполняется, ожидаем его результат")
+            while self.cache.get(lock_key) is not None and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+
+            content = load()
+            if content is not None:
+                self._count('coalesced')
+                logger.info(f"Экспорт {key} объединен с уже выполнявшимся: {self.stats()}")
+                return content
+
+            if self.cache.get(lock_key) is not None and time.monotonic() >= deadline:
+                # Повторный рендеринг того же файла не ускорит ни один из запросов
+                self._count('timeouts')
+                logger.warning(f"Не дождались экспорта {key}, отвечаем 503")
+                raise ExportRejected(
+                    f"Документ уже экспортируется. Повторите запрос через {self.retry_after} с.",
+                    status=503,
+                    retry_after=self.retry_after,
+                    reason='queued',
+                )
+            # Первый запрос завершился без результата или его блокировка
+            # истекла: пробуем построить файл сами
+
+    def stats(self):
+        """Возвращает общие для всех процессов счетчики объединения."""
+        values = self.cache.get_many([f"{KEY_PREFIX}:stats:{name}" for name in COUNTERS])
+        return {name: values.get(f"{KEY_PREFIX}:stats:{name}", 0) for name in COUNTERS}
+
+
+export_flight = ExportSingleFlight()
@@ -0,0 +1,295 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker_process():
+    """Инициализация процесса пула: настраиваем Django в новом интерпретаторе."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+    from documents.services.pdf_backends import mark_export_worker_process
+    mark_export_worker_process()
+
+
+def run_export_job(job_id):
+    """
+    Выполняет задачу экспорта в потоке или процессе пула.
+
+    Задачу забирает тот, кто первым переведет ее из «В очереди» в «Выполняется»,
+    поэтому повторная постановка той же задачи не приводит к двойному рендерингу.
+    """
+    from documents.models import ExportJob
+    from documents.views.export import PdfConversionError, export_document, get_export_filename
+
+    close_old_connections()
+    try:
+        claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING).update(
+            status=ExportJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if not claimed:
+            logger.info(f"Задача экспорта {job_id} уже выполняется или завершена")
+            return
+
+        job = ExportJob.objects.select_related('document', 'owner').get(pk=job_id)
+        logger.info(f"Начата задача экспорта {job_id}: документ {job.document_id} в {job.format}")
+
+        # Задача проходит тот же допуск по бюджету памяти, что и синхронный
+        # экспорт, но ждет слота в воркере, а не в потоке веб-сервера
+        admission = {'user': job.owner, 'admission_wait': get_job_admission_wait()}
+        extension = job.format
+        try:
+            content, export_key = export_document(job.document, job.format, **admission)
+        except PdfConversionError as pdf_error:
+            # Как и синхронный экспорт, при недоступной конвертации отдаем DOCX
+            logger.warning(f"Задача экспорта {job_id}: {pdf_error}. Возвращаем DOCX")
+            extension = 'docx'
+            content, export_key = export_document(job.document, extension, **admission)
+
+        job.export_key = export_key
+        job.filename = get_export_filename(job.document, extension)
+        job.file.save(job.filename, ContentFile(content), save=False)
+        job.status = ExportJob.STATUS_DONE
+        job.finished_at = timezone.now()
+        job.save(update_fields=['export_key', 'filename', 'file', 'status', 'finished_at'])
+        logger.info(f"Задача экспорта {job_id} завершена ({len(content)} байт)")
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении задачи экспорта {job_id}: {e}", exc_info=True)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def get_job_admission_wait():
+    """Сколько секунд задача ждет допуска export_admission, прежде чем завершиться ошибкой."""
+    return getattr(settings, 'EXPORT_JOB_ADMISSION_WAIT', 5 * 60)
+
+
+def get_job_lease():
+    """Сколько секунд задача может выполняться, прежде чем она считается прерванной."""
+    return getattr(settings, 'EXPORT_JOB_LEASE', 15 * 60)
+
+
+def fail_job(job_id, error):
+    """
+    Помечает задачу ошибочной, если она еще в очереди или выполняется.
+
+    Returns:
+        bool: True, если статус задачи изменен
+    """
+    from documents.models import ExportJob
+
+    return bool(ExportJob.objects.filter(
+        pk=job_id, status__in=(ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING)
+    ).update(status=ExportJob.STATUS_FAILED, error=error, finished_at=timezone.now()))
+
+
+def fail_stale_jobs(queryset=None):
+    """
+    Помечает ошибочными задачи, которые выполняются дольше EXPORT_JOB_LEASE:
+    их воркер завершился аварийно (например, был убит при нехватке памяти)
+    вместе с процессом, который мог бы отметить ошибку.
+
+    Args:
+        queryset (QuerySet): Задачи для проверки; по умолчанию все
+
+    Returns:
+        int: Число помеченных задач
+    """
+    from documents.models import ExportJob
+
+    if queryset is None:
+        queryset = ExportJob.objects.all()
+    cutoff = timezone.now() - timedelta(seconds=get_job_lease())
+    count = queryset.filter(status=ExportJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+        status=ExportJob.STATUS_FAILED,
+        error="Задача прервана: воркер экспорта не завершил ее за отведенное время",
+        finished_at=timezone.now(),
+    )
+    if count:
+        logger.warning(f"Помечено прерванных задач экспорта: {count}")
+    return count
+
+
+def cleanup_export_jobs():
+    """
+    Удаляет завершенные задачи старше EXPORT_JOBS_RETENTION секунд вместе
+    с их файлами в EXPORT_JOBS_DIR.
+
+    Returns:
+        int: Число удаленных задач
+    """
+    from documents.models import ExportJob
+
+    retention = getattr(settings, 'EXPORT_JOBS_RETENTION', 24 * 60 * 60)
+    expired = ExportJob.objects.filter(
+        status__in=(ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED),
+        created_at__lt=timezone.now() - timedelta(seconds=retention),
+    )
+    count = 0
+    for job in expired.only('pk', 'file'):
+        if job.file:
+            try:
+                job.file.delete(save=False)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить файл задачи экспорта {job.pk}: {e}")
+                continue
+        job.delete()
+        count += 1
+    if count:
+        logger.info(f"Удалено устаревших задач экспорта: {count}")
+    return count
+
+
+class ExportWorkerPool:
+    """
+    Локальный пул воркеров экспорта без внешнего брокера.
+
+    По умолчанию используются процессы (EXPORT_WORKER_BACKEND = 'process'),
+    так как рендеринг DOCX упирается в GIL; число воркеров задает EXPORT_WORKERS.
+    Очередь — сама таблица ExportJob: при первом обращении пул подхватывает
+    задачи, оставшиеся в очереди после перезапуска процесса. Задачи, воркер
+    которых завершился аварийно, помечаются ошибочными, а старые задачи и их
+    файлы периодически удаляются (не чаще раза в EXPORT_JOBS_CLEANUP_INTERVAL).
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._resumed = False
+        self._next_cleanup = 0
+
+    @property
+    def max_workers(self):
+        return getattr(settings, 'EXPORT_WORKERS', None) or os.cpu_count() or 2
+
+    def _create_executor(self):
+        backend = getattr(settings, 'EXPORT_WORKER_BACKEND', 'process')
+        if backend == 'thread':
+            logger.info(f"Запуск пула экспорта: {self.max_workers} потоков")
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='export-worker')
+
+        logger.info(f"Запуск пула экспорта: {self.max_workers} процессов")
+        # spawn, а не fork: веб-сервер многопоточный, и копировать его блокировки нельзя
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker_process,
+        )
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _job_done(self, job_id, future):
+        """
+        Помечает задачу ошибочной, если future завершился исключением: ошибки
+        рендеринга run_export_job обрабатывает сам, так что сюда попадают
+        аварийное завершение процесса воркера (BrokenProcessPool) и отмена.
+        """
+        try:
+            error = future.exception()
+        except CancelledError:
+            error = "задача отменена при перезапуске пула"
+        if error is None:
+            return
+        logger.error(f"Воркер задачи экспорта {job_id} завершился с ошибкой: {error}")
+        try:
+            fail_job(job_id, f"Воркер экспорта завершился аварийно: {error}")
+        except Exception as e:
+            logger.error(f"Не удалось отметить ошибку задачи экспорта {job_id}: {e}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    def _submit_job(self, job_id):
+        self._get_executor().submit(run_export_job, job_id).add_done_callback(partial(self._job_done, job_id))
+
+    def submit(self, job_id):
+        """Ставит задачу экспорта в пул; если пул недоступен, помечает задачу ошибочной."""
+        from documents.models import ExportJob
+
+        self._maintain()
+        try:
+            self._resume_pending(exclude=job_id)
+            try:
+                self._submit_job(job_id)
+            except BrokenProcessPool:
+                logger.warning("Пул процессов экспорта поврежден, пересоздаем")
+                self._reset_executor()
+                self._submit_job(job_id)
+        except Exception as e:
+            logger.error(f"Не удалось поставить задачу экспорта {job_id} в пул: {e}", exc_info=True)
+            ExportJob.objects.filter(pk=job_id).update(
+                status=ExportJob.STATUS_FAILED, error=str(e), finished_at=timezone.now()
+            )
+
+    def submit_call(self, fn, *args):
+        """
+        Выполняет в пуле произвольную функцию уровня модуля и возвращает Future.
+        Для пула процессов функция и аргументы должны сериализоваться pickle.
+        """
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning("Пул процессов экспорта поврежден, пересоздаем")
+            self._reset_executor()
+            return self._get_executor().submit(fn, *args)
+
+    def _resume_pending(self, exclude=None):
+        if self._resumed:
+            return
+        self._resumed = True
+
+        from documents.models import ExportJob
+
+        pending = ExportJob.objects.filter(status=ExportJob.STATUS_PENDING).exclude(pk=exclude)
+        for job_id in pending.values_list('pk', flat=True):
+            logger.info(f"Возобновлена задача экспорта {job_id} из очереди")
+            self._submit_job(job_id)
+
+    def _maintain(self):
+        """Помечает прерванные задачи и удаляет устаревшие (не чаще раза в интервал)."""
+        with self._lock:
+            if time.monotonic() < self._next_cleanup:
+                return
+            self._next_cleanup = time.monotonic() + getattr(settings, 'EXPORT_JOBS_CLEANUP_INTERVAL', 60 * 60)
+        try:
+            fail_stale_jobs()
+            cleanup_export_jobs()
+        except Exception as e:
+            logger.error(f"Ошибка обслуживания задач экспорта: {e}", exc_info=True)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+export_pool = ExportWorkerPool()
@@ -0,0 +1,108 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from documents.services.export_jobs import export_pool
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'export_warmup'
+
+
+def warm_export(kind, pk, generation):
+    """
+    Строит файлы экспорта документа в воркере пула, чтобы к моменту
+    скачивания они уже были в кэше экспорта.
+
+    Рендеринг пропускается, если после постановки документ сохранили еще раз
+    (в кэше уже более новое поколение). Поколение проверяется и перед каждым
+    форматом. Если кэш допуска не общий с процессом пула, поколение здесь
+    неизвестно, и проверка остается только в веб-процессе.
+    """
+    from documents.services.export_adapters import get_export_adapter
+    from documents.views.export import PdfConversionError, export_document
+
+    close_old_connections()
+    try:
+        document = get_export_adapter(kind).get_queryset().filter(pk=pk).first()
+        if document is None:
+            return
+        for export_format in export_warmup.formats:
+            if export_warmup.is_stale(kind, pk, generation):
+                logger.info(f"Прогрев экспорта {kind} {pk} отменен: документ сохранен повторно")
+                return
+            try:
+                export_document(document, export_format)
+            except PdfConversionError as pdf_error:
+                logger.warning(f"Прогрев PDF документа {kind} {pk} пропущен: {pdf_error}")
+                continue
+            logger.info(f"Экспорт {kind} {pk} в {export_format} прогрет")
+    except Exception as e:
+        logger.error(f"Ошибка прогрева экспорта {kind} {pk}: {e}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+class ExportWarmup:
+    """
+    Прогрев экспорта после сохранения документа (EXPORT_WARM_AHEAD).
+
+    Каждое сохранение увеличивает поколение документа в кэше
+    EXPORT_ADMISSION_CACHE и через EXPORT_WARM_AHEAD_DELAY секунд ставит
+    рендеринг в пул экспорта, только если за это время не было нового
+    сохранения. Поэтому серия быстрых сохранений дает один рендеринг, а
+    рендеринг устаревшей версии отбрасывается.
+    """
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'EXPORT_ADMISSION_CACHE', 'default')]
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'EXPORT_WARM_AHEAD', False)
+
+    @property
+    def delay(self):
+        return getattr(settings, 'EXPORT_WARM_AHEAD_DELAY', 5)
+
+    @property
+    def formats(self):
+        return getattr(settings, 'EXPORT_WARM_AHEAD_FORMATS', ('docx',))
+
+    def _generation_key(self, kind, pk):
+        return f"{KEY_PREFIX}:{kind}:{pk}"
+
+    def is_stale(self, kind, pk, generation):
+        current = self.cache.get(self._generation_key(kind, pk))
+        return current is not None and current != generation
+
+    def schedule(self, kind, pk):
+        """Отмечает новое сохранение документа и откладывает его прогрев."""
+        key = self._generation_key(kind, pk)
+        self.cache.add(key, 0, None)
+        try:
+            generation = self.cache.incr(key)
+        except ValueError:
+            # Ключ вытеснен из кэша между add и incr
+            generation = 1
+            self.cache.set(key, generation, None)
+
+        timer = threading.Timer(self.delay, self._submit, args=(kind, pk, generation))
+        timer.daemon = True
+        timer.start()
+
+    def _submit(self, kind, pk, generation):
+        if self.is_stale(kind, pk, generation):
+            logger.info(f"Прогрев экспорта {kind} {pk} объединен с более поздним сохранением")
+            return
+        try:
+            export_pool.submit_call(warm_export, kind, pk, generation)
+        except Exception as e:
+            logger.error(f"Не удалось поставить прогрев экспорта {kind} {pk} в пул: {e}", exc_info=True)
+
+
+export_warmup = ExportWarmup()
@@ -0,0 +1,202 @@
+import base64
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from docx.shared import Twips
+from lxml import etree
+from lxml import html as lxml_html
+
+from documents.services.docx_formatting import BODY_FORMAT, HEADING_SIZES
+from documents.services.ooxml_emitter import get_picture_width
+from documents.services.pdf_backends import PdfBackendError
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = 'pdf/fast_export.html'
+
+# Поля страницы по ГОСТ (см), как у DOCX
+PAGE_MARGINS = {'left': 3.0, 'right': 1.0, 'top': 2.0, 'bottom': 2.0}
+
+# Шрифты с кириллицей: Times New Roman, метрически совместимый Liberation Serif
+# и DejaVu Serif как запасной вариант. Пути к начертаниям:
+# обычное, полужирное, курсив, полужирный курсив
+FONT_CANDIDATES = (
+    (
+        '/usr/share/fonts/truetype/msttcorefonts/Times_New_Roman.ttf',
+        '/usr/share/fonts/truetype/msttcorefonts/Times_New_Roman_Bold.ttf',
+        '/usr/share/fonts/truetype/msttcorefonts/Times_New_Roman_Italic.ttf',
+        '/usr/share/fonts/truetype/msttcorefonts/Times_New_Roman_Bold_Italic.ttf',
+    ),
+    (
+        'C:/Windows/Fonts/times.ttf',
+        'C:/Windows/Fonts/timesbd.ttf',
+        'C:/Windows/Fonts/timesi.ttf',
+        'C:/Windows/Fonts/timesbi.ttf',
+    ),
+    (
+        '/usr/share/fonts/truetype/liberation/LiberationSerif-Regular.ttf',
+        '/usr/share/fonts/truetype/liberation/LiberationSerif-Bold.ttf',
+        '/usr/share/fonts/truetype/liberation/LiberationSerif-Italic.ttf',
+        '/usr/share/fonts/truetype/liberation/LiberationSerif-BoldItalic.ttf',
+    ),
+    (
+        '/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSerif-Italic.ttf',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSerif-BoldItalic.ttf',
+    ),
+)
+
+# Ширина области текста (пункты): изображения шире уменьшаются до нее
+CONTENT_WIDTH_PT = (21.0 - PAGE_MARGINS['left'] - PAGE_MARGINS['right']) / 2.54 * 72
+
+# Элементы HTML из CKEditor, через которые xhtml2pdf загрузил бы внешние
+# ресурсы или изменил оформление всего документа; удаляются вместе с содержимым
+UNSAFE_TAGS = ('link', 'style', 'meta', 'base', 'script')
+
+# Ответ link_callback на запрещенный адрес: пустая таблица стилей вместо
+# загрузки (изображение по такому адресу просто не выводится)
+REFUSED_URI = 'data:text/css;base64,IA=='
+
+
+def get_font_faces():
+    """
+    Возвращает начертания шрифта для @font-face: первое семейство из
+    EXPORT_FAST_PDF_FONTS (или FONT_CANDIDATES), у которого есть обычное
+    начертание. Отсутствующие начертания заменяются обычным.
+    """
+    candidates = getattr(settings, 'EXPORT_FAST_PDF_FONTS', None) or FONT_CANDIDATES
+    for family in candidates:
+        regular = family[0]
+        if not os.path.exists(regular):
+            continue
+        faces = []
+        for (bold, italic), path in zip(((False, False), (True, False), (False, True), (True, True)), family):
+            faces.append({'path': path if os.path.exists(path) else regular, 'bold': bold, 'italic': italic})
+        return faces
+    raise PdfBackendError("Не найден шрифт с кириллицей для PDF (настройка EXPORT_FAST_PDF_FONTS)")
+
+
+def _half_points(value):
+    return int(value) / 2
+
+
+def _data_uri(image):
+    return f"data:{image.content_type};base64,{base64.b64encode(image.content).decode('ascii')}"
+
+
+def _make_link_callback(allowed_uris):
+    """
+    link_callback для xhtml2pdf: разрешены только адреса из allowed_uris
+    (подготовленные data URL изображений и файлы шрифтов), остальные
+    отклоняются, чтобы HTML документа не заставил сервер обращаться к сети
+    или читать локальные файлы.
+    """
+    def link_callback(uri, rel):
+        if uri in allowed_uris:
+            return uri
+        logger.warning(f"Быстрый PDF: отклонена загрузка ресурса {str(uri)[:100]}")
+        return REFUSED_URI
+    return link_callback
+
+
+def prepare_content(html_content, images, placeholder, allowed_uris=None):
+    """
+    Готовит HTML из CKEditor для xhtml2pdf: изображения подставляются как
+    data URL уже подготовленных байтов с размером в пунктах (не шире
+    области текста), а недоступные заменяются текстом-заглушкой. Элементы
+    UNSAFE_TAGS и атрибуты style со ссылками url() удаляются.
+
+    Args:
+        html_content (str): HTML основной части
+        images (dict): src -> CachedImage
+        placeholder (callable): src -> текст вместо недоступного изображения
+        allowed_uris (set): Сюда добавляются data URL подставленных изображений
+
+    Returns:
+        str: HTML для вставки в шаблон
+    """
+    if not html_content:
+        return ''
+    root = lxml_html.fragment_fromstring(html_content, create_parent='div')
+    for element in list(root.iter(*UNSAFE_TAGS)):
+        element.drop_tree()
+    for element in root.iter(etree.Element):
+        if 'url(' in element.get('style', '').lower():
+            del element.attrib['style']
+    for img in list(root.iter('img')):
+        src = img.get('src', '')
+        image = images.get(src)
+        if image is None:
+            span = etree.Element('span')
+            span.text = placeholder(src)
+            span.tail = img.tail
+            img.getparent().replace(img, span)
+            continue
+        img.attrib.clear()
+        data_uri = _data_uri(image)
+        img.set('src', data_uri)
+        if allowed_uris is not None:
+            allowed_uris.add(data_uri)
+        if image.width and image.height:
+            width = get_picture_width(image)
+            width_pt = min(width.pt if width is not None else image.width, CONTENT_WIDTH_PT)
+            img.set('width', f"{width_pt:.0f}")
+            img.set('height', f"{width_pt * image.height / image.width:.0f}")
+    return ''.join(
+        [root.text or ''] + [lxml_html.tostring(child, encoding='unicode') for child in root]
+    )
+
+
+def render_pdf(title_context, html_content, images, placeholder):
+    """
+    Строит PDF напрямую из HTML через xhtml2pdf и печатную таблицу стилей
+    по ГОСТ: поля страницы, шрифт, размеры, абзацный отступ, полуторный
+    интервал и номер страницы внизу по центру (кроме титульного листа).
+    Результат не повторяет DOCX один в один и предназначен для просмотра
+    и черновиков. Внешние ресурсы не загружаются: xhtml2pdf получает только
+    подготовленные изображения и файлы шрифтов (см. _make_link_callback).
+
+    Args:
+        title_context (dict): Контекст титульного листа (как для DocxTemplate)
+        html_content (str): HTML основной части
+        images (dict): src -> CachedImage
+        placeholder (callable): src -> текст вместо недоступного изображения
+
+    Returns:
+        bytes: Содержимое PDF файла
+    """
+    try:
+        from xhtml2pdf import pisa
+    except ImportError as e:
+        raise PdfBackendError("Для быстрого PDF нужен пакет xhtml2pdf") from e
+
+    font_faces = get_font_faces()
+    allowed_uris = {face['path'] for face in font_faces}
+    content = prepare_content(html_content, images, placeholder, allowed_uris)
+    document_html = render_to_string(TEMPLATE_NAME, {
+        'title': title_context,
+        'content': mark_safe(content),
+        'font_faces': font_faces,
+        'page': PAGE_MARGINS,
+        'body': {
+            'size': _half_points(BODY_FORMAT['run']['size']),
+            'line_height': int(BODY_FORMAT['paragraph']['line'][0]) / 240,
+            'indent': round(Twips(BODY_FORMAT['paragraph']['first_line']).cm, 2),
+        },
+        'headings': {level: _half_points(size) for level, size in HEADING_SIZES.items()},
+    })
+
+    output = io.BytesIO()
+    status = pisa.CreatePDF(
+        document_html, dest=output, encoding='utf-8', link_callback=_make_link_callback(allowed_uris),
+    )
+    if status.err:
+        raise PdfBackendError(f"Ошибка при создании PDF: {status.err} ошибок xhtml2pdf")
+    pdf_content = output.getvalue()
+    logger.info(f"Быстрый PDF создан: {len(pdf_content)} байт")
+    return pdf_content
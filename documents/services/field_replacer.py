@@ -0,0 +1,132 @@
+import bisect
+import logging
+import re
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+
+logger = logging.getLogger(__name__)
+
+# Части с текстом, кроме основной: колонтитулы и сноски
+STORY_RELTYPES = (RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES)
+
+_W_P = qn('w:p')
+_W_T = qn('w:t')
+_XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+
+def _text_nodes(paragraph):
+    """
+    Элементы w:t абзаца по порядку, включая гиперссылки и поля. Вложенные
+    абзацы (надписи внутри прогонов) пропускаются: они обрабатываются отдельно.
+    """
+    nodes = []
+    stack = list(reversed(paragraph))
+    while stack:
+        element = stack.pop()
+        if element.tag == _W_T:
+            nodes.append(element)
+        elif element.tag != _W_P:
+            stack.extend(reversed(element))
+    return nodes
+
+
+def _set_text(node, text):
+    node.text = text
+    if text != text.strip():
+        node.set(_XML_SPACE, 'preserve')
+
+
+class FieldReplacer:
+    """
+    Замена полей шаблона за один проход по документу.
+
+    Все поля собираются в одно регулярное выражение (более длинные имена
+    проверяются первыми). Каждый абзац тела, таблиц, надписей, колонтитулов
+    и сносок просматривается один раз. Поле, разбитое на несколько прогонов,
+    заменяется на месте: значение записывается в прогон, где поле начинается,
+    а остальные части поля удаляются из своих прогонов. Прогоны и их
+    форматирование сохраняются.
+
+    Attributes:
+        replacements (dict): Поле -> строка замены
+        pattern (Pattern): Объединенное выражение для всех полей
+    """
+
+    def __init__(self, replacements):
+        self.replacements = {
+            field: '' if value is None else str(value)
+            for field, value in replacements.items()
+            if field
+        }
+        fields = sorted(self.replacements, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(map(re.escape, fields))) if fields else None
+
+    def replace(self, document):
+        """
+        Заменяет поля во всем документе.
+
+        Args:
+            document (Document): Документ python-docx
+
+        Returns:
+            int: Число замененных полей
+        """
+        if self.pattern is None:
+            return 0
+        count = self.replace_in(document.element.body)
+        seen = set()
+        for rel in document.part.rels.values():
+            if rel.is_external or rel.reltype not in STORY_RELTYPES:
+                continue
+            part = rel.target_part
+            if id(part) in seen or not hasattr(part, 'element'):
+                continue
+            seen.add(id(part))
+            count += self.replace_in(part.element)
+        logger.info(f"Заменено полей: {count}")
+        return count
+
+    def replace_in(self, root):
+        """Заменяет поля во всех абзацах элемента root. Возвращает число замен."""
+        count = 0
+        for paragraph in root.iter(_W_P):
+            nodes = _text_nodes(paragraph)
+            if not nodes:
+                continue
+            texts = [node.text or '' for node in nodes]
+            full_text = ''.join(texts)
+            matches = list(self.pattern.finditer(full_text))
+            if not matches:
+                continue
+
+            # Начало каждого w:t в общем тексте абзаца
+            starts = []
+            position = 0
+            for text in texts:
+                starts.append(position)
+                position += len(text)
+
+            # С конца, чтобы смещения еще не обработанных полей не менялись
+            for match in reversed(matches):
+                start, end = match.span()
+                # w:t, в которых лежат первый и последний символы поля
+                index = bisect.bisect_right(starts, start) - 1
+                last = bisect.bisect_right(starts, end - 1) - 1
+
+                value = self.replacements[match.group()]
+                head = texts[index][:start - starts[index]]
+                tail = texts[last][end - starts[last]:]
+                if last == index:
+                    texts[index] = head + value + tail
+                else:
+                    texts[index] = head + value
+                    for middle in range(index + 1, last):
+                        texts[middle] = ''
+                    texts[last] = tail
+                count += 1
+
+            for node, text in zip(nodes, texts):
+                if text != (node.text or ''):
+                    _set_text(node, text)
+        return count
@@ -0,0 +1,162 @@
+import copy
+import io
+import logging
+import mimetypes
+import posixpath
+import zipfile
+
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.rel import Relationships
+from docx.oxml.ns import nsmap, qn
+from docx.oxml.parser import parse_xml
+from docx.parts.image import ImagePart
+from lxml import etree
+
+from documents.services.export_cache import ExportResultCache
+
+logger = logging.getLogger(__name__)
+
+_RELS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_TYPES_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+_REL_ATTRS = etree.XPath(f".//@*[namespace-uri()='{nsmap['r']}']")
+
+# Пространства имен, объявляемые в document.xml фрагмента
+_DOCUMENT_NAMESPACES = ('w', 'r', 'wp', 'a', 'pic', 'w14', 'm')
+
+
+class FragmentCache(ExportResultCache):
+    """
+    Дисковый кэш DOCX-фрагментов отдельных разделов документа.
+
+    Ключ — отпечаток HTML раздела и профиля оформления (версия кода,
+    стандарт, настройки преобразования), поэтому правка одного раздела
+    меняет ключ только этого раздела, а остальные берутся из кэша.
+    Счетчики попаданий и промахов накапливаются за время жизни процесса.
+    """
+
+    directory_setting = 'EXPORT_FRAGMENT_CACHE_DIR'
+    max_bytes_setting = 'EXPORT_FRAGMENT_CACHE_MAX_BYTES'
+    default_dirname = 'gost_docs_fragment_cache'
+    label = 'Кэш фрагментов'
+
+    def __init__(self, directory=None, max_bytes=None):
+        super().__init__(directory, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get_fragment(self, key):
+        """Возвращает DOCX фрагмента или None при промахе."""
+        content = self.get(key, 'docx')
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put_fragment(self, key, content):
+        self.put(key, 'docx', content)
+
+    def stats(self):
+        """Возвращает счётчики попаданий и промахов кэша."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+fragment_cache = FragmentCache()
+
+
+def pack_fragment(document, elements):
+    """
+    Упаковывает элементы тела документа в минимальный DOCX: document.xml,
+    его связи и изображения. Стилей, нумерации и темы во фрагменте нет —
+    он рассчитан на вставку в документ с тем же набором стилей, поэтому
+    чтение не требует разбора всего пакета python-docx.
+
+    Args:
+        document (Document): Документ, в котором созданы элементы
+        elements (list): Элементы w:p / w:tbl
+
+    Returns:
+        bytes: Содержимое DOCX
+    """
+    namespaces = ' '.join(f'xmlns:{prefix}="{nsmap[prefix]}"' for prefix in _DOCUMENT_NAMESPACES)
+    root = etree.fromstring(f'<w:document {namespaces}><w:body/></w:document>')
+    body = root[0]
+    for element in elements:
+        body.append(copy.deepcopy(element))
+
+    rels = etree.Element(f'{{{_RELS_NS}}}Relationships', nsmap={None: _RELS_NS})
+    media = {}
+    for rId in dict.fromkeys(str(attr) for attr in _REL_ATTRS(body)):
+        rel = document.part.rels.get(rId)
+        if rel is None:
+            continue
+        attributes = {'Id': rId, 'Type': rel.reltype}
+        if rel.is_external:
+            attributes.update(Target=rel.target_ref, TargetMode='External')
+        elif rel.reltype == RT.IMAGE:
+            part = rel.target_part
+            name = f"media/{rId}{posixpath.splitext(part.partname)[1]}"
+            media[name] = part
+            attributes['Target'] = name
+        else:
+            continue
+        etree.SubElement(rels, f'{{{_RELS_NS}}}Relationship', attributes)
+
+    types = etree.Element(f'{{{_TYPES_NS}}}Types', nsmap={None: _TYPES_NS})
+    etree.SubElement(types, f'{{{_TYPES_NS}}}Default', Extension='rels', ContentType=CT.OPC_RELATIONSHIPS)
+    etree.SubElement(types, f'{{{_TYPES_NS}}}Default', Extension='xml', ContentType=CT.XML)
+    for name, part in media.items():
+        etree.SubElement(types, f'{{{_TYPES_NS}}}Override', PartName=f'/word/{name}', ContentType=part.content_type)
+    etree.SubElement(types, f'{{{_TYPES_NS}}}Override', PartName='/word/document.xml', ContentType=CT.WML_DOCUMENT_MAIN)
+
+    package_rels = etree.Element(f'{{{_RELS_NS}}}Relationships', nsmap={None: _RELS_NS})
+    etree.SubElement(package_rels, f'{{{_RELS_NS}}}Relationship',
+                     Id='rId1', Type=RT.OFFICE_DOCUMENT, Target='word/document.xml')
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', etree.tostring(types, xml_declaration=True, encoding='UTF-8'))
+        package.writestr('_rels/.rels', etree.tostring(package_rels, xml_declaration=True, encoding='UTF-8'))
+        package.writestr('word/document.xml', etree.tostring(root, xml_declaration=True, encoding='UTF-8'))
+        package.writestr('word/_rels/document.xml.rels', etree.tostring(rels, xml_declaration=True, encoding='UTF-8'))
+        for name, part in media.items():
+            # Изображения уже сжаты, повторное сжатие только тратит время
+            package.writestr(f'word/{name}', part.blob, compress_type=zipfile.ZIP_STORED)
+    return output.getvalue()
+
+
+def unpack_fragment(content):
+    """
+    Читает фрагмент, созданный pack_fragment.
+
+    Returns:
+        tuple: (элементы тела, Relationships со связями элементов)
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        root = parse_xml(package.read('word/document.xml'))
+        rels_root = etree.fromstring(package.read('word/_rels/document.xml.rels'))
+        content_types = {
+            override.get('PartName'): override.get('ContentType')
+            for override in etree.fromstring(package.read('[Content_Types].xml'))
+            if override.get('PartName')
+        }
+
+        rels = Relationships('/word')
+        for rel in rels_root:
+            rId, reltype, target = rel.get('Id'), rel.get('Type'), rel.get('Target')
+            if rel.get('TargetMode') == 'External':
+                rels.add_relationship(reltype, target, rId, is_external=True)
+                continue
+            partname = f'/word/{target}'
+            content_type = content_types.get(partname) or mimetypes.guess_type(target)[0] or ''
+            part = ImagePart(PackURI(partname), content_type, package.read(f'word/{target}'))
+            rels.add_relationship(reltype, part, rId)
+
+    body = root.find(qn('w:body'))
+    return list(body), rels
@@ -0,0 +1,372 @@
+import logging
+import re
+
+import lxml.html
+from bs4 import BeautifulSoup
+from htmldocx.h2d import HtmlToDocx
+
+logger = logging.getLogger(__name__)
+
+# Отступы из style, которые переносятся в DOCX
+TEXT_INDENT_RE = re.compile(r'text-indent:\s*([0-9.]+)(px|em|cm|mm|pt)')
+MARGIN_LEFT_RE = re.compile(r'margin-left:\s*([0-9.]+)(px|em|cm|mm|pt)')
+
+# Стандартный отступ абзаца с классом has-indent
+CLASS_INDENT = ('1.25', 'cm')
+
+# Разделитель текстовых узлов (комментарии и т.п.): текст по обе стороны
+# от него передается в htmldocx отдельными вызовами handle_data
+_BREAK = ('break',)
+
+# Служебные атрибуты, которыми разбор помечает элементы дерева:
+# номер изображения в ParsedHtml.images и ключ абзаца в ParsedHtml.paragraphs
+IMAGE_INDEX_ATTR = 'data-export-image'
+PARAGRAPH_KEY_ATTR = 'data-export-paragraph'
+
+
+def convert_to_cm(value, unit):
+    """
+    Преобразует значение из различных единиц измерения в сантиметры.
+    
+    Args:
+        value (float): Числовое значение
+        unit (str): Единица измерения (px, em, cm, mm, pt)
+        
+    Returns:
+        float: Значение в сантиметрах
+    """
+    if unit == 'cm':
+        return value
+    elif unit == 'mm':
+        return value / 10.0
+    elif unit == 'pt':
+        return value * 0.0352778  # 1 pt = 0.0352778 см
+    elif unit == 'px':
+        return value * 0.0264583  # Примерно 96 px = 2.54 см
+    elif unit == 'em':
+        return value * 0.42333  # Примерно 1 em = 12pt = 0.42333 см
+    else:
+        # По умолчанию предполагаем пиксели
+        return value * 0.0264583
+
+
+class ParsedHtml:
+    """
+    Результат однократного разбора HTML из CKEditor.
+
+    Attributes:
+        root (HtmlElement): Элемент body разобранного дерева (или None для пустого HTML);
+            изображения и абзацы с отступами помечены служебными атрибутами
+        events (list): Поток событий для htmldocx: ('start', tag, attrs, key, element),
+            ('end', tag, element), ('data', text), ('img', index) и разделители
+        images (list): src всех изображений в порядке следования
+        paragraphs (dict): Ключ абзаца -> отступы и число ведущих неразрывных пробелов
+    """
+
+    def __init__(self):
+        self.root = None
+        self.events = []
+        self.images = []
+        self.paragraphs = {}
+        self._table_images = []
+
+    def segments(self, resolved, placeholder):
+        """
+        Разбивает поток событий на части по вставляемым изображениям.
+
+        Каждая текстовая часть отдается отдельному экземпляру htmldocx, как
+        если бы HTML был разрезан по месту изображения: элементы, открытые
+        в части, закрываются в ее конце, а их закрывающие теги в следующих
+        частях пропускаются. Изображения, которые не удалось получить,
+        заменяются текстом-заглушкой.
+
+        Args:
+            resolved (set): Индексы изображений, которые будут вставлены
+            placeholder (callable): src -> текст заглушки
+
+        Yields:
+            tuple: ('html', (events, tables)) или ('image', index)
+        """
+        open_elements = []  # (element, tag, номер части)
+        segment_no = 0
+        events = []
+        data = []
+        has_tags = False
+
+        def flush_data():
+            if data:
+                text = ''.join(data)
+                data.clear()
+                if text:
+                    events.append(('data', text))
+
+        def finish_segment():
+            flush_data()
+            for element, tag, opened_in in reversed(open_elements):
+                if opened_in == segment_no:
+                    events.append(('end', tag, element))
+            has_content = has_tags or any(event[1].strip() for event in events if event[0] == 'data')
+            return has_content
+
+        for event in self.events:
+            kind = event[0]
+            if kind == 'data':
+                data.append(event[1])
+            elif kind == 'break':
+                flush_data()
+            elif kind == 'img':
+                index = event[1]
+                if index not in resolved:
+                    data.append(placeholder(self.images[index]))
+                    continue
+                if finish_segment():
+                    yield 'html', (events, self._tables_in(events))
+                yield 'image', index
+                segment_no += 1
+                events = []
+                has_tags = False
+            elif kind == 'start':
+                flush_data()
+                has_tags = True
+                open_elements.append((event[4], event[1], segment_no))
+                events.append(event)
+            elif kind == 'end':
+                has_tags = True
+                element, tag, opened_in = open_elements.pop()
+                # Если элемент открыт в одной из прошлых частей, его закрывающий
+                # тег «осиротел» и пропускается, а текст вокруг него сливается
+                if opened_in == segment_no:
+                    flush_data()
+                    events.append(event)
+
+        if finish_segment():
+            yield 'html', (events, self._tables_in(events))
+
+    def _tables_in(self, events):
+        """
+        Таблицы верхнего уровня части в виде BeautifulSoup (так их ожидает htmldocx).
+        Изображения из таблиц удаляются: они вставляются после таблицы.
+        """
+        tables = []
+        depth = 0
+        for event in events:
+            if event[0] == 'start' and event[1] == 'table':
+                if depth == 0:
+                    table_html = lxml.html.tostring(event[4], encoding='unicode', with_tail=False)
+                    table = BeautifulSoup(table_html, 'html.parser').table
+                    for img in table.find_all('img'):
+                        img.decompose()
+                    tables.append(table)
+                depth += 1
+            elif event[0] == 'end' and event[1] == 'table':
+                depth -= 1
+        return tables
+
+
+def _paragraph_info(element):
+    """Отступы абзаца из атрибутов style и class (или None, если их нет)."""
+    style = element.get('style', '')
+    text_indent = TEXT_INDENT_RE.search(style)
+    margin_left = MARGIN_LEFT_RE.search(style)
+    if text_indent or margin_left:
+        return {
+            'text_indent': text_indent.groups() if text_indent else None,
+            'margin_left': margin_left.groups() if margin_left else None,
+        }
+    if 'has-indent' in element.get('class', ''):
+        return {'text_indent': CLASS_INDENT, 'margin_left': None}
+    return None
+
+
+def _leading_nbsp(element):
+    text = ''.join(element.itertext())
+    return len(text) - len(text.lstrip('\u00A0'))
+
+
+class _Walker:
+    """Обходит дерево lxml один раз, собирая события, абзацы и изображения."""
+
+    def __init__(self, parsed):
+        self.parsed = parsed
+        self.table_depth = 0
+
+    def walk_children(self, element):
+        for child in element:
+            if isinstance(child.tag, str):
+                self.walk_element(child)
+            else:
+                # Комментарии и инструкции обработки в текст не попадают
+                self.parsed.events.append(_BREAK)
+            if child.tail:
+                self.parsed.events.append(('data', child.tail))
+
+    def walk_element(self, element):
+        parsed = self.parsed
+        tag = element.tag
+
+        if tag == 'img':
+            index = len(parsed.images)
+            parsed.images.append(element.get('src', ''))
+            element.set(IMAGE_INDEX_ATTR, str(index))
+            if self.table_depth:
+                # Для htmldocx изображение внутри таблицы вставляется сразу после нее
+                parsed._table_images.append(index)
+            else:
+                parsed.events.append(('img', index))
+            return
+
+        key = None
+        if tag == 'p':
+            info = _paragraph_info(element)
+            if info is not None:
+                key = f"p_{len(parsed.paragraphs)}"
+                info['nbsp'] = _leading_nbsp(element)
+                parsed.paragraphs[key] = info
+                element.set(PARAGRAPH_KEY_ATTR, key)
+
+        attrs = [(name, value) for name, value in element.attrib.items() if name != PARAGRAPH_KEY_ATTR]
+        parsed.events.append(('start', tag, attrs, key, element))
+        if tag == 'table':
+            self.table_depth += 1
+        if element.text:
+            parsed.events.append(('data', element.text))
+        self.walk_children(element)
+        parsed.events.append(('end', tag, element))
+
+        if tag == 'table':
+            self.table_depth -= 1
+            if not self.table_depth:
+                parsed.events.extend(('img', index) for index in parsed._table_images)
+                parsed._table_images = []
+
+
+def parse_html(html_content):
+    """
+    Разбирает HTML один раз (lxml) и за тот же обход собирает отступы
+    абзацев, ведущие неразрывные пробелы и изображения.
+
+    Args:
+        html_content (str): HTML-контент из CKEditor
+
+    Returns:
+        ParsedHtml: Поток событий и собранные метаданные
+    """
+    parsed = ParsedHtml()
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except lxml.etree.ParserError:
+        # Документ без элементов (например, только пробелы)
+        return parsed
+
+    walker = _Walker(parsed)
+    for child in root:
+        if child.tag == 'body':
+            parsed.root = child
+            if child.text:
+                parsed.events.append(('data', child.text))
+            walker.walk_children(child)
+        elif isinstance(child.tag, str):
+            walker.walk_element(child)
+    return parsed
+
+
+def split_sections(html_content, tags=('h1', 'h2')):
+    """
+    Делит HTML на разделы: новый раздел начинается с каждого заголовка
+    верхнего уровня из tags. Разделы преобразуются в DOCX независимо,
+    поэтому правка одного раздела не затрагивает остальные.
+
+    Args:
+        html_content (str): HTML-контент из CKEditor
+        tags (tuple): Теги заголовков, с которых начинаются разделы
+
+    Returns:
+        list: HTML разделов по порядку (пустой список для пустого HTML)
+    """
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except lxml.etree.ParserError:
+        return []
+    body = root.find('body')
+    if body is None:
+        body = root
+
+    sections = []
+    chunks = [body.text] if body.text else []
+    for child in body:
+        if child.tag in tags and chunks:
+            sections.append(''.join(chunks))
+            chunks = []
+        chunks.append(lxml.html.tostring(child, encoding='unicode', with_tail=True))
+    if chunks:
+        sections.append(''.join(chunks))
+    return sections
+
+
+class PatchedHtmlToDocx(HtmlToDocx):
+    """
+    htmldocx, который принимает готовый поток событий вместо строки HTML
+    и запоминает созданные абзацы вместе с их ключами.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.run = None  # Добавляем отсутствующий атрибут
+        self.current_paragraph_id = None  # Для отслеживания ключа текущего параграфа
+        self.paragraphs_created = []  # Список созданных параграфов
+
+    def add_events_to_document(self, events, tables, document):
+        """
+        Добавляет в документ часть HTML, заданную потоком событий.
+
+        Args:
+            events (list): События из ParsedHtml.segments
+            tables (list): Таблицы верхнего уровня этой части (BeautifulSoup)
+            document (Document): Документ python-docx
+        """
+        self.set_initial_attrs(document)
+        self.tables = tables
+        self.table_no = 0
+        for event in events:
+            kind = event[0]
+            if kind == 'start':
+                self.current_paragraph_id = event[3]
+                self.handle_starttag(event[1], event[2])
+            elif kind == 'end':
+                self.handle_endtag(event[1])
+            else:
+                self.handle_data(event[1])
+
+    def handle_starttag(self, tag, attrs):
+        try:
+            if tag == 'p':
+                # Создаем новый параграф
+                old_paragraph = self.paragraph
+                super().handle_starttag(tag, attrs)
+
+                # Если был создан новый параграф, сохраняем его и его ключ
+                if self.paragraph != old_paragraph and self.paragraph is not None:
+                    self.paragraphs_created.append((self.paragraph, self.current_paragraph_id))
+            else:
+                # Пытаемся выполнить оригинальный метод
+                super().handle_starttag(tag, attrs)
+
+            # Проверяем, нужно ли инициализировать self.run
+            if tag in ['br', 'hr'] and self.run is None and self.paragraph is not None:
+                # Создаем run, если его нет
+                self.run = self.paragraph.add_run()
+
+        except AttributeError as e:
+            # Если возникла ошибка с атрибутом run, игнорируем ее
+            if "'NoneType' object has no attribute 'add_break'" in str(e):
+                logger.warning("Игнорирована ошибка в htmldocx: 'NoneType' object has no attribute 'add_break'")
+                # Пытаемся создать run и повторить операцию
+                if self.paragraph is not None:
+                    self.run = self.paragraph.add_run()
+                    if tag == 'br':
+                        self.run.add_break()
+            elif "'NoneType' object has no attribute" in str(e):
+                logger.warning(f"Игнорирована ошибка в htmldocx: {str(e)}")
+            else:
+                # Другие ошибки пробрасываем дальше
+                raise
@@ -0,0 +1,230 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import os
+import re
+import time
+
+from django.conf import settings
+
+from documents.services.export_cache import ExportResultCache
+
+logger = logging.getLogger(__name__)
+
+# Сколько считать загруженное изображение свежим, если сервер не прислал max-age (с)
+DEFAULT_MAX_AGE = 60 * 60 * 24
+
+
+def guess_image_extension(content_type):
+    """Возвращает расширение файла для MIME-типа изображения (по умолчанию .png)."""
+    ext = mimetypes.guess_extension(content_type or '') or '.png'
+    if ext == '.jpe':
+        ext = '.jpg'
+    return ext
+
+
+def inspect_image(content, content_type=''):
+    """
+    Определяет фактический MIME-тип и размер изображения в пикселях.
+
+    Pillow открывает изображение лениво: читается только заголовок, пиксели
+    не декодируются. Если Pillow недоступен или не распознал формат,
+    возвращается переданный MIME-тип без размеров.
+
+    Returns:
+        tuple: (content_type, width, height)
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return content_type, None, None
+
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            detected = Image.MIME.get(img.format)
+            width, height = img.size
+    except Exception:
+        return content_type, None, None
+    return detected or content_type, width, height
+
+
+class CachedImage:
+    """Изображение вместе с метаданными: MIME-тип, размер и валидаторы HTTP."""
+
+    def __init__(self, content, content_type, width=None, height=None,
+                 etag='', last_modified='', fetched_at=0.0, max_age=0):
+        self.content = content
+        self.content_type = content_type
+        self.width = width
+        self.height = height
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.max_age = max_age
+
+    @classmethod
+    def from_content(cls, content, content_type='', **kwargs):
+        content_type, width, height = inspect_image(content, content_type)
+        return cls(content, content_type, width, height, **kwargs)
+
+    @property
+    def extension(self):
+        return guess_image_extension(self.content_type)
+
+    @property
+    def is_fresh(self):
+        return time.time() - self.fetched_at < self.max_age
+
+    def validators(self):
+        """Заголовки для условного запроса при проверке актуальности."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def metadata(self):
+        return {
+            'content_type': self.content_type,
+            'width': self.width,
+            'height': self.height,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'fetched_at': self.fetched_at,
+            'max_age': self.max_age,
+        }
+
+
+def get_max_age(headers):
+    """
+    Возвращает срок свежести ответа по Cache-Control или None,
+    если ответ кэшировать нельзя (no-store).
+    """
+    cache_control = headers.get('Cache-Control', '').lower()
+    if 'no-store' in cache_control:
+        return None
+    if 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match:
+        return int(match.group(1))
+    return getattr(settings, 'EXPORT_IMAGE_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+class ImageCache(ExportResultCache):
+    """
+    Общий дисковый кэш изображений, используемых при экспорте.
+
+    Удаленные изображения хранятся по URL и после истечения срока свежести
+    проверяются условным запросом (ETag / Last-Modified). Data URI хранятся
+    по хэшу самой строки, поэтому повторный экспорт не декодирует base64.
+    Файлы с диска — по пути, mtime и размеру. Вместе с байтами хранится
+    MIME-тип и размер в пикселях; объем ограничен с LRU-вытеснением.
+    """
+
+    directory_setting = 'EXPORT_IMAGE_CACHE_DIR'
+    max_bytes_setting = 'EXPORT_IMAGE_CACHE_MAX_BYTES'
+    default_dirname = 'gost_docs_image_cache'
+    label = 'Кэш изображений'
+
+    def get_image(self, key):
+        """Возвращает CachedImage по ключу или None при промахе."""
+        raw_metadata = self.get(key, 'json')
+        if raw_metadata is None:
+            return None
+        content = self.get(key, 'img')
+        if content is None:
+            return None
+        try:
+            metadata = json.loads(raw_metadata)
+        except ValueError:
+            return None
+        return CachedImage(content, **metadata)
+
+    def put_image(self, key, image, metadata_only=False):
+        """Сохраняет изображение; metadata_only обновляет только метаданные."""
+        if not metadata_only:
+            self.put(key, 'img', image.content)
+        self.put(key, 'json', json.dumps(image.metadata()).encode('utf-8'))
+
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha256(f"url:{url}".encode('utf-8')).hexdigest()
+
+    def get_url(self, url):
+        """Возвращает сохраненную версию изображения по URL (свежую или нет)."""
+        return self.get_image(self.url_key(url))
+
+    def store_url(self, url, content, headers):
+        """
+        Сохраняет загруженное изображение вместе с валидаторами HTTP.
+
+        Returns:
+            CachedImage: Нормализованное изображение (сохраняется, если ответ можно кэшировать)
+        """
+        max_age = get_max_age(headers)
+        image = CachedImage.from_content(
+            content,
+            headers.get('Content-Type', ''),
+            etag=headers.get('ETag', ''),
+            last_modified=headers.get('Last-Modified', ''),
+            fetched_at=time.time(),
+            max_age=max_age or 0,
+        )
+        if max_age is not None:
+            self.put_image(self.url_key(url), image)
+        return image
+
+    def refresh_url(self, url, image, headers):
+        """Продлевает срок свежести после ответа 304 Not Modified."""
+        image.fetched_at = time.time()
+        image.max_age = get_max_age(headers) or 0
+        image.etag = headers.get('ETag', image.etag)
+        image.last_modified = headers.get('Last-Modified', image.last_modified)
+        self.put_image(self.url_key(url), image, metadata_only=True)
+        return image
+
+    def load_data_uri(self, src):
+        """
+        Возвращает изображение из data URI, декодируя base64 только при промахе.
+
+        Raises:
+            ValueError: Если data URI поврежден
+        """
+        key = hashlib.sha256(src.encode('utf-8')).hexdigest()
+        image = self.get_image(key)
+        if image is not None:
+            return image
+
+        header, encoded = src.split(",", 1)
+        content_type = header.split(";")[0].split(":")[1]
+        image = CachedImage.from_content(base64.b64decode(encoded), content_type)
+        self.put_image(key, image)
+        return image
+
+    def load_file(self, path):
+        """
+        Возвращает изображение с диска; файл перечитывается только при
+        изменении его mtime или размера.
+
+        Raises:
+            OSError: Если файл недоступен
+        """
+        stat = os.stat(path)
+        key = hashlib.sha256(f"file:{path}:{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8')).hexdigest()
+        image = self.get_image(key)
+        if image is not None:
+            return image
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        image = CachedImage.from_content(content, mimetypes.guess_type(path)[0] or '')
+        self.put_image(key, image)
+        return image
+
+
+image_cache = ImageCache()
@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from documents.services.image_cache import image_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_TIMEOUT = 10
+DEFAULT_DEADLINE = 30
+
+
+class FetchedImage:
+    """Результат загрузки одного изображения по URL."""
+
+    def __init__(self, url, image=None, status_code=None, elapsed=0.0, error=None, source='network'):
+        self.url = url
+        self.image = image
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.error = error
+        # 'network' — загружено заново, 'cache' — свежая копия из кэша,
+        # 'revalidated' — сервер ответил 304 Not Modified
+        self.source = source
+
+    @property
+    def ok(self):
+        return self.image is not None
+
+    @property
+    def content(self):
+        return self.image.content if self.image else None
+
+    @property
+    def content_type(self):
+        return self.image.content_type if self.image else ''
+
+
+class ImageFetcher:
+    """
+    Параллельная загрузка изображений документа по HTTP.
+
+    Все запросы идут через общую requests.Session с пулом keep-alive
+    соединений. Число одновременных загрузок ограничено пулом потоков
+    (EXPORT_IMAGE_FETCH_WORKERS) и семафором на каждый хост
+    (EXPORT_IMAGE_FETCH_PER_HOST). На весь документ действует общий срок
+    (EXPORT_IMAGE_FETCH_DEADLINE): не успевшие изображения пропускаются.
+    Свежие копии берутся из image_cache без обращения к сети, устаревшие
+    проверяются условным запросом.
+    """
+
+    def __init__(self):
+        self._session = None
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _setting(self, name, default):
+        return getattr(settings, name, None) or default
+
+    @property
+    def max_workers(self):
+        return self._setting('EXPORT_IMAGE_FETCH_WORKERS', DEFAULT_WORKERS)
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                per_host = self._setting('EXPORT_IMAGE_FETCH_PER_HOST', DEFAULT_PER_HOST)
+                self._host_limits[host] = threading.BoundedSemaphore(per_host)
+            return self._host_limits[host]
+
+    def fetch(self, url, deadline=None):
+        """
+        Загружает одно изображение, соблюдая лимит на хост и общий срок.
+
+        Args:
+            url (str): Адрес изображения
+            deadline (float): Момент time.monotonic(), после которого загружать уже поздно
+
+        Returns:
+            FetchedImage: Результат загрузки (content = None при ошибке)
+        """
+        started = time.monotonic()
+        cached = image_cache.get_url(url)
+        if cached is not None and cached.is_fresh:
+            return FetchedImage(url, cached, elapsed=time.monotonic() - started, source='cache')
+
+        timeout = self._setting('EXPORT_IMAGE_FETCH_TIMEOUT', DEFAULT_TIMEOUT)
+        try:
+            with self._host_limit(url):
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return FetchedImage(url, elapsed=time.monotonic() - started, error="истек срок загрузки")
+                    timeout = min(timeout, remaining)
+                headers = cached.validators() if cached is not None else {}
+                response = self.session.get(url, timeout=timeout, headers=headers)
+        except Exception as e:
+            return FetchedImage(url, elapsed=time.monotonic() - started, error=str(e))
+
+        elapsed = time.monotonic() - started
+        if response.status_code == 304 and cached is not None:
+            image = image_cache.refresh_url(url, cached, response.headers)
+            return FetchedImage(url, image, response.status_code, elapsed, source='revalidated')
+        if response.status_code != 200:
+            return FetchedImage(url, status_code=response.status_code, elapsed=elapsed,
+                                error=f"статус {response.status_code}")
+        image = image_cache.store_url(url, response.content, response.headers)
+        return FetchedImage(url, image, response.status_code, elapsed)
+
+    def fetch_all(self, urls):
+        """
+        Загружает набор изображений параллельно. Повторяющиеся адреса
+        загружаются один раз.
+
+        Args:
+            urls (list): Адреса изображений в порядке следования в документе
+
+        Returns:
+            dict: Отображение адреса в FetchedImage (для каждого переданного адреса)
+        """
+        unique_urls = list(dict.fromkeys(urls))
+        if not unique_urls:
+            return {}
+
+        started = time.monotonic()
+        deadline = started + self._setting('EXPORT_IMAGE_FETCH_DEADLINE', DEFAULT_DEADLINE)
+        results = {}
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(unique_urls)),
+            thread_name_prefix='image-fetch',
+        )
+        try:
+            pending = {executor.submit(self.fetch, url, deadline): url for url in unique_urls}
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    results[url] = result = future.result()
+                    if result.ok:
+                        logger.info(
+                            f"Изображение получено ({result.source}) за {result.elapsed * 1000:.0f} мс "
+                            f"({len(result.content)} байт): {url[:80]}"
+                        )
+                    else:
+                        logger.warning(
+                            f"Не удалось загрузить изображение за {result.elapsed * 1000:.0f} мс "
+                            f"({result.error}): {url[:80]}"
+                        )
+
+            for future, url in pending.items():
+                future.cancel()
+                results[url] = FetchedImage(url, elapsed=time.monotonic() - started, error="истек срок загрузки")
+                logger.warning(f"Изображение не загружено до истечения срока: {url[:80]}")
+        finally:
+            # Зависшие запросы дорабатывают в фоне, их ограничивает таймаут запроса
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        loaded = sum(1 for result in results.values() if result.ok)
+        logger.info(
+            f"Загружено {loaded}/{len(unique_urls)} изображений за "
+            f"{(time.monotonic() - started) * 1000:.0f} мс"
+        )
+        return results
+
+
+image_fetcher = ImageFetcher()
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+
+from documents.services.image_cache import CachedImage, image_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DPI = 300
+DEFAULT_MAX_WIDTH_CM = 17
+DEFAULT_JPEG_QUALITY = 85
+# Сколько различных цветов на уменьшенной копии допускается у схемы/диаграммы
+DIAGRAM_MAX_COLORS = 1024
+
+
+def get_optimizer_settings():
+    """Возвращает параметры подготовки изображений из настроек."""
+    return {
+        'enabled': getattr(settings, 'EXPORT_IMAGE_OPTIMIZE', True),
+        'dpi': getattr(settings, 'EXPORT_IMAGE_DPI', DEFAULT_DPI),
+        'max_width_cm': getattr(settings, 'EXPORT_IMAGE_MAX_WIDTH_CM', DEFAULT_MAX_WIDTH_CM),
+        'jpeg_quality': getattr(settings, 'EXPORT_IMAGE_JPEG_QUALITY', DEFAULT_JPEG_QUALITY),
+    }
+
+
+def _has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def _is_photo(img, source_format):
+    """
+    Отличает фотографии от схем: JPEG считается фото, изображения с
+    прозрачностью — схемами, остальные определяются по числу цветов.
+    """
+    from PIL import Image
+
+    if source_format == 'JPEG':
+        return True
+    if _has_alpha(img):
+        return False
+    sample = img.convert('RGB')
+    if sample.width > 256:
+        sample = sample.resize((256, max(1, round(sample.height * 256 / sample.width))), Image.NEAREST)
+    return sample.getcolors(maxcolors=DIAGRAM_MAX_COLORS) is None
+
+
+def _optimize(content, params):
+    """
+    Уменьшает изображение до печатного разрешения и перекодирует его.
+
+    Returns:
+        tuple: (content, content_type, width, height) или None, если
+        изображение оставляется как есть
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(content)) as source:
+        source_format = source.format
+        if source_format not in ('JPEG', 'PNG', 'BMP', 'TIFF', 'WEBP', 'GIF'):
+            return None
+        if getattr(source, 'is_animated', False):
+            return None
+
+        dpi = source.info.get('dpi')
+        icc_profile = source.info.get('icc_profile')
+        # Учитываем поворот из EXIF до того, как метаданные будут отброшены
+        img = ImageOps.exif_transpose(source)
+        img.load()
+
+    max_width = round(params['max_width_cm'] / 2.54 * params['dpi'])
+    resized = img.width > max_width
+    if resized:
+        height = max(1, round(img.height * max_width / img.width))
+        img = img.resize((max_width, height), Image.LANCZOS)
+        dpi = (params['dpi'], params['dpi'])
+
+    # Сохраняем только то, что влияет на вывод: разрешение и цветовой профиль.
+    # EXIF, комментарии и прочие метаданные отбрасываются.
+    save_options = {}
+    if dpi:
+        save_options['dpi'] = dpi
+    if icc_profile:
+        save_options['icc_profile'] = icc_profile
+
+    buffer = io.BytesIO()
+    if _is_photo(img, source_format):
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.save(buffer, 'JPEG', quality=params['jpeg_quality'], optimize=True, progressive=True, **save_options)
+        content_type = 'image/jpeg'
+    else:
+        if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            img = img.convert('RGBA' if _has_alpha(img) else 'RGB')
+        img.save(buffer, 'PNG', optimize=True, **save_options)
+        content_type = 'image/png'
+
+    optimized = buffer.getvalue()
+    # Без уменьшения перекодирование имеет смысл, только если файл стал меньше
+    if not resized and len(optimized) >= len(content):
+        return None
+    return optimized, content_type, img.width, img.height
+
+
+def optimize_image(image):
+    """
+    Готовит изображение к вставке в DOCX: уменьшает до максимальной
+    печатной ширины (EXPORT_IMAGE_MAX_WIDTH_CM при EXPORT_IMAGE_DPI),
+    отбрасывает метаданные, фотографии перекодирует в JPEG
+    (EXPORT_IMAGE_JPEG_QUALITY), схемы — в оптимизированный PNG.
+    Результат кэшируется по хэшу исходных байтов и параметров.
+
+    Args:
+        image (CachedImage): Исходное изображение
+
+    Returns:
+        CachedImage: Подготовленное изображение (или исходное, если
+        оптимизация выключена, невозможна или не дает выигрыша)
+    """
+    params = get_optimizer_settings()
+    if not params['enabled']:
+        return image
+
+    source_hash = hashlib.sha256(image.content).hexdigest()
+    key = hashlib.sha256(
+        f"optimized:{source_hash}:{params['dpi']}:{params['max_width_cm']}:{params['jpeg_quality']}".encode('utf-8')
+    ).hexdigest()
+    cached = image_cache.get_image(key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = _optimize(image.content, params)
+    except ImportError:
+        return image
+    except Exception as e:
+        logger.warning(f"Не удалось оптимизировать изображение: {e}")
+        return image
+
+    if result is None:
+        optimized = image
+    else:
+        content, content_type, width, height = result
+        optimized = CachedImage(content, content_type, width, height)
+        logger.info(
+            f"Изображение оптимизировано: {image.width}x{image.height} -> {width}x{height}, "
+            f"{len(image.content)} -> {len(content)} байт"
+        )
+    # Кэшируем и отказ от оптимизации, чтобы не пробовать снова
+    image_cache.put_image(key, optimized)
+    return optimized
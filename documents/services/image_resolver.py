@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.storage import default_storage
+
+from documents.services.image_cache import CachedImage, image_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _url_prefix(url):
+    """Приводит MEDIA_URL / STATIC_URL к виду '/prefix/' (в настройках бывает 'static/')."""
+    if not url:
+        return None
+    path = urlsplit(url).path
+    return '/' + path.strip('/') + '/' if path.strip('/') else '/'
+
+
+def _load_from_storage(storage, name):
+    """
+    Читает файл из хранилища Django. Для файловых хранилищ используется
+    путь на диске (и кэш по mtime), для остальных — поток из storage.open.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+
+    if path is not None:
+        if not os.path.isfile(path):
+            return None
+        return image_cache.load_file(path)
+
+    if not storage.exists(name):
+        return None
+    try:
+        version = storage.get_modified_time(name).isoformat()
+    except (NotImplementedError, AttributeError):
+        version = ''
+    key = hashlib.sha256(f"storage:{name}:{version}".encode('utf-8')).hexdigest()
+    image = image_cache.get_image(key) if version else None
+    if image is not None:
+        return image
+
+    with storage.open(name, 'rb') as f:
+        image = CachedImage.from_content(f.read())
+    if version:
+        image_cache.put_image(key, image)
+    return image
+
+
+def is_local_image(src):
+    """True, если src — путь на этом сайте (от корня), а не внешний URL или data URI."""
+    return src.startswith('/') and not src.startswith('//')
+
+
+def resolve_local_image(src):
+    """
+    Находит изображение с путем от корня сайта без обращения к веб-серверу.
+
+    MEDIA_URL (включая загрузки CKEditor) читается из default_storage,
+    STATIC_URL — через staticfiles finders (и STATIC_ROOT после collectstatic),
+    прочие пути — относительно BASE_DIR.
+
+    Args:
+        src (str): Значение атрибута src, например '/media/uploads/a.png'
+
+    Returns:
+        CachedImage: Изображение или None, если файл не найден
+    """
+    path = unquote(urlsplit(src).path)
+    media_prefix = _url_prefix(settings.MEDIA_URL)
+    static_prefix = _url_prefix(settings.STATIC_URL)
+
+    try:
+        if media_prefix and media_prefix != '/' and path.startswith(media_prefix):
+            name = path[len(media_prefix):]
+            return _load_from_storage(default_storage, name)
+
+        if static_prefix and static_prefix != '/' and path.startswith(static_prefix):
+            name = path[len(static_prefix):]
+            found = finders.find(name)
+            if not found and getattr(settings, 'STATIC_ROOT', None):
+                candidate = os.path.join(settings.STATIC_ROOT, name)
+                found = candidate if os.path.isfile(candidate) else None
+            return image_cache.load_file(found) if found else None
+
+        base_dir = os.path.realpath(settings.BASE_DIR)
+        file_path = os.path.realpath(os.path.join(base_dir, path.lstrip('/')))
+        # Не выходим за пределы проекта через '..'
+        if not file_path.startswith(base_dir + os.sep) or not os.path.isfile(file_path):
+            return None
+        return image_cache.load_file(file_path)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать локальное изображение {src}: {e}")
+        return None
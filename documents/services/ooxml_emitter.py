@@ -0,0 +1,537 @@
+import io
+import logging
+import re
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import qn
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.table import CT_Tbl
+from docx.shared import Cm, Emu, Inches
+from docx.styles import BabelFish
+from lxml.etree import SubElement
+
+from documents.services.html_frontend import IMAGE_INDEX_ATTR, PARAGRAPH_KEY_ATTR, convert_to_cm
+
+logger = logging.getLogger(__name__)
+
+# Форматирование символов по тегам (как в htmldocx) и моноширинный шрифт
+FONT_STYLES = {
+    'b': 'bold',
+    'strong': 'bold',
+    'em': 'italic',
+    'i': 'italic',
+    'u': 'underline',
+    's': 'strike',
+    'strike': 'strike',
+    'del': 'strike',
+    'sup': 'superscript',
+    'sub': 'subscript',
+}
+FONT_NAMES = {
+    'code': 'Courier',
+    'pre': 'Courier',
+}
+
+# Блочные элементы без собственного абзаца: текст внутри них попадает
+# в новый абзац, который наследует выравнивание блока
+CONTAINER_TAGS = {
+    'div', 'blockquote', 'section', 'article', 'header', 'footer', 'main', 'nav',
+    'aside', 'address', 'figure', 'figcaption', 'center', 'dl', 'dt', 'dd', 'form',
+}
+SKIP_TAGS = {'head', 'script', 'style', 'title', 'meta', 'link', 'noscript', 'template'}
+HEADING_TAGS = {f'h{level}': level for level in range(1, 10)}
+
+ALIGNMENTS = {'center': 'center', 'right': 'right', 'justify': 'both', 'left': 'left'}
+
+# Отступы списков и предельный отступ (дюймы), как в htmldocx
+LIST_INDENT = 0.5
+MAX_INDENT = 5.5
+# Ширина изображения по умолчанию, если размер неизвестен (дюймы)
+DEFAULT_PICTURE_WIDTH = 5.0
+
+# Пробельные символы HTML; неразрывный пробел к ним не относится и сохраняется
+_LEADING_NEWLINES_RE = re.compile(r'^[ \t\n\r\f\v]*\n[ \t\n\r\f\v]*')
+_TRAILING_NEWLINES_RE = re.compile(r'[ \t\n\r\f\v]*\n[ \t\n\r\f\v]*$')
+_SPACES_RE = re.compile(r'[ \t\n\r\f\v]+')
+_PX_RE = re.compile(r'^([0-9]+(?:\.[0-9]+)?)px$')
+_RGB_RE = re.compile(r'rgb\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*\)')
+
+_XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+_W_P = qn('w:p')
+_W_R = qn('w:r')
+_W_HYPERLINK = qn('w:hyperlink')
+
+
+def normalize_whitespace(text):
+    """
+    Сжимает пробелы так же, как htmldocx: переводы строк по краям
+    удаляются вместе с окружающими пробелами, остальные серии пробелов
+    заменяются одним. Неразрывные пробелы не трогаются.
+    """
+    text = _LEADING_NEWLINES_RE.sub('', text)
+    text = _TRAILING_NEWLINES_RE.sub('', text)
+    return _SPACES_RE.sub(' ', text)
+
+
+def parse_style(value):
+    """Разбирает атрибут style в словарь (имена свойств в нижнем регистре)."""
+    style = {}
+    for declaration in value.split(';'):
+        name, sep, prop = declaration.partition(':')
+        if sep:
+            style[name.strip().lower()] = prop.strip()
+    return style
+
+
+def parse_color(value):
+    """Цвет CSS (#rrggbb, #rgb, rgb()) в шестнадцатеричную строку; прочие — черный."""
+    value = value.strip().lower()
+    match = _RGB_RE.match(value)
+    if match:
+        return ''.join(f'{min(int(part), 255):02X}' for part in match.groups())
+    if value.startswith('#'):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = ''.join(ch * 2 for ch in digits)
+        if len(digits) == 6 and all(ch in '0123456789abcdef' for ch in digits):
+            return digits.upper()
+    return '000000'
+
+
+def _indent(value_unit):
+    """Отступ из пары (значение, единица) или None, если значение не число."""
+    value, unit = value_unit
+    try:
+        return Cm(convert_to_cm(float(value), unit))
+    except ValueError:
+        logger.warning(f"Не удалось применить отступ: {value}{unit}")
+        return None
+
+
+def get_picture_width(image):
+    """
+    Ширина изображения в документе: крупные изображения ограничиваются
+    5.5 дюйма (72 точки на дюйм), небольшие вставляются в собственном
+    размере (None), при неизвестном размере берется 5 дюймов.
+    """
+    if not image.width:
+        return Inches(DEFAULT_PICTURE_WIDTH)
+    if image.width > Inches(MAX_INDENT).pt:
+        return Inches(min(image.width / 72, MAX_INDENT))
+    return None
+
+
+class OoxmlEmitter:
+    """
+    Переводит разобранный HTML из CKEditor напрямую в элементы w:p / w:r /
+    w:tbl документа python-docx, минуя htmldocx и прокси-объекты python-docx.
+
+    Экземпляр создается на один вызов и хранит только состояние обхода,
+    поэтому эмиттер можно использовать из нескольких потоков одновременно.
+    Абзацы оформляются стилями документа (Heading N, List Bullet,
+    List Number, TableGrid), идентификаторы стилей определяются один раз.
+
+    Args:
+        document (Document): Документ python-docx, в конец которого добавляется контент
+        images (dict): Номер изображения -> CachedImage для вставки
+        placeholder (callable): src -> текст вместо изображения, которое не удалось получить
+    """
+
+    def __init__(self, document, images, placeholder):
+        self.document = document
+        self.part = document.part
+        self.images = images
+        self.placeholder = placeholder
+        self.paragraph_count = 0
+        self._paragraphs = {}
+        self._style_ids = {}
+        self._links = {}
+
+        body = document.element.body
+        section = document.sections[-1]
+        self._container = body
+        self._anchor = body.find(qn('w:sectPr'))
+        self._width = section.page_width - section.left_margin - section.right_margin
+        self._paragraph = None
+        self._lists = []
+        self._align = None
+        self._strip_leading = False
+        self._in_table = False
+
+    def emit(self, parsed):
+        """
+        Добавляет содержимое ParsedHtml в документ.
+
+        Ошибка в одном элементе верхнего уровня не прерывает преобразование:
+        вместо него вставляется его текст.
+
+        Args:
+            parsed (ParsedHtml): Результат parse_html
+
+        Returns:
+            int: Число созданных абзацев
+        """
+        root = parsed.root
+        if root is None:
+            return 0
+        self._paragraphs = parsed.paragraphs
+        self._text(root.text, {}, None)
+        for child in root:
+            try:
+                self._element(child, {}, None)
+            except Exception as e:
+                logger.error(f"Ошибка при преобразовании элемента <{child.tag}>: {e}", exc_info=True)
+                self._paragraph = None
+                text = ''.join(child.itertext()).strip()
+                if text:
+                    self._text(text, {}, None)
+                    self._paragraph = None
+            self._text(child.tail, {}, None)
+        return self.paragraph_count
+
+    # Обход дерева
+
+    def _children(self, element, fmt, link):
+        self._text(element.text, fmt, link)
+        for child in element:
+            self._element(child, fmt, link)
+            self._text(child.tail, fmt, link)
+
+    def _element(self, element, fmt, link):
+        tag = element.tag
+        if not isinstance(tag, str) or tag in SKIP_TAGS:
+            # Комментарии, инструкции обработки и служебные элементы
+            return
+
+        if tag in FONT_STYLES:
+            fmt = dict(fmt)
+            fmt[FONT_STYLES[tag]] = True
+            if tag == 'sup':
+                fmt.pop('subscript', None)
+            elif tag == 'sub':
+                fmt.pop('superscript', None)
+            self._children(element, fmt, link)
+        elif tag == 'span' or tag == 'font':
+            self._children(element, self._span_format(element, fmt), link)
+        elif tag == 'a':
+            href = (element.get('href') or '').strip()
+            self._children(element, fmt, href if href and not href.startswith('#') else link)
+        elif tag == 'br':
+            self._break(fmt)
+        elif tag == 'img':
+            self._image(element, fmt, link)
+        elif tag in ('p', 'pre', 'li') or tag in HEADING_TAGS:
+            self._block(element, tag, fmt, link)
+        elif tag == 'ol' or tag == 'ul':
+            self._paragraph = None
+            self._lists.append(tag)
+            try:
+                self._children(element, fmt, link)
+            finally:
+                self._lists.pop()
+            self._paragraph = None
+        elif tag == 'table':
+            self._table(element, fmt)
+        elif tag == 'hr':
+            self._paragraph = None
+            self._new_paragraph(border=True)
+            self._paragraph = None
+        elif tag in CONTAINER_TAGS:
+            self._container_block(element, fmt, link)
+        else:
+            if tag in FONT_NAMES:
+                fmt = dict(fmt, font=FONT_NAMES[tag])
+            self._children(element, fmt, link)
+
+    def _block(self, element, tag, fmt, link):
+        """Абзац (p, pre), пункт списка или заголовок."""
+        style = parse_style(element.get('style', ''))
+        align = ALIGNMENTS.get(style.get('text-align', '').lower(), self._align)
+        props = {'align': align}
+
+        if tag == 'li':
+            list_type = self._lists[-1] if self._lists else 'ul'
+            props['style'] = 'List Number' if list_type == 'ol' else 'List Bullet'
+            props['left'] = Inches(min(len(self._lists) * LIST_INDENT, MAX_INDENT))
+            props['single'] = True
+        elif tag in HEADING_TAGS and not self._in_table:
+            props['style'] = f'Heading {HEADING_TAGS[tag]}'
+
+        margin = _PX_RE.match(style.get('margin-left', ''))
+        if margin:
+            props['left'] = Inches(min(int(float(margin.group(1))) // 10 * 0.25, MAX_INDENT))
+
+        # Отступы, собранные при разборе: text-indent, margin-left и ведущие
+        # неразрывные пробелы (они превращаются в отступ первой строки)
+        strip_leading = False
+        info = self._paragraphs.get(element.get(PARAGRAPH_KEY_ATTR))
+        if info:
+            if info['text_indent']:
+                props['first_line'] = _indent(info['text_indent'])
+            if info['margin_left']:
+                props['left'] = _indent(info['margin_left']) or props.get('left')
+            if info['nbsp'] > 0:
+                props['first_line'] = Cm(info['nbsp'] * 0.25)
+                strip_leading = True
+
+        if tag == 'pre':
+            fmt = dict(fmt, font=FONT_NAMES['pre'], pre=True)
+
+        self._paragraph = None
+        self._new_paragraph(**props)
+        self._strip_leading = strip_leading
+        saved_align = self._align
+        self._align = align
+        try:
+            self._children(element, fmt, link)
+        finally:
+            self._align = saved_align
+            self._strip_leading = False
+        self._paragraph = None
+
+    def _container_block(self, element, fmt, link):
+        """div, blockquote и т.п.: закрывают текущий абзац и задают выравнивание вложенных."""
+        style = parse_style(element.get('style', ''))
+        saved_align = self._align
+        self._align = ALIGNMENTS.get(style.get('text-align', '').lower(), saved_align)
+        self._paragraph = None
+        try:
+            self._children(element, fmt, link)
+        finally:
+            self._align = saved_align
+        self._paragraph = None
+
+    # Абзацы и фрагменты текста
+
+    def _insert(self, element):
+        if self._anchor is not None:
+            self._anchor.addprevious(element)
+        else:
+            self._container.append(element)
+
+    def _style_id(self, *names):
+        """
+        Идентификатор первого из найденных в документе стилей (None, если
+        ни одного нет). Поиск стиля по имени в python-docx идет по XML
+        стилей, поэтому результат запоминается на весь вызов.
+        """
+        if names not in self._style_ids:
+            style_id = None
+            styles = self.document.styles.element
+            for name in names:
+                style = styles.get_by_name(BabelFish.ui2internal(name))
+                if style is not None:
+                    style_id = style.styleId
+                    break
+            if style_id is None:
+                logger.warning(f"Стиль '{names[0]}' не найден в документе")
+            self._style_ids[names] = style_id
+        return self._style_ids[names]
+
+    def _new_paragraph(self, style=None, align=None, left=None, first_line=None, single=False, border=False):
+        """Создает w:p со свойствами в порядке, который требует схема OOXML."""
+        p = self._container.makeelement(_W_P, {})
+        self._insert(p)
+        self.paragraph_count += 1
+
+        style_id = self._style_id(style) if style else None
+        if style_id or align or left is not None or first_line is not None or single or border:
+            pPr = SubElement(p, qn('w:pPr'))
+            if style_id:
+                SubElement(pPr, qn('w:pStyle')).set(qn('w:val'), style_id)
+            if border:
+                bottom = SubElement(SubElement(pPr, qn('w:pBdr')), qn('w:bottom'))
+                bottom.set(qn('w:val'), 'single')
+                bottom.set(qn('w:sz'), '6')
+                bottom.set(qn('w:space'), '1')
+                bottom.set(qn('w:color'), 'auto')
+            if single:
+                spacing = SubElement(pPr, qn('w:spacing'))
+                spacing.set(qn('w:line'), '240')
+                spacing.set(qn('w:lineRule'), 'auto')
+            if left is not None or first_line is not None:
+                ind = SubElement(pPr, qn('w:ind'))
+                if left is not None:
+                    ind.set(qn('w:left'), str(Emu(left).twips))
+                if first_line is not None:
+                    ind.set(qn('w:firstLine'), str(Emu(first_line).twips))
+            if align:
+                SubElement(pPr, qn('w:jc')).set(qn('w:val'), align)
+
+        self._paragraph = p
+        return p
+
+    def _current_paragraph(self):
+        if self._paragraph is None:
+            self._new_paragraph(align=self._align)
+        return self._paragraph
+
+    def _text(self, text, fmt, link):
+        if not text:
+            return
+        if not fmt.get('pre'):
+            text = normalize_whitespace(text)
+            if not text:
+                return
+        if self._paragraph is None and not text.strip():
+            # Пробелы между блоками не создают пустых абзацев
+            return
+        if self._strip_leading:
+            text = text.lstrip()
+            if not text:
+                return
+            self._strip_leading = False
+
+        paragraph = self._current_paragraph()
+        if link:
+            parent = self._hyperlink(paragraph, link)
+            fmt = dict(fmt, color='0000EE', underline=True)
+        else:
+            parent = paragraph
+        r = SubElement(parent, _W_R)
+        self._run_properties(r, fmt)
+        if fmt.get('pre'):
+            # В preformatted-тексте переводы строк и табуляции сохраняются
+            for number, line in enumerate(text.split('\n')):
+                if number:
+                    SubElement(r, qn('w:br'))
+                for part_number, part in enumerate(line.split('\t')):
+                    if part_number:
+                        SubElement(r, qn('w:tab'))
+                    if part:
+                        self._add_t(r, part)
+        else:
+            self._add_t(r, text)
+
+    @staticmethod
+    def _add_t(r, text):
+        t = SubElement(r, qn('w:t'))
+        t.text = text
+        if len(text.strip()) < len(text):
+            t.set(_XML_SPACE, 'preserve')
+
+    def _hyperlink(self, paragraph, href):
+        """w:hyperlink для ссылки; соседние фрагменты одной ссылки объединяются."""
+        rel_id = self._links.get(href)
+        if rel_id is None:
+            rel_id = self._links[href] = self.part.relate_to(href, RT.HYPERLINK, is_external=True)
+        last = paragraph[-1] if len(paragraph) else None
+        if last is not None and last.tag == _W_HYPERLINK and last.get(qn('r:id')) == rel_id:
+            return last
+        hyperlink = SubElement(paragraph, _W_HYPERLINK)
+        hyperlink.set(qn('r:id'), rel_id)
+        return hyperlink
+
+    @staticmethod
+    def _run_properties(r, fmt):
+        """w:rPr в порядке схемы: rFonts, b, i, strike, color, highlight, u, vertAlign."""
+        if not fmt:
+            return
+        rPr = SubElement(r, qn('w:rPr'))
+        font = fmt.get('font')
+        if font:
+            fonts = SubElement(rPr, qn('w:rFonts'))
+            fonts.set(qn('w:ascii'), font)
+            fonts.set(qn('w:hAnsi'), font)
+        if fmt.get('bold'):
+            SubElement(rPr, qn('w:b'))
+        if fmt.get('italic'):
+            SubElement(rPr, qn('w:i'))
+        if fmt.get('strike'):
+            SubElement(rPr, qn('w:strike'))
+        if fmt.get('color'):
+            SubElement(rPr, qn('w:color')).set(qn('w:val'), fmt['color'])
+        if fmt.get('highlight'):
+            SubElement(rPr, qn('w:highlight')).set(qn('w:val'), 'lightGray')
+        if fmt.get('underline'):
+            SubElement(rPr, qn('w:u')).set(qn('w:val'), 'single')
+        if fmt.get('superscript'):
+            SubElement(rPr, qn('w:vertAlign')).set(qn('w:val'), 'superscript')
+        elif fmt.get('subscript'):
+            SubElement(rPr, qn('w:vertAlign')).set(qn('w:val'), 'subscript')
+        if not len(rPr):
+            r.remove(rPr)
+
+    @staticmethod
+    def _span_format(element, fmt):
+        """Цвет текста и подсветка фона из атрибута style (или color у font)."""
+        style = parse_style(element.get('style', ''))
+        color = style.get('color') or element.get('color')
+        if not color and 'background-color' not in style:
+            return fmt
+        fmt = dict(fmt)
+        if color:
+            fmt['color'] = parse_color(color)
+        if 'background-color' in style:
+            fmt['highlight'] = True
+        return fmt
+
+    def _break(self, fmt):
+        paragraph = self._current_paragraph()
+        r = SubElement(paragraph, _W_R)
+        self._run_properties(r, fmt)
+        SubElement(r, qn('w:br'))
+
+    # Изображения и таблицы
+
+    def _image(self, element, fmt, link):
+        index = element.get(IMAGE_INDEX_ATTR)
+        image = self.images.get(int(index)) if index is not None else None
+        if image is None:
+            self._text(self.placeholder(element.get('src', '')), fmt, link)
+            return
+
+        # Изображение занимает отдельный абзац по центру; пустой абзац,
+        # в котором оно стоит (<p><img></p>), используется для него же
+        paragraph = self._paragraph
+        if paragraph is None or any(child.tag in (_W_R, _W_HYPERLINK) for child in paragraph):
+            paragraph = self._new_paragraph()
+        paragraph.get_or_add_pPr().jc_val = WD_ALIGN_PARAGRAPH.CENTER
+
+        try:
+            inline = self.part.new_pic_inline(io.BytesIO(image.content), width=get_picture_width(image))
+        except Exception as e:
+            logger.error(f"Ошибка при добавлении изображения {index}: {e}")
+            self._text("[Изображение недоступно]", {}, None)
+        else:
+            SubElement(SubElement(paragraph, _W_R), qn('w:drawing')).append(inline)
+            logger.info(f"Добавлено изображение {index} ({len(image.content)} байт)")
+        self._paragraph = None
+        self._strip_leading = False
+
+    def _table(self, element, fmt):
+        rows = [
+            row for child in element
+            for row in ([child] if child.tag == 'tr' else child if child.tag in ('thead', 'tbody', 'tfoot') else ())
+            if row.tag == 'tr'
+        ]
+        cells = [[cell for cell in row if cell.tag in ('td', 'th')] for row in rows]
+        cols = max((len(row_cells) for row_cells in cells), default=0)
+        self._paragraph = None
+        if not cols:
+            return
+
+        tbl = CT_Tbl.new_tbl(len(rows), cols, Emu(self._width))
+        style_id = self._style_id('TableGrid', 'Table Grid', 'Table Normal')
+        if style_id:
+            tbl.tblPr.style = style_id
+        self._insert(tbl)
+
+        saved = (self._container, self._anchor, self._width, self._lists, self._align, self._in_table)
+        self._width = self._width // cols
+        self._in_table = True
+        try:
+            for tr, row_cells in zip(tbl.tr_lst, cells):
+                for tc, cell in zip(tr.tc_lst, row_cells):
+                    tc.remove(tc.p_lst[0])
+                    self._container, self._anchor = tc, None
+                    self._lists, self._align = [], None
+                    self._paragraph = None
+                    cell_fmt = dict(fmt, bold=True) if cell.tag == 'th' else fmt
+                    self._children(cell, cell_fmt, None)
+                    # Ячейка должна заканчиваться абзацем
+                    if not len(tc) or tc[-1].tag != _W_P:
+                        tc.append(tc.makeelement(_W_P, {}))
+        finally:
+            self._container, self._anchor, self._width, self._lists, self._align, self._in_table = saved
+        self._paragraph = None
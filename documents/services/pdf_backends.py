@@ -0,0 +1,423 @@
+import atexit
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Попытка импортировать pythoncom для Windows
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None # Устанавливаем в None, если импорт не удался (не Windows)
+
+# Мост UNO к LibreOffice (пакет python3-uno); без него конвертер запускается на каждый файл
+try:
+    import uno
+except ImportError:
+    uno = None
+
+
+# Процесс — воркер пула экспорта (EXPORT_WORKER_BACKEND = 'process'): он
+# выполняет по одной задаче за раз, и большой пул LibreOffice ему не нужен
+_export_worker_process = False
+
+
+def mark_export_worker_process():
+    """Отмечает текущий процесс как воркер пула экспорта (вызывается при его запуске)."""
+    global _export_worker_process
+    _export_worker_process = True
+
+
+class PdfBackendError(Exception):
+    """Бэкенд не смог сконвертировать DOCX в PDF."""
+
+
+class PdfQueueFullError(PdfBackendError):
+    """Очередь конвертации переполнена."""
+
+
+class PdfBackend:
+    """Способ конвертации DOCX в PDF."""
+
+    name = None
+
+    def convert(self, docx_content):
+        """
+        Конвертирует DOCX в PDF.
+
+        Args:
+            docx_content (bytes): Содержимое DOCX файла
+
+        Returns:
+            bytes: Содержимое PDF файла
+        """
+        raise NotImplementedError
+
+
+def _read_pdf(pdf_path):
+    """Читает созданный PDF, проверяя, что файл есть и не пустой."""
+    if not os.path.exists(pdf_path) or os.path.getsize(pdf_path) == 0:
+        logger.error("PDF файл не создан или имеет нулевой размер")
+        raise PdfBackendError("Ошибка при создании PDF: файл не был создан")
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_content = pdf_file.read()
+    logger.info(f"PDF файл создан: {len(pdf_content)} байт")
+    return pdf_content
+
+
+class Docx2PdfBackend(PdfBackend):
+    """
+    Конвертация через docx2pdf (Microsoft Word по COM). Работает только
+    в Windows и macOS с установленным Word.
+    """
+
+    name = 'docx2pdf'
+
+    def convert(self, docx_content):
+        from docx2pdf import convert
+
+        com_initialized = False
+        if pythoncom:
+            try:
+                pythoncom.CoInitialize()
+                com_initialized = True
+                logger.info("COM успешно инициализирован.")
+            except Exception as e:
+                logger.warning(f"Ошибка при инициализации COM: {e}")
+
+        # Для конвертации нужны реальные файлы, поэтому используются временные файлы
+        with tempfile.TemporaryDirectory() as temp_dir:
+            docx_path = os.path.join(temp_dir, 'document.docx')
+            pdf_path = os.path.join(temp_dir, 'document.pdf')
+            with open(docx_path, 'wb') as docx_file:
+                docx_file.write(docx_content)
+
+            logger.info(f"Конвертация DOCX в PDF: {docx_path} -> {pdf_path}")
+            try:
+                convert(docx_path, pdf_path)
+            except Exception as pdf_error:
+                raise PdfBackendError(f"Ошибка при конвертации в PDF: {pdf_error}") from pdf_error
+            finally:
+                if com_initialized:
+                    try:
+                        pythoncom.CoUninitialize()
+                        logger.info("COM успешно деинициализирован.")
+                    except Exception as e:
+                        logger.warning(f"Ошибка при деинициализации COM: {e}")
+            return _read_pdf(pdf_path)
+
+
+def _uno_properties(**values):
+    from com.sun.star.beans import PropertyValue
+    return tuple(PropertyValue(Name=name, Value=value) for name, value in values.items())
+
+
+class OfficeWorker:
+    """
+    Один процесс LibreOffice в пуле со своим каталогом профиля.
+
+    С модулем uno процесс запускается один раз и принимает документы через
+    именованный канал (pipe) по протоколу UNO, поэтому холодный старт
+    оплачивается только при запуске и перезапуске. Без uno каждая конвертация
+    запускает soffice --convert-to, но с уже созданным собственным профилем:
+    параллельные конвертации не блокируют общий профиль пользователя.
+
+    Attributes:
+        index (int): Номер воркера в пуле
+        profile_dir (str): Каталог профиля LibreOffice
+        conversions (int): Число конвертаций с последнего запуска
+    """
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.profile_dir = os.path.join(pool.profile_root, f"worker-{index}")
+        self.conversions = 0
+        self._process = None
+        self._desktop = None
+        self._pipe = None
+
+    @property
+    def persistent(self):
+        return uno is not None
+
+    def _command(self, *args):
+        return [
+            self.pool.soffice, '--headless', '--invisible', '--nologo', '--norestore',
+            '--nodefault', '--nolockcheck',
+            f"-env:UserInstallation=file://{os.path.abspath(self.profile_dir)}",
+            *args,
+        ]
+
+    def start(self):
+        """Запускает процесс LibreOffice и подключается к нему по UNO."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.conversions = 0
+        self._pipe = f"gost_docs_office_{os.getpid()}_{self.index}_{uuid.uuid4().hex[:8]}"
+        accept = f"pipe,name={self._pipe};urp;StarOffice.ComponentContext"
+        started = time.monotonic()
+        self._process = subprocess.Popen(
+            self._command(f"--accept={accept}"),
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context
+        )
+        deadline = started + self.pool.start_timeout
+        while True:
+            try:
+                context = resolver.resolve(f"uno:{accept}")
+                break
+            except Exception:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise PdfBackendError(f"Не удалось запустить LibreOffice (воркер {self.index})")
+                time.sleep(0.1)
+        self._desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+        logger.info(f"LibreOffice воркер {self.index} запущен за {time.monotonic() - started:.1f} с")
+
+    def stop(self):
+        """Завершает процесс LibreOffice (сначала штатно, затем принудительно)."""
+        process, self._process, self._desktop = self._process, None, None
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _kill(self):
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def is_healthy(self):
+        """Процесс жив и отвечает на вызов UNO."""
+        if not self.persistent:
+            return True
+        if self._process is None or self._process.poll() is not None or self._desktop is None:
+            return False
+        try:
+            self._desktop.getCurrentComponent()
+        except Exception as e:
+            logger.warning(f"LibreOffice воркер {self.index} не отвечает: {e}")
+            return False
+        return True
+
+    def ensure_ready(self):
+        """Проверка перед конвертацией: перезапуск после сбоя или лимита конвертаций."""
+        if not self.persistent:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            return
+        if self._process is not None:
+            if self.conversions >= self.pool.max_conversions:
+                logger.info(f"LibreOffice воркер {self.index}: {self.conversions} конвертаций, перезапуск")
+                self.stop()
+            elif not self.is_healthy():
+                logger.warning(f"LibreOffice воркер {self.index} неисправен, перезапуск")
+                self.stop()
+        if self._process is None:
+            self.start()
+
+    def convert(self, docx_content, timeout):
+        """Конвертирует DOCX в PDF; при превышении timeout процесс перезапускается."""
+        self.ensure_ready()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            docx_path = os.path.join(temp_dir, 'document.docx')
+            pdf_path = os.path.join(temp_dir, 'document.pdf')
+            with open(docx_path, 'wb') as docx_file:
+                docx_file.write(docx_content)
+
+            started = time.monotonic()
+            if self.persistent:
+                self._convert_uno(docx_path, pdf_path, timeout)
+            else:
+                self._convert_subprocess(docx_path, temp_dir, timeout)
+            self.conversions += 1
+            logger.info(f"LibreOffice воркер {self.index}: конвертация за {time.monotonic() - started:.2f} с")
+            return _read_pdf(pdf_path)
+
+    def _convert_uno(self, docx_path, pdf_path, timeout):
+        # Вызовы UNO блокирующие: по таймауту процесс убивается, и вызов завершается ошибкой
+        timer = threading.Timer(timeout, self._kill)
+        timer.start()
+        try:
+            document = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(docx_path), '_blank', 0, _uno_properties(Hidden=True, ReadOnly=True)
+            )
+            if document is None:
+                raise PdfBackendError("LibreOffice не смог открыть DOCX")
+            try:
+                document.storeToURL(uno.systemPathToFileUrl(pdf_path), _uno_properties(FilterName='writer_pdf_Export'))
+            finally:
+                document.close(True)
+        except PdfBackendError:
+            raise
+        except Exception as e:
+            timed_out = not timer.is_alive()
+            self.stop()
+            if timed_out:
+                raise PdfBackendError(f"Конвертация в PDF не уложилась в {timeout} с") from e
+            raise PdfBackendError(f"Ошибка при конвертации в PDF: {e}") from e
+        finally:
+            timer.cancel()
+
+    def _convert_subprocess(self, docx_path, out_dir, timeout):
+        try:
+            subprocess.run(
+                self._command('--convert-to', 'pdf', '--outdir', out_dir, docx_path),
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                timeout=timeout, check=True,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise PdfBackendError(f"Конвертация в PDF не уложилась в {timeout} с") from e
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise PdfBackendError(f"Ошибка при конвертации в PDF: {e}") from e
+
+
+class LibreOfficePool(PdfBackend):
+    """
+    Пул заранее запущенных процессов LibreOffice для конвертации в PDF на Linux.
+
+    Каждый воркер обслуживает одну конвертацию за раз, поэтому пропускная
+    способность растет с размером пула. Ожидающих воркера запросов не больше
+    EXPORT_PDF_QUEUE_DEPTH: остальные сразу получают PdfQueueFullError.
+    Воркеры запускаются при первой конвертации, проверяются перед каждой
+    конвертацией и перезапускаются после сбоя, таймаута или
+    EXPORT_PDF_MAX_CONVERSIONS конвертаций (LibreOffice накапливает память).
+
+    Пул создается один раз на процесс (после fork — заново, процессы
+    LibreOffice родителя не используются). В воркерах пула экспорта он
+    состоит из EXPORT_PDF_WORKERS_PER_EXPORT_PROCESS процессов (по умолчанию
+    один), чтобы число LibreOffice не умножалось на число воркеров экспорта.
+    """
+
+    name = 'libreoffice'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = None
+        self._idle = None
+        self._slots = None
+        self._pid = None
+        self._atexit_registered = False
+
+    @property
+    def soffice(self):
+        return getattr(settings, 'EXPORT_PDF_SOFFICE', 'soffice')
+
+    @property
+    def size(self):
+        if _export_worker_process:
+            return getattr(settings, 'EXPORT_PDF_WORKERS_PER_EXPORT_PROCESS', 1)
+        return getattr(settings, 'EXPORT_PDF_WORKERS', 2)
+
+    @property
+    def queue_depth(self):
+        return getattr(settings, 'EXPORT_PDF_QUEUE_DEPTH', 8)
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'EXPORT_PDF_TIMEOUT', 120)
+
+    @property
+    def start_timeout(self):
+        return getattr(settings, 'EXPORT_PDF_START_TIMEOUT', 60)
+
+    @property
+    def max_conversions(self):
+        return getattr(settings, 'EXPORT_PDF_MAX_CONVERSIONS', 200)
+
+    @property
+    def profile_root(self):
+        directory = getattr(settings, 'EXPORT_PDF_PROFILE_DIR', None)
+        if not directory:
+            directory = os.path.join(tempfile.gettempdir(), 'gost_docs_office')
+        # Профили разных процессов Django не должны пересекаться
+        return os.path.join(str(directory), str(os.getpid()))
+
+    @classmethod
+    def available(cls):
+        return shutil.which(getattr(settings, 'EXPORT_PDF_SOFFICE', 'soffice')) is not None
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._workers is not None and self._pid != os.getpid():
+                # Процесс получен через fork: воркеры и очередь принадлежат родителю
+                self._workers = None
+            if self._workers is None:
+                logger.info(
+                    f"Пул LibreOffice: {self.size} воркеров, очередь {self.queue_depth}, "
+                    f"режим {'UNO' if uno is not None else 'soffice --convert-to'}"
+                )
+                self._pid = os.getpid()
+                self._workers = [OfficeWorker(self, index) for index in range(self.size)]
+                self._idle = queue.Queue()
+                for worker in self._workers:
+                    self._idle.put(worker)
+                # Одновременно: по одной конвертации на воркер и ограниченная очередь ожидающих
+                self._slots = threading.BoundedSemaphore(self.size + self.queue_depth)
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+
+    def convert(self, docx_content):
+        self._ensure_pool()
+        if not self._slots.acquire(blocking=False):
+            raise PdfQueueFullError("Очередь конвертации в PDF переполнена, попробуйте позже")
+        try:
+            try:
+                worker = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PdfBackendError(f"Нет свободного конвертера PDF в течение {self.timeout} с")
+            try:
+                return worker.convert(docx_content, self.timeout)
+            finally:
+                self._idle.put(worker)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        """Останавливает процессы LibreOffice и удаляет их профили."""
+        with self._lock:
+            workers, self._workers = self._workers, None
+            if self._pid != os.getpid():
+                # Процессы LibreOffice запущены родителем, и останавливает их он
+                return
+        for worker in workers or ():
+            worker.stop()
+        shutil.rmtree(self.profile_root, ignore_errors=True)
+
+
+docx2pdf_backend = Docx2PdfBackend()
+office_pool = LibreOfficePool()
+
+
+def get_pdf_backend():
+    """
+    Возвращает бэкенд конвертации по настройке EXPORT_PDF_BACKEND:
+    'docx2pdf', 'libreoffice' или 'auto' (docx2pdf в Windows, иначе пул
+    LibreOffice, если soffice найден).
+    """
+    backend = getattr(settings, 'EXPORT_PDF_BACKEND', 'auto')
+    if backend == 'auto':
+        if sys.platform == 'win32' or not LibreOfficePool.available():
+            return docx2pdf_backend
+        return office_pool
+    if backend == 'libreoffice':
+        return office_pool
+    return docx2pdf_backend
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from documents.services.export_adapters import EXPORT_ADAPTERS
+from documents.services.export_warmup import export_warmup
+
+
+def schedule_export_warmup(sender, instance, raw=False, **kwargs):
+    """После сохранения документа ставит прогрев его экспорта (если включен)."""
+    if raw or not export_warmup.enabled:
+        return
+    adapter = next(adapter for adapter in EXPORT_ADAPTERS.values() if adapter.model is sender)
+    transaction.on_commit(lambda: export_warmup.schedule(adapter.kind, instance.pk))
+
+
+def connect_signals():
+    """Подключает прогрев экспорта к сохранению документов всех типов."""
+    for adapter in EXPORT_ADAPTERS.values():
+        post_save.connect(
+            schedule_export_warmup,
+            sender=adapter.model,
+            dispatch_uid=f'export_warmup_{adapter.kind}',
+        )
@@ -1,3 +1,1290 @@
-from django.test import TestCase
+import base64
+import collections
+import http.server
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import types
+import warnings
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from docx import Document
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import Part
+from docx.oxml.ns import nsdecls, qn
+from docx.oxml.parser import parse_xml
+from docx.shared import Cm, Pt
+import lxml.html
+from lxml import etree
+from PIL import Image
+
+from documents.management.commands.benchmark_export import (
+    CORPUS_DIR, make_sample_document, make_sample_html, summarize_body,
+)
+from documents.models import Document_main, ExportJob, gost, sto
+from documents.services.export_adapters import get_export_adapter
+from documents.services.export_admission import ExportAdmission, ExportRejected, export_admission
+from documents.services.export_cache import ExportResultCache, export_cache
+from documents.services.export_flight import ExportSingleFlight
+from documents.services.export_warmup import export_warmup, warm_export
+from documents.services.body_prototypes import BodyPrototypeCache, get_profile
+from documents.services.docx_formatting import apply_style_formatting
+from documents.services.html_frontend import parse_html
+from documents.services.field_replacer import FieldReplacer
+from documents.services.fragment_cache import FragmentCache
+from documents.services import batch_export
+from documents.services.docx_composer import DocxComposer, compose_documents
+from documents.services.docx_templates import DocxTemplateCache, template_cache
+from documents.services.export_jobs import ExportWorkerPool, cleanup_export_jobs, fail_stale_jobs, run_export_job
+from documents.services import fast_pdf, pdf_backends
+from documents.services.image_cache import CachedImage, image_cache
+from documents.services.image_fetcher import ImageFetcher
+from documents.services.image_optimizer import optimize_image
+from documents.services.image_resolver import resolve_local_image
+from documents.views.export import (
+    add_content_fragments, ensure_basic_styles, export_document, export_rejected_response, get_export_key,
+    get_template_name, new_body_document, process_html_to_docx, render_docx, render_title_page,
+)
+
+
+class DocxTemplateCacheTests(SimpleTestCase):
+    """Процессный кэш DOCX-шаблонов титульных листов."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'diplo_project.docx')
+        self.save_template('Титульный лист')
+        templates_dir = mock.patch('documents.services.docx_templates.get_templates_dir', return_value=directory.name)
+        templates_dir.start()
+        self.addCleanup(templates_dir.stop)
+        self.cache = DocxTemplateCache()
+
+    def save_template(self, text):
+        template = Document()
+        template.add_paragraph(text)
+        template.save(self.path)
+
+    def test_template_is_independent_copy(self):
+        first = self.cache.get_template('diplo_project')
+        first.docx.add_paragraph('Изменение')
+        second = self.cache.get_template('diplo_project')
+        self.assertEqual([p.text for p in second.docx.paragraphs], ['Титульный лист'])
+        self.assertEqual(self.cache.stats(), {'templates': 1, 'hits': 1, 'misses': 1})
+
+    def test_version_is_not_counted_and_stat_once_per_export(self):
+        with mock.patch('documents.services.docx_templates.os.stat', wraps=os.stat) as stat:
+            # Как при экспорте: ключ DOCX, ключ титульного листа, сам шаблон
+            version = self.cache.get_version('diplo_project')
+            self.assertEqual(self.cache.get_version('diplo_project'), version)
+            self.cache.get_template('diplo_project')
+        self.assertEqual(stat.call_count, 1)
+        self.assertEqual(self.cache.stats(), {'templates': 1, 'hits': 1, 'misses': 1})
+
+    def test_changed_file_reloaded_after_check_interval(self):
+        version = self.cache.get_version('diplo_project')
+        self.save_template('Новый титульный лист')
+        self.assertEqual(self.cache.get_version('diplo_project'), version)
+
+        self.cache.check_interval = 0
+        self.assertNotEqual(self.cache.get_version('diplo_project'), version)
+        template = self.cache.get_template('diplo_project')
+        self.assertEqual([p.text for p in template.docx.paragraphs], ['Новый титульный лист'])
+
+
+class DocxPackageTests(SimpleTestCase):
+    """Целостность пакета итогового DOCX."""
+
+    def test_no_duplicate_zip_entries(self):
+        """В DOCX нет повторяющихся записей ни в однопроходном, ни в прежнем режиме сборки."""
+        document = make_sample_document(2)
+        for single_pass in (True, False):
+            with self.subTest(single_pass=single_pass):
+                with override_settings(DOCX_EXPORT_SINGLE_PASS=single_pass, EXPORT_FRAGMENT_CACHE=False):
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('error')
+                        content = render_docx(document)
+                names = zipfile.ZipFile(io.BytesIO(content)).namelist()
+                duplicates = [name for name, count in collections.Counter(names).items() if count > 1]
+                self.assertEqual(duplicates, [])
+                self.assertIn('docProps/core.xml', names)
+
+
+class ExportResultCacheTests(SimpleTestCase):
+    """Вытеснение из дискового кэша экспорта."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_put_does_not_walk_directory_every_time(self):
+        """Каталог обходится при первой записи и при превышении лимита, а не на каждой записи."""
+        cache = ExportResultCache(self.directory.name, max_bytes=10 * 1024)
+        with mock.patch('documents.services.export_cache.os.walk', wraps=os.walk) as walk:
+            for index in range(50):
+                cache.put(f"{index:064x}", 'docx', b'x' * 100)
+            self.assertEqual(walk.call_count, 1)
+
+            for index in range(50, 200):
+                cache.put(f"{index:064x}", 'docx', b'x' * 100)
+            self.assertLess(walk.call_count, 20)
+
+    def test_evicts_to_limit(self):
+        cache = ExportResultCache(self.directory.name, max_bytes=10 * 1024)
+        for index in range(300):
+            cache.put(f"{index:064x}", 'docx', b'x' * 100)
+        total = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(self.directory.name) for name in files
+        )
+        self.assertLessEqual(total, 10 * 1024)
+        self.assertIsNotNone(cache.get(f"{299:064x}", 'docx'))
+
+
+class ExportJobRecoveryTests(TestCase):
+    """Задачи экспорта, воркер которых завершился аварийно, и очистка старых задач."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # Хранилище поля создается при импорте модели, поэтому подменяем его, а не EXPORT_JOBS_DIR
+        storage = mock.patch.object(
+            ExportJob._meta.get_field('file'), 'storage', FileSystemStorage(location=self.directory.name)
+        )
+        storage.start()
+        self.addCleanup(storage.stop)
+
+        user = User.objects.create_user('exporter')
+        self.document = Document_main.objects.create(
+            owner=user, work_type='REF', title='Тема', supervisor='Петров П.П.', student_name='Иванов И.И.',
+        )
+        self.owner = user
+
+    def create_job(self, **fields):
+        return ExportJob.objects.create(owner=self.owner, document=self.document, format='docx', **fields)
+
+    def test_broken_worker_fails_job(self):
+        job = self.create_job(status=ExportJob.STATUS_RUNNING, started_at=timezone.now())
+        future = Future()
+        future.set_exception(BrokenProcessPool('процесс воркера завершился'))
+        ExportWorkerPool()._job_done(job.pk, future)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_FAILED)
+        self.assertIn('аварийно', job.error)
+
+    def test_stale_running_job_fails(self):
+        stale = self.create_job(status=ExportJob.STATUS_RUNNING, started_at=timezone.now() - timedelta(hours=1))
+        fresh = self.create_job(status=ExportJob.STATUS_RUNNING, started_at=timezone.now())
+        with override_settings(EXPORT_JOB_LEASE=600):
+            self.assertEqual(fail_stale_jobs(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ExportJob.STATUS_FAILED)
+        self.assertEqual(fresh.status, ExportJob.STATUS_RUNNING)
+
+    def test_job_admitted_through_memory_budget(self):
+        """Задача ждет слота пользователя в воркере и рендерится внутри допуска."""
+        job = self.create_job()
+        held = export_admission.admit(self.owner)
+        running = []
+
+        def render(*args):
+            running.append(export_admission.state()['running'])
+            return b'docx'
+
+        def release_slot(seconds):
+            held.release()
+
+        with mock.patch('documents.views.export.render_export', side_effect=render), \
+                mock.patch.object(export_cache, 'get', return_value=None), \
+                mock.patch.object(export_cache, 'put'), \
+                mock.patch('documents.services.export_admission.time.sleep', side_effect=release_slot) as sleep:
+            run_export_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_DONE)
+        self.assertEqual(running, [1])
+        sleep.assert_called()
+        self.assertEqual(export_admission.state()['running'], 0)
+
+    def test_cleanup_removes_old_jobs_and_files(self):
+        old = self.create_job(status=ExportJob.STATUS_DONE)
+        old.file.save('old.docx', ContentFile(b'old'))
+        ExportJob.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        recent = self.create_job(status=ExportJob.STATUS_DONE)
+        recent.file.save('recent.docx', ContentFile(b'recent'))
+
+        with override_settings(EXPORT_JOBS_RETENTION=60 * 60):
+            self.assertEqual(cleanup_export_jobs(), 1)
+
+        self.assertFalse(ExportJob.objects.filter(pk=old.pk).exists())
+        self.assertFalse(os.path.exists(old.file.path))
+        self.assertTrue(os.path.exists(recent.file.path))
+
+
+def make_png(index):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), (index % 256, index // 256 % 256, 128)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ImageServerMixin:
+    """Локальный HTTP-сервер с изображениями: /slow/* отвечает с задержкой, /hang/* — дольше срока загрузки."""
+
+    delay = 0.3
+
+    def start_image_server(self, headers=None):
+        self.requests = []
+        self.image = make_png(3)
+        test = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                test.requests.append((self.path, self.headers.get('If-None-Match')))
+                if self.path.startswith('/slow/'):
+                    time.sleep(test.delay)
+                elif self.path.startswith('/hang/'):
+                    time.sleep(2)
+                if self.headers.get('If-None-Match') == '"v1"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(test.image)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(test.image)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_port}"
+
+    def use_temp_image_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(EXPORT_IMAGE_CACHE_DIR=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+@override_settings(EXPORT_IMAGE_FETCH_WORKERS=8, EXPORT_IMAGE_FETCH_PER_HOST=8)
+class ImageFetcherTests(ImageServerMixin, SimpleTestCase):
+    """Параллельная загрузка изображений документа."""
+
+    def setUp(self):
+        self.start_image_server()
+        self.use_temp_image_cache()
+
+    def test_images_fetched_concurrently_once_per_url(self):
+        urls = [f"{self.base_url}/slow/{index}.png" for index in range(6)]
+        started = time.monotonic()
+        results = ImageFetcher().fetch_all(urls + urls[:3])
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(set(results), set(urls))
+        self.assertTrue(all(result.ok and result.content == self.image for result in results.values()))
+        self.assertEqual(sorted(path for path, _ in self.requests), sorted(f"/slow/{index}.png" for index in range(6)))
+        self.assertLess(elapsed, 6 * self.delay)
+
+    @override_settings(EXPORT_IMAGE_FETCH_DEADLINE=0.5)
+    def test_deadline_skips_slow_images(self):
+        fast, hung = f"{self.base_url}/fast.png", f"{self.base_url}/hang/1.png"
+        started = time.monotonic()
+        results = ImageFetcher().fetch_all([fast, hung])
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(results[fast].ok)
+        self.assertFalse(results[hung].ok)
+        self.assertIsNotNone(results[hung].error)
+
+
+class ImageCacheTests(ImageServerMixin, SimpleTestCase):
+    """Общий дисковый кэш загруженных и декодированных изображений."""
+
+    def setUp(self):
+        self.use_temp_image_cache()
+
+    def test_fresh_image_served_without_request(self):
+        self.start_image_server({'Cache-Control': 'max-age=3600'})
+        url = f"{self.base_url}/fresh.png"
+        self.assertEqual(ImageFetcher().fetch(url).source, 'network')
+
+        cached = ImageFetcher().fetch(url)
+        self.assertEqual((cached.source, cached.content, cached.content_type), ('cache', self.image, 'image/png'))
+        self.assertEqual((cached.image.width, cached.image.height), (4, 4))
+        self.assertEqual(len(self.requests), 1)
+
+    def test_stale_image_revalidated_with_etag(self):
+        self.start_image_server({'Cache-Control': 'max-age=0', 'ETag': '"v1"'})
+        url = f"{self.base_url}/stale.png"
+        ImageFetcher().fetch(url)
+
+        revalidated = ImageFetcher().fetch(url)
+        self.assertEqual((revalidated.source, revalidated.content), ('revalidated', self.image))
+        self.assertEqual(self.requests, [('/stale.png', None), ('/stale.png', '"v1"')])
+
+    def test_data_uri_decoded_once(self):
+        src = 'data:image/png;base64,' + base64.b64encode(make_png(5)).decode()
+        with mock.patch('documents.services.image_cache.base64.b64decode', wraps=base64.b64decode) as decode:
+            first = image_cache.load_data_uri(src)
+            second = image_cache.load_data_uri(src)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.content_type, 'image/png')
+
+
+class ImageOptimizerTests(ImageServerMixin, SimpleTestCase):
+    """Подготовка изображений к печати перед вставкой в DOCX."""
+
+    # Ширина области печати 17 см при 300 dpi
+    max_width = round(17 / 2.54 * 300)
+
+    def setUp(self):
+        self.use_temp_image_cache()
+
+    def encode(self, img, format):
+        buffer = io.BytesIO()
+        img.save(buffer, format)
+        return CachedImage.from_content(buffer.getvalue())
+
+    def test_photo_downscaled_to_jpeg(self):
+        photo = self.encode(Image.merge('RGB', [Image.effect_noise((2400, 1200), 64) for _ in range(3)]), 'PNG')
+        optimized = optimize_image(photo)
+        self.assertEqual((optimized.content_type, optimized.width, optimized.height),
+                         ('image/jpeg', self.max_width, 1004))
+        self.assertLess(len(optimized.content), len(photo.content))
+        with Image.open(io.BytesIO(optimized.content)) as img:
+            self.assertEqual(round(img.info['dpi'][0]), 300)
+
+        with mock.patch('documents.services.image_optimizer._optimize') as optimize:
+            self.assertEqual(optimize_image(photo).content, optimized.content)
+        optimize.assert_not_called()
+
+    def test_diagram_stays_png(self):
+        img = Image.new('RGB', (3000, 1000), 'white')
+        img.paste((0, 0, 0), (0, 480, 3000, 520))
+        optimized = optimize_image(self.encode(img, 'PNG'))
+        self.assertEqual((optimized.content_type, optimized.width), ('image/png', self.max_width))
+
+    def test_small_image_kept_as_is(self):
+        image = CachedImage.from_content(make_png(1))
+        self.assertEqual(optimize_image(image).content, image.content)
+
+    @override_settings(EXPORT_IMAGE_OPTIMIZE=False)
+    def test_disabled(self):
+        photo = self.encode(Image.effect_noise((2400, 100), 64), 'PNG')
+        self.assertIs(optimize_image(photo), photo)
+
+
+class ImageResolverTests(ImageServerMixin, SimpleTestCase):
+    """Локальные изображения читаются из хранилища, а не запросом к своему сайту."""
+
+    def setUp(self):
+        self.use_temp_image_cache()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        os.makedirs(os.path.join(directory.name, 'uploads', '2024'))
+        self.content = make_png(9)
+        with open(os.path.join(directory.name, 'uploads', '2024', 'рисунок 1.png'), 'wb') as f:
+            f.write(self.content)
+        override = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        session = mock.patch('requests.Session.get', side_effect=AssertionError('запрос к сайту'))
+        session.start()
+        self.addCleanup(session.stop)
+
+    def test_media_upload_read_from_storage(self):
+        image = resolve_local_image('/media/uploads/2024/%D1%80%D0%B8%D1%81%D1%83%D0%BD%D0%BE%D0%BA%201.png')
+        self.assertEqual((image.content, image.content_type), (self.content, 'image/png'))
+
+    def test_missing_and_outside_paths(self):
+        self.assertIsNone(resolve_local_image('/media/uploads/2024/missing.png'))
+        self.assertIsNone(resolve_local_image('/media/../../../etc/passwd'))
+        self.assertIsNone(resolve_local_image('/../../etc/passwd'))
+
+
+class InMemoryImageTests(SimpleTestCase):
+    """Изображения вставляются в DOCX из памяти, без временных файлов."""
+
+    def test_images_embedded_without_temp_files(self):
+        blob = make_png(11)
+        html = f'<p>Рисунок<img src="data:image/png;base64,{base64.b64encode(blob).decode()}"></p>'
+        document = Document()
+        with mock.patch('tempfile.NamedTemporaryFile', side_effect=AssertionError('временный файл')), \
+                mock.patch('tempfile.mkdtemp', side_effect=AssertionError('временный каталог')):
+            self.assertTrue(process_html_to_docx(html, document))
+        blips = document.element.body.xpath('.//a:blip/@r:embed')
+        self.assertEqual(len(blips), 1)
+        self.assertEqual(document.part.rels[blips[0]].target_part.blob, optimize_image(CachedImage.from_content(blob)).content)
+
+
+class HtmlFrontendTests(SimpleTestCase):
+    """HTML из CKEditor разбирается один раз, и htmldocx получает готовый поток событий."""
+
+    html = (
+        '<p style="text-indent: 1.25cm">Абзац с отступом</p>'
+        '<p class="has-indent">&nbsp;&nbsp;&nbsp;&nbsp;Четыре пробела</p>'
+        '<p class="has-indent">Отступ по классу</p>'
+    )
+
+    def test_parsed_once(self):
+        document = Document()
+        with override_settings(DOCX_HTML_EMITTER='htmldocx'), \
+                mock.patch('lxml.html.document_fromstring', wraps=lxml.html.document_fromstring) as parse, \
+                mock.patch('bs4.BeautifulSoup', side_effect=AssertionError('повторный разбор')):
+            self.assertTrue(process_html_to_docx(self.html, document))
+        self.assertEqual(parse.call_count, 1)
+
+        paragraphs = document.paragraphs
+        self.assertEqual([p.text.strip() for p in paragraphs], ['Абзац с отступом', 'Четыре пробела', 'Отступ по классу'])
+        self.assertEqual(round(paragraphs[0].paragraph_format.first_line_indent.cm, 2), 1.25)
+        # Ведущие неразрывные пробелы заменяются отступом 0,25 см на пробел
+        self.assertEqual(round(paragraphs[1].paragraph_format.first_line_indent.cm, 2), 1.0)
+        self.assertEqual(round(paragraphs[2].paragraph_format.first_line_indent.cm, 2), 1.25)
+
+    def test_parse_collects_images_and_paragraphs(self):
+        parsed = parse_html(self.html + '<p><img src="/media/a.png"><img src="data:image/png;base64,AA=="></p>')
+        self.assertEqual(parsed.images, ['/media/a.png', 'data:image/png;base64,AA=='])
+        self.assertEqual([info['nbsp'] for info in parsed.paragraphs.values()], [0, 4, 0])
+
+
+# Структура тела по образцам html_corpus (summarize_body) и число неразрывных
+# пробелов в тексте. Отличия от htmldocx намеренные: вложенная таблица остается
+# в своей ячейке (03), blockquote и div — отдельные абзацы (04), изображение из
+# ячейки остается в ней (05), неразрывные пробелы в тексте сохраняются
+# (htmldocx их теряет); ячейка из одного &nbsp; остается пустой, как и в htmldocx
+CORPUS_EXPECTED = {
+    '01_paragraphs.html': ([
+        "p [Heading1] 'Введение' 0",
+        "p [] 'Актуальность темы исследования обусловлена ростом объемов данных, которые требуется обрабатывать в реальном времени. В работе рассматриваются методы оптимизации.' 0",
+        "p [] 'Целью работы является разработка методики оценки производительности.' 0",
+        "p [] 'Задачи исследования:' 0",
+        "p [] 'Абзац, отступ которого набран неразрывными пробелами.' 0",
+        "p [] 'Рисунок 1 – Схема алгоритма' 0",
+        "p [] 'Продолжение таблицы 1' 0",
+        "p [Heading2] '1.1 Обзор литературы' 0",
+        "p [] 'Вопросами производительности занимались многие авторы [1, 2]. Формула E = mc2 и химическая формула H2O.' 0",
+        "p [Heading3] '1.1.1 Подраздел' 0",
+        "p [] 'Текст с переносом строкивнутри абзаца.' 0",
+        "p [] 'Абзац после горизонтальной линии.' 0",
+    ], 8),
+    '02_lists.html': ([
+        "p [] 'Требования к системе:' 0",
+        "p [ListBullet] 'высокая производительность;' 0",
+        "p [ListBullet] 'надежность хранения данных;' 0",
+        "p [ListBullet] 'масштабируемость:' 0",
+        "p [ListBullet] 'горизонтальная;' 0",
+        "p [ListBullet] 'вертикальная.' 0",
+        "p [] 'Этапы работы:' 0",
+        "p [ListNumber] 'Анализ предметной области.' 0",
+        "p [ListNumber] 'Проектирование архитектуры.' 0",
+        "p [ListNumber] 'Реализация и тестирование.' 0",
+        "p [ListNumber] 'Внедрение.' 0",
+    ], 0),
+    '03_tables.html': ([
+        "p [] 'Таблица 1 – Результаты измерений' 0",
+        "tbl 5 ['Параметр', 'Значение', 'Единица', 'Время отклика', '120', 'мс', 'Пропускная способность', '850', 'запросов/с', 'Память', '256', 'МБ', '', '', ''] 0",
+        "p [] 'Текст после таблицы.' 0",
+        "tbl 1 ['Вложенная таблица:ab', 'a', 'b', 'пункт в ячейке'] 0",
+    ], 0),
+    '04_inline.html': ([
+        "p [] 'Текст полужирный, курсив, подчеркнутый, зачеркнутый и полужирный курсив.' 0",
+        "p [] 'Красный текст, синий текст и выделение фоном.' 0",
+        "p [] 'Текст с указанием шрифта и размера.' 0",
+        "p [] 'Ссылка на сайт Росстандарта и DOI документа.' 0",
+        "p [] 'Код в тексте: SELECT * FROM documents.' 0",
+        "p [] 'def export(document):return render(document)' 0",
+        "p [] 'Цитата из источника, оформленная в CKEditor как blockquote.' 0",
+        "p [] 'Текст в блоке div по центру' 0",
+    ], 3),
+    '05_images.html': ([
+        "p [] 'Рисунок ниже показывает схему:' 0",
+        "p [] '' 1",
+        "p [] 'Рисунок 1 – Схема' 0",
+        "p [] 'Текст до изображения [Изображение недоступно: /media/uploads/2024/05/missing.png] и после него.' 0",
+        "tbl 1 ['', 'Подпись к изображению в таблице'] 1",
+    ], 1),
+    '06_word_paste.html': ([
+        "p [] 'Текст, вставленный из Microsoft Word, сохраняет служебную разметку.' 0",
+        "p [] '1. Пункт списка из Word.' 0",
+        "p [] 'Жирный заголовок абзаца. Обычный текст после него.' 0",
+        "p [Heading2] '1.2 Раздел из Word' 0",
+    ], 6),
+}
+
+
+class OoxmlEmitterCorpusTests(SimpleTestCase):
+    """Собственный эмиттер OOXML на образцах CKEditor из html_corpus."""
+
+    def test_corpus(self):
+        self.assertEqual(sorted(name for name in os.listdir(CORPUS_DIR) if name.endswith('.html')), sorted(CORPUS_EXPECTED))
+        for name, (expected, nbsp) in CORPUS_EXPECTED.items():
+            with self.subTest(name):
+                with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+                    html = f.read()
+                document = Document()
+                ensure_basic_styles(document)
+                process_html_to_docx(html, document, emitter='native')
+
+                self.assertEqual(summarize_body(document), expected)
+                texts = ''.join(t.text or '' for t in document.element.body.iter(qn('w:t')))
+                self.assertEqual(texts.count('\u00A0'), nbsp)
+
+
+class StyleFormattingTests(SimpleTestCase):
+    """Оформление по ГОСТ через стили вместо прямого форматирования каждого прогона."""
+
+    def test_body_and_headings_formatted_by_styles(self):
+        document = Document()
+        document.add_heading('Введение', 1)
+        paragraph = document.add_paragraph()
+        run = paragraph.add_run('Основной текст')
+        run.font.name = 'Times New Roman'
+        run.font.size = Pt(12)
+        run.font.bold = True
+        document.add_paragraph('')
+
+        counters = apply_style_formatting(document)
+
+        heading, body, empty = document.paragraphs
+        self.assertEqual(body.style.name, 'Body Text')
+        self.assertIsNone(body.paragraph_format.first_line_indent)
+        self.assertEqual(round(body.style.paragraph_format.first_line_indent.cm, 2), 1.25)
+        # Совпадающее со стилем прямое форматирование удалено, отличающееся осталось
+        self.assertIsNone(run.font.name)
+        self.assertIsNone(run.font.size)
+        self.assertTrue(run.font.bold)
+        self.assertEqual(heading.alignment, WD_ALIGN_PARAGRAPH.CENTER)
+        self.assertTrue(all(r.font.name == 'Times New Roman' for r in heading.runs))
+        self.assertEqual(empty.style.name, 'Normal')
+        self.assertEqual(counters['paragraphs'], 2)
+        self.assertEqual(counters['removed'], 2)
+
+        # Повторное оформление ничего не меняет
+        self.assertEqual(apply_style_formatting(document), {'paragraphs': 2, 'written': 0, 'removed': 0})
+
+
+CHART_NS = 'http://schemas.openxmlformats.org/drawingml/2006/chart'
+RT_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+def make_image_fragments(count, unique):
+    """Четыре фрагмента с count изображениями, из которых unique различных."""
+    blobs = [make_png(index) for index in range(unique)]
+    fragments = []
+    for part_no in range(4):
+        fragment = Document()
+        for index in range(part_no * count // 4, (part_no + 1) * count // 4):
+            fragment.add_paragraph(f"Рисунок {index + 1}")
+            fragment.add_picture(io.BytesIO(blobs[index % unique]), width=Cm(1))
+        fragments.append(fragment)
+    return fragments
+
+
+def make_chart_fragment(title):
+    """Фрагмент с диаграммой /word/charts/chart1.xml, в заголовке которой title."""
+    fragment = Document()
+    chart = Part(
+        PackURI('/word/charts/chart1.xml'),
+        CT.DML_CHART,
+        f'<c:chartSpace xmlns:c="{CHART_NS}"><c:chart><c:title>{title}</c:title></c:chart></c:chartSpace>'.encode(),
+        fragment.part.package,
+    )
+    rId = fragment.part.relate_to(chart, RT.CHART)
+    fragment.add_paragraph(title)._p.append(parse_xml(
+        f'<w:r {nsdecls("w", "r", "wp", "a")}><w:drawing><wp:inline><a:graphic>'
+        f'<a:graphicData uri="{CHART_NS}"><c:chart xmlns:c="{CHART_NS}" r:id="{rId}"/>'
+        f'</a:graphicData></a:graphic></wp:inline></w:drawing></w:r>'
+    ))
+    return fragment
+
+
+class DocxComposerTests(SimpleTestCase):
+    """Сборка DOCX из фрагментов (DocxComposer)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Фрагменты строятся один раз: add_picture в python-docx сам по себе квадратичный
+        cls.fragments = {count: make_image_fragments(count, count // 2) for count in (250, 1000)}
+
+    def test_media_deduplicated(self):
+        merged = compose_documents(Document(), self.fragments[1000])
+        rels = merged.part.rels
+        embeds = merged.element.body.xpath('.//a:blip/@r:embed')
+        self.assertEqual(len(embeds), 1000)
+        self.assertEqual([rId for rId in embeds if rId not in rels], [])
+        self.assertEqual(len(merged.part.package.image_parts), 500)
+        self.assertEqual(len({rels[rId].target_part.partname for rId in embeds}), 500)
+
+    def test_merge_time_grows_linearly(self):
+        """Время на изображение почти не растет с числом изображений (квадратичный рост дал бы x4)."""
+        def per_image(count):
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                compose_documents(Document(), self.fragments[count])
+                timings.append(time.perf_counter() - started)
+            return min(timings) / count
+
+        self.assertLess(per_image(1000) / per_image(250), 2.5)
+
+    def test_existing_partname_remaps_relationship(self):
+        """Ссылка на часть, имя которой уже есть в приемнике, переводится на связь приемника."""
+        target = Document()
+        fragment = Document()
+        fragment_rels = fragment.part.rels
+        styles_rId = next(rId for rId, rel in fragment_rels.items() if rel.reltype == RT.STYLES)
+        styles_part = fragment_rels.pop(styles_rId).target_part
+        fragment_rels._target_parts_by_rId.pop(styles_rId)
+        fragment_rels.add_relationship(RT.STYLES, styles_part, 'rId99')
+
+        paragraph = fragment.add_paragraph('Ссылка')._p
+        hyperlink = paragraph.makeelement(qn('w:hyperlink'), {qn('r:id'): 'rId99'})
+        paragraph.append(hyperlink)
+
+        DocxComposer(target).append(fragment, move=True)
+
+        rId = target.element.body.xpath('.//w:hyperlink/@r:id')[0]
+        self.assertNotEqual(rId, 'rId99')
+        self.assertIs(target.part.rels[rId].target_part, target.part.part_related_by(RT.STYLES))
+
+    def test_same_partname_content_parts_copied(self):
+        """Диаграммы двух фрагментов с одним именем chart1.xml не подменяют друг друга."""
+        target = Document()
+        composer = DocxComposer(target)
+        composer.append(make_chart_fragment('Первая'))
+        composer.append(make_chart_fragment('Вторая'))
+
+        buffer = io.BytesIO()
+        target.save(buffer)
+        with zipfile.ZipFile(buffer) as archive:
+            names = [name for name in archive.namelist() if name.startswith('word/charts/')]
+        self.assertEqual(sorted(names), ['word/charts/chart1.xml', 'word/charts/chart2.xml'])
+
+        saved = Document(io.BytesIO(buffer.getvalue()))
+        rIds = etree.XPath('.//c:chart/@r:id', namespaces={'c': CHART_NS, 'r': RT_NS})(saved.element.body)
+        charts = [saved.part.rels[rId].target_part.blob.decode() for rId in rIds]
+        self.assertEqual(len(charts), 2)
+        self.assertIn('Первая', charts[0])
+        self.assertIn('Вторая', charts[1])
+
+
+class FieldReplacerTests(SimpleTestCase):
+    """Замена полей шаблона за один проход (FieldReplacer)."""
+
+    def test_field_split_across_runs_keeps_formatting(self):
+        document = Document()
+        paragraph = document.add_paragraph()
+        paragraph.add_run('Тема: {{TI')
+        paragraph.add_run('TLE}}').bold = True
+        paragraph.add_run(', автор {{AUTHOR}}.').italic = True
+
+        count = FieldReplacer({'{{TITLE}}': 'Оптимизация', '{{AUTHOR}}': 'Иванов И.И.'}).replace(document)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(paragraph.text, 'Тема: Оптимизация, автор Иванов И.И..')
+        runs = paragraph.runs
+        self.assertEqual([run.text for run in runs], ['Тема: Оптимизация', '', ', автор Иванов И.И..'])
+        self.assertTrue(runs[1].bold)
+        self.assertTrue(runs[2].italic)
+
+    def test_longer_field_wins_and_all_stories_replaced(self):
+        document = Document()
+        document.add_paragraph('{{NAME}} и {{NAME_FULL}}')
+        document.add_table(rows=1, cols=1).cell(0, 0).text = 'Ячейка: {{NAME}}'
+        document.sections[0].header.paragraphs[0].text = 'Колонтитул {{NAME}}'
+
+        replacer = FieldReplacer({'{{NAME}}': 'Иван', '{{NAME_FULL}}': 'Иванов Иван', '': 'пусто', '{{NONE}}': None})
+        self.assertEqual(replacer.replace(document), 4)
+
+        self.assertEqual(document.paragraphs[0].text, 'Иван и Иванов Иван')
+        self.assertEqual(document.tables[0].cell(0, 0).text, 'Ячейка: Иван')
+        self.assertEqual(document.sections[0].header.paragraphs[0].text, 'Колонтитул Иван')
+
+    def test_no_fields(self):
+        document = Document()
+        document.add_paragraph('{{TITLE}}')
+        self.assertEqual(FieldReplacer({}).replace(document), 0)
+        self.assertEqual(document.paragraphs[0].text, '{{TITLE}}')
+
+
+class FragmentCacheTests(SimpleTestCase):
+    """Кэш DOCX-фрагментов разделов основной части и титульных листов."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = FragmentCache(directory.name)
+        patcher = mock.patch('documents.views.export.fragment_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.image = base64.b64encode(make_png(7)).decode()
+
+    def sections_html(self, second='Текст второго раздела'):
+        return (
+            '<h1>1 Первый раздел</h1><p>Текст первого раздела</p>'
+            f'<p><img src="data:image/png;base64,{self.image}" style="width:100px; height:100px"></p>'
+            f'<h1>2 Второй раздел</h1><p>{second}</p>'
+        )
+
+    def build(self, html):
+        document = new_body_document(None)
+        add_content_fragments(document, html, None)
+        return document
+
+    def test_unchanged_sections_come_from_cache(self):
+        first = self.build(self.sections_html())
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 2})
+
+        second = self.build(self.sections_html())
+        self.assertEqual(self.cache.stats(), {'hits': 2, 'misses': 2})
+        self.assertEqual(summarize_body(second), summarize_body(first))
+        rIds = second.element.body.xpath('.//a:blip/@r:embed')
+        self.assertEqual(len(rIds), 1)
+        self.assertEqual(second.part.rels[rIds[0]].target_part.blob, first.part.rels[rIds[0]].target_part.blob)
+
+        # Правка одного раздела: заново преобразуется только он
+        edited = self.build(self.sections_html('Исправленный текст'))
+        self.assertEqual(self.cache.stats(), {'hits': 3, 'misses': 3})
+        self.assertIn("p [] 'Исправленный текст' 0", summarize_body(edited))
+
+    def test_title_page_rendered_once_per_context(self):
+        document = make_sample_document(1)
+        with mock.patch('documents.views.export.template_cache.get_template', wraps=template_cache.get_template) as get:
+            first = render_title_page(document)
+            second = render_title_page(document)
+            self.assertEqual(get.call_count, 1)
+            self.assertEqual(summarize_body(second), summarize_body(first))
+
+            document.title = 'Другая тема'
+            changed = render_title_page(document)
+            self.assertEqual(get.call_count, 2)
+        self.assertNotEqual(summarize_body(changed), summarize_body(first))
+
+
+class ExportAdapterQueryTests(TestCase):
+    """
+    Число запросов к БД при экспорте документа через адаптер (загрузка и
+    рендеринг DOCX) не зависит от числа разделов, источников и приложений.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = override_settings(
+            EXPORT_FRAGMENT_CACHE_DIR=os.path.join(self.directory.name, 'fragments'),
+            EXPORT_IMAGE_CACHE_DIR=os.path.join(self.directory.name, 'images'),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_main(self, count):
+        return Document_main.objects.create(
+            owner=self.user, work_type='COURSE', title='Документ Main', supervisor='Петров П.П.',
+            student_name='Иванов И.И.', data=make_sample_html(count), references_doi='',
+        )
+
+    def create_gost(self, count):
+        doc = gost.Document.objects.create(user=self.user, title='Отчет ГОСТ', template_type='gost')
+        gost.TitlePage.objects.create(document=doc, department='Кафедра', head_full_name='Петров П.П.')
+        gost.Abstract.objects.create(document=doc, content='<p>Реферат</p>')
+        for i in range(count):
+            gost.Performer.objects.create(document=doc, full_name=f'Исполнитель {i}', position='Инженер', degree='')
+            gost.Term.objects.create(document=doc, term=f'Термин {i}', definition='Определение')
+            gost.Abbreviation.objects.create(document=doc, abbreviation=f'С{i}', meaning='Сокращение')
+            gost.Reference.objects.create(document=doc, citation=f'Источник {i}', order=i)
+            gost.Appendix.objects.create(document=doc, label=str(i), title='Приложение', content='<p>Текст</p>', order=i)
+        return doc
+
+    def create_sto(self, count):
+        doc = sto.Document_sto.objects.create(
+            work_type='COURSE', title='Документ СТО', supervisor='Петров П.П.', student_name='Иванов И.И.',
+        )
+        sto.Abstract_sto.objects.create(
+            document=doc, page_count=1, illustrations_count=0, tables_count=0, formulas_count=0,
+            appendices_count=count, references_count=count, graphic_sheets=0,
+            keywords='экспорт', text='<p>Реферат</p>',
+        )
+        for i in range(count):
+            sto.Section.objects.create(document=doc, type='MAIN', order=i, title=f'Раздел {i}',
+                                       content='<p>Текст раздела</p>')
+            sto.BibliographyEntry.objects.create(document=doc, order=i, entry_text=f'Источник {i}')
+            sto.Appendix_sto.objects.create(document=doc, label=str(i), title='Приложение', content='Текст')
+        return doc
+
+    def assert_export_queries(self, kind, create, expected):
+        adapter = get_export_adapter(kind)
+        for size in (2, 20):
+            with self.subTest(kind=kind, size=size):
+                pk = create(size).pk
+                with self.assertNumQueries(expected):
+                    render_docx(adapter.get_queryset(self.user).get(pk=pk))
+
+    def test_main(self):
+        self.assert_export_queries('main', self.create_main, 1)
+
+    def test_gost(self):
+        self.assert_export_queries('gost', self.create_gost, 6)
+
+    def test_sto(self):
+        self.assert_export_queries('sto', self.create_sto, 4)
+
+
+def run_now(func, *args):
+    """Выполняет вызов сразу и возвращает завершенный Future (вместо пула экспорта)."""
+    future = Future()
+    future.set_result(func(*args))
+    return future
+
+
+class BatchExportTests(TestCase):
+    """Пакетный экспорт документов Main в потоковый ZIP."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter')
+        for patcher in (
+            mock.patch.object(export_cache, 'get', return_value=None),
+            mock.patch.object(export_cache, 'put'),
+            mock.patch.object(batch_export.export_pool, 'submit_call', side_effect=run_now),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def create_main(self, title, work_type='COURSE'):
+        return Document_main.objects.create(
+            owner=self.user, work_type=work_type, title=title, supervisor='Петров П.П.',
+            student_name='Иванов И.И.', data=make_sample_html(1), references_doi='',
+        )
+
+    def test_zip_contains_documents_and_manifest(self):
+        first = self.create_main('Первый документ')
+        second = self.create_main('Второй документ')
+        missing = second.pk + 100
+
+        chunks = list(batch_export.stream_batch_zip([first.pk, missing, second.pk], 'docx', window=2))
+        self.assertGreater(len(chunks), 3)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            names = archive.namelist()
+            manifest = json.loads(archive.read(batch_export.MANIFEST_NAME))
+            documents = {entry['id']: entry for entry in manifest['documents']}
+            self.assertEqual((manifest['total'], manifest['failed']), (3, 1))
+            self.assertIn('DoesNotExist', documents[missing]['error'])
+            for document in (first, second):
+                entry = documents[document.pk]
+                self.assertEqual(entry['title'], document.title)
+                self.assertIn(entry['file'], names)
+                exported = Document(io.BytesIO(archive.read(entry['file'])))
+                self.assertIn(document.title.upper(), ''.join(exported.element.body.itertext()))
+        self.assertEqual(names[-1], batch_export.MANIFEST_NAME)
+
+    def test_window_limits_documents_in_work(self):
+        submitted = []
+
+        def submit(func, kind, pk, export_format):
+            submitted.append(pk)
+            return run_now(lambda: {'title': str(pk), 'filename': f'{pk}.docx', 'content': b'x', 'warning': ''})
+
+        with mock.patch.object(batch_export.export_pool, 'submit_call', side_effect=submit):
+            stream = batch_export.stream_batch_zip(list(range(1, 6)), 'docx', window=2)
+            next(stream)
+            # До первого готового файла в работу отдано не больше двух документов
+            self.assertEqual(submitted, [1, 2])
+            list(stream)
+        self.assertEqual(submitted, [1, 2, 3, 4, 5])
+
+    def test_filters(self):
+        self.create_main('Курсовая', 'COURSE')
+        self.create_main('Диплом', 'MAG_DIPLOMA')
+        queryset = batch_export.filter_batch_queryset(Document_main.objects.all(), {'work_type': 'COURSE', 'year': ''})
+        self.assertEqual([document.title for document in queryset], ['Курсовая'])
+
+
+class LibreOfficePoolTests(SimpleTestCase):
+    """Создание пула LibreOffice в процессе (процессы LibreOffice не запускаются)."""
+
+    def test_pool_created_once_with_single_atexit_hook(self):
+        pool = pdf_backends.LibreOfficePool()
+        with mock.patch.object(pdf_backends.atexit, 'register') as register:
+            pool._ensure_pool()
+            workers = pool._workers
+            pool._ensure_pool()
+            self.assertIs(pool._workers, workers)
+
+            pool.shutdown()
+            pool._ensure_pool()
+            self.assertEqual(register.call_count, 1)
+        pool.shutdown()
+
+    @override_settings(EXPORT_PDF_WORKERS=4, EXPORT_PDF_WORKERS_PER_EXPORT_PROCESS=1)
+    def test_export_worker_process_uses_small_pool(self):
+        self.assertEqual(pdf_backends.LibreOfficePool().size, 4)
+        with mock.patch.object(pdf_backends, '_export_worker_process', True):
+            pool = pdf_backends.LibreOfficePool()
+            pool._ensure_pool()
+            self.assertEqual(len(pool._workers), 1)
+            pool.shutdown()
+
+
+class FastPdfResourceTests(SimpleTestCase):
+    """Быстрый PDF не загружает ресурсы, на которые ссылается HTML документа."""
+
+    def setUp(self):
+        self.requests = []
+        requests = self.requests
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append(self.path)
+                self.send_response(404)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_port}"
+
+    def test_prepare_content_strips_external_references(self):
+        html = (
+            f'<link rel="stylesheet" href="{self.base_url}/a.css">'
+            f'<style>@import url("{self.base_url}/b.css");</style>'
+            f'<p style="background: url({self.base_url}/c.png)">Текст</p>'
+            f'<p style="text-indent: 1.25cm">Абзац</p>'
+        )
+        content = fast_pdf.prepare_content(html, {}, lambda src: '[изображение]')
+        self.assertNotIn(self.base_url, content)
+        self.assertIn('Текст', content)
+        self.assertIn('text-indent', content)
+
+    def test_render_pdf_makes_no_requests(self):
+        image = CachedImage.from_content(make_png(1), 'image/png')
+        html = (
+            f'<link rel="stylesheet" href="{self.base_url}/internal-ssrf">'
+            f'<p>Текст<img src="embedded.png"></p>'
+        )
+        prepare_content = fast_pdf.prepare_content
+
+        def unsafe_prepare(content, images, placeholder, allowed_uris):
+            # Даже если в шаблон попадет неочищенный HTML, link_callback не пустит запрос
+            return (
+                prepare_content(content, images, placeholder, allowed_uris)
+                + f'<link rel="stylesheet" href="{self.base_url}/after-prepare">'
+                + f'<img src="{self.base_url}/image.png">'
+            )
+
+        with mock.patch.object(fast_pdf, 'prepare_content', unsafe_prepare):
+            pdf = fast_pdf.render_pdf({'TITLE': 'Тема'}, html, {'embedded.png': image}, lambda src: '')
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(self.requests, [])
+
+
+class PdfFromDocxArtifactTests(SimpleTestCase):
+    """PDF через DOCX строится из DOCX-артефакта той же версии документа."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ExportResultCache(directory.name)
+        self.converted = []
+
+        def convert(content):
+            self.converted.append(content)
+            return b'%PDF-1.4'
+
+        for patcher in (
+            mock.patch('documents.views.export.export_cache', self.cache),
+            mock.patch('documents.views.export.convert_docx_to_pdf', side_effect=convert),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('documents.views.export.render_docx', wraps=render_docx)
+        self.render_docx = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.document = make_sample_document(1)
+        self.docx_key = get_export_key(self.document, get_template_name(self.document), 'docx')
+
+    def test_pdf_converts_cached_docx(self):
+        docx_content, key = export_document(self.document, 'docx', self.docx_key)
+        self.assertEqual(key, self.docx_key)
+
+        pdf_key = get_export_key(self.document, None, 'pdf', 'docx', self.docx_key)
+        pdf_content, _ = export_document(self.document, 'pdf', pdf_key, 'docx', self.docx_key)
+
+        self.assertEqual(pdf_content, b'%PDF-1.4')
+        self.assertEqual(self.render_docx.call_count, 1)
+        self.assertEqual(self.converted, [docx_content])
+
+    def test_pdf_first_stores_docx_artifact(self):
+        pdf_key = get_export_key(self.document, None, 'pdf', 'docx', self.docx_key)
+        export_document(self.document, 'pdf', pdf_key, 'docx', self.docx_key)
+
+        docx_content, _ = export_document(self.document, 'docx', self.docx_key)
+        self.assertEqual(self.render_docx.call_count, 1)
+        self.assertEqual(self.converted, [docx_content])
+        self.assertEqual(self.cache.get(pdf_key, 'pdf'), b'%PDF-1.4')
+
+
+class BodyPrototypeTests(SimpleTestCase):
+    """Прототипы основной части по профилю оформления."""
+
+    def test_one_prototype_per_profile(self):
+        cache = BodyPrototypeCache()
+        first = cache.get_document('ГОСТ 7.32-2017')
+        first.add_paragraph('Изменение')
+        second = cache.get_document('ГОСТ 7.32-2001')
+        cache.get_document(None)
+
+        self.assertEqual(get_profile('ГОСТ 7.32-2001'), 'gost_7_32')
+        self.assertEqual([p.text for p in second.paragraphs], [])
+        self.assertEqual(cache.stats(), {'profiles': 2, 'hits': 1, 'misses': 2})
+        self.assertEqual(second.styles['Normal'].font.name, first.styles['Normal'].font.name)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'admission-tests'}},
+    EXPORT_MEMORY_BUDGET_MB=512,
+    EXPORT_MEMORY_PER_EXPORT_MB=256,
+    EXPORT_USER_CONCURRENCY=1,
+    EXPORT_QUEUE_LENGTH=3,
+    EXPORT_QUEUE_WAIT=0,
+    EXPORT_QUEUE_RETRY_AFTER=5,
+)
+class ExportAdmissionTests(SimpleTestCase):
+    """Очередь экспорта: позиции по порядку прихода и ограниченное ожидание слота."""
+
+    def setUp(self):
+        self.admission = ExportAdmission()
+        self.admission.cache.clear()
+        self.users = [types.SimpleNamespace(pk=pk) for pk in range(1, 10)]
+
+    def tearDown(self):
+        self.admission.cache.clear()
+
+    def reject(self, user):
+        with self.assertRaises(ExportRejected) as context:
+            self.admission.admit(user)
+        return context.exception
+
+    def test_queue_positions_follow_arrival_order(self):
+        leases = [self.admission.admit(user) for user in self.users[:2]]
+        rejections = [self.reject(user) for user in self.users[2:5]]
+        self.assertEqual([r.status for r in rejections], [503, 503, 503])
+        self.assertEqual([r.position for r in rejections], [1, 2, 3])
+        self.assertEqual(rejections[0].retry_after, 5)
+
+        # Повтор сохраняет место, очередь заполнена — новый запрос получает 429
+        self.assertEqual(self.reject(self.users[3]).position, 2)
+        self.assertEqual(self.reject(self.users[5]).status, 429)
+
+        # Освободившийся слот достается первому в очереди, а не второму
+        leases.pop().release()
+        self.assertEqual(self.reject(self.users[3]).position, 2)
+        self.admission.admit(self.users[2]).release()
+        self.assertEqual(self.reject(self.users[4]).position, 2)
+        self.admission.admit(self.users[3]).release()
+        self.admission.admit(self.users[4]).release()
+        self.assertEqual(self.admission.state()['waiting'], 0)
+
+    def test_expired_ticket_leaves_queue(self):
+        lease = self.admission.admit(self.users[0])
+        self.admission.admit(self.users[1])
+        self.assertEqual(self.reject(self.users[2]).position, 1)
+        self.assertEqual(self.reject(self.users[3]).position, 2)
+
+        # Первый в очереди не повторил запрос вовремя
+        self.admission.cache.delete(self.admission._ticket_key(1))
+        lease.release()
+        self.admission.admit(self.users[3]).release()
+        self.assertEqual(self.admission.state()['waiting'], 0)
+
+    def test_queued_export_waits_for_slot(self):
+        leases = [self.admission.admit(user) for user in self.users[:2]]
+
+        def release_slot(seconds):
+            if leases:
+                leases.pop().release()
+
+        with mock.patch('documents.services.export_admission.time.sleep', side_effect=release_slot) as sleep:
+            lease = self.admission.admit(self.users[2], wait=5)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.admission.state(), {'running': 2, 'slots': 2, 'waiting': 0, 'queue_length': 3})
+        lease.release()
+
+    def test_wait_is_bounded(self):
+        for user in self.users[:2]:
+            self.admission.admit(user)
+        started = time.monotonic()
+        with self.assertRaises(ExportRejected) as context:
+            self.admission.admit(self.users[2], wait=1)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(context.exception.position, 1)
+
+    def test_no_ticket_without_queue_lock(self):
+        for user in self.users[:2]:
+            self.admission.admit(user)
+        self.admission.cache.add('export_admission:queue:lock', 'другой процесс', 60)
+        with mock.patch.object(self.admission, 'queue_lock_wait', 0):
+            rejection = self.reject(self.users[2])
+        self.assertEqual(rejection.status, 503)
+        self.assertIsNone(rejection.position)
+        self.assertEqual(self.admission.state()['waiting'], 0)
+
+    def test_rejected_link_refreshes_page(self):
+        """Экспорт по обычной ссылке получает страницу, которая повторит запрос сама."""
+        rejection = ExportRejected('Экспорт ожидает в очереди', status=503, retry_after=5, position=2, reason='queued')
+        request = RequestFactory().get('/export/', HTTP_ACCEPT='text/html')
+        request.user = AnonymousUser()
+        response = export_rejected_response(request, rejection)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Refresh'], '5')
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertContains(response, 'Позиция в очереди', status_code=503)
+
+        request = RequestFactory().get('/export/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response = export_rejected_response(request, rejection)
+        self.assertEqual(json.loads(response.content)['queue_position'], 2)
+        self.assertNotIn('Refresh', response)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'flight-tests'}},
+    EXPORT_FLIGHT_WAIT=0.5,
+    EXPORT_QUEUE_RETRY_AFTER=5,
+)
+class ExportFlightTests(SimpleTestCase):
+    """Объединение одинаковых экспортов (export_flight)."""
+
+    def setUp(self):
+        self.flight = ExportSingleFlight()
+        self.flight.poll_interval = 0.05
+        self.flight.cache.clear()
+        self.lock_key = 'export_flight:lock:main:1:docx:key'
+        self.rendered = []
+
+    def tearDown(self):
+        self.flight.cache.clear()
+
+    def render(self):
+        self.rendered.append(True)
+        return b'docx'
+
+    def test_waiter_gets_leader_result(self):
+        results = {}
+        self.flight.cache.add(self.lock_key, 'лидер', 60)
+
+        def finish_leader():
+            time.sleep(0.1)
+            results['content'] = b'leader'
+            self.flight.cache.delete(self.lock_key)
+
+        leader = threading.Thread(target=finish_leader)
+        leader.start()
+        content = self.flight.run('main:1:docx:key', self.render, lambda: results.get('content'))
+        leader.join()
+        self.assertEqual(content, b'leader')
+        self.assertEqual(self.rendered, [])
+        self.assertEqual(self.flight.stats()['coalesced'], 1)
+
+    def test_waiter_rejected_while_leader_holds_lock(self):
+        """Лидер строит файл дольше ожидания: ожидающий получает 503, а не строит файл сам."""
+        self.flight.cache.add(self.lock_key, 'лидер', 60)
+        with self.assertRaises(ExportRejected) as context:
+            self.flight.run('main:1:docx:key', self.render, lambda: None)
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(context.exception.retry_after, 5)
+        self.assertEqual(self.rendered, [])
+        self.assertEqual(self.flight.stats()['timeouts'], 1)
+
+    def test_background_waiter_renders_after_lock_expires(self):
+        """Фоновое построение ждет, пока живет блокировка, и строит файл, если лидер пропал."""
+        self.flight.cache.add(self.lock_key, 'лидер', 1)
+        content = self.flight.run('main:1:docx:key', self.render, lambda: None, wait=self.flight.lock_timeout)
+        self.assertEqual(content, b'docx')
+        self.assertEqual(self.rendered, [True])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'warmup-tests'}},
+    EXPORT_WARM_AHEAD=True,
+    EXPORT_WARM_AHEAD_FORMATS=('docx', 'pdf'),
+)
+class ExportWarmupTests(TestCase):
+    """Прогрев экспорта после сохранения документа."""
+
+    def setUp(self):
+        export_warmup.cache.clear()
+        self.addCleanup(export_warmup.cache.clear)
+        self.timers = []
+        timer = mock.patch('documents.services.export_warmup.threading.Timer', side_effect=self.make_timer)
+        timer.start()
+        self.addCleanup(timer.stop)
+        submit = mock.patch('documents.services.export_warmup.export_pool.submit_call')
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+        self.user = User.objects.create_user('exporter')
+
+    def make_timer(self, delay, function, args):
+        timer = mock.Mock()
+        timer.fire = lambda: function(*args)
+        self.timers.append(timer)
+        return timer
+
+    def create_main(self):
+        return Document_main.objects.create(
+            owner=self.user, work_type='COURSE', title='Тема', supervisor='Петров П.П.',
+            student_name='Иванов И.И.', data='<p>Текст</p>', references_doi='',
+        )
+
+    def test_series_of_saves_renders_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.create_main()
+        with self.captureOnCommitCallbacks(execute=True):
+            document.title = 'Новая тема'
+            document.save()
+        self.assertEqual(len(self.timers), 2)
+
+        for timer in self.timers:
+            timer.fire()
+        self.submit.assert_called_once_with(warm_export, 'main', document.pk, 2)
+
+    def test_warm_export_builds_formats_for_current_generation(self):
+        document = self.create_main()
+        with mock.patch('documents.views.export.export_document') as export:
+            warm_export('main', document.pk, 1)
+        self.assertEqual([call.args[1] for call in export.call_args_list], ['docx', 'pdf'])
+
+        # Документ сохранили еще раз: устаревшее поколение не рендерится
+        export_warmup.cache.set(export_warmup._generation_key('main', document.pk), 2)
+        with mock.patch('documents.views.export.export_document') as export:
+            warm_export('main', document.pk, 1)
+        export.assert_not_called()
@@ -13,7 +13,9 @@ from .views.sto import (
     DocumentDeleteView as StoDocumentDeleteView,
     generate_title_page,
 )
-from .views.export import  main_export_docx, main_export_pdf
+from .views.export import document_export_docx, document_export_pdf
+from .views.export_jobs import export_job_submit, export_job_status, export_job_download
+from .views.batch_export import main_batch_export
 from .views.main import (
     DocumentListView as MainDocumentListView,
     DocumentDetailView as MainDocumentDetailView,
@@ -43,8 +45,8 @@ urlpatterns = [
     path('gost/new/', GostDocumentCreateView.as_view(), name='gost_create'),
     path('gost/<int:pk>/', GostDocumentDetailView.as_view(), name='gost_detail'),
     path('gost/<int:pk>/edit/', GostDocumentUpdateView.as_view(), name='gost_edit'),
-    path('gost/<int:pk>/export/docx/', main_export_docx, name='gost_export_docx'),
-    path('gost/<int:pk>/export/pdf/', main_export_docx, name='gost_export_pdf'),
+    path('gost/<int:pk>/export/docx/', document_export_docx, {'kind': 'gost'}, name='gost_export_docx'),
+    path('gost/<int:pk>/export/pdf/', document_export_pdf, {'kind': 'gost'}, name='gost_export_pdf'),
 
     # СТО СФУ 4.2
     path('sto/', StoDocumentListView.as_view(), name='sto_list'),
@@ -52,8 +54,8 @@ urlpatterns = [
     path('sto/<int:pk>/', StoDocumentDetailView.as_view(), name='sto_detail'),
     path('sto/<int:pk>/edit/', StoDocumentUpdateView.as_view(), name='sto_edit'),
     path('sto/<int:pk>/delete/', StoDocumentDeleteView.as_view(), name='sto_delete'),
-    path('sto/<int:pk>/export/docx/', main_export_docx, name='sto_export_docx'),
-    path('sto/<int:pk>/export/pdf/', main_export_docx, name='sto_export_pdf'),
+    path('sto/<int:pk>/export/docx/', document_export_docx, {'kind': 'sto'}, name='sto_export_docx'),
+    path('sto/<int:pk>/export/pdf/', document_export_pdf, {'kind': 'sto'}, name='sto_export_pdf'),
     path('sto/<int:pk>/download_title_page/', generate_title_page, name='generate_title_page'),
 
     # Main документы
@@ -62,9 +64,15 @@ urlpatterns = [
     path('main/<int:pk>/', MainDocumentDetailView.as_view(), name='main_detail'),
     path('main/<int:pk>/edit/', MainDocumentUpdateView.as_view(), name='main_edit'),
     path('main/<int:pk>/delete/', MainDocumentDeleteView.as_view(), name='main_delete'),
-    path('main/<int:pk>/export/docx/', main_export_docx, name='main_export_docx'),
-    path('main/<int:pk>/export/pdf/', main_export_pdf, name='main_export_pdf'),
+    path('main/<int:pk>/export/docx/', document_export_docx, {'kind': 'main'}, name='main_export_docx'),
+    path('main/<int:pk>/export/pdf/', document_export_pdf, {'kind': 'main'}, name='main_export_pdf'),
     path('main/<int:pk>/update-references/', update_references, name='update_references'),
+    path('main/<int:pk>/export/<str:export_format>/submit/', export_job_submit, name='main_export_submit'),
+    path('main/batch-export/', main_batch_export, name='main_batch_export'),
+
+    # Фоновые задачи экспорта
+    path('export-jobs/<int:job_id>/', export_job_status, name='export_job_status'),
+    path('export-jobs/<int:job_id>/download/', export_job_download, name='export_job_download'),
 
     # Новый URL для получения списка шаблонов
     path('templates/', get_templates_view, name='get_templates'),
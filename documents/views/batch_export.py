@@ -0,0 +1,57 @@
+import logging
+
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from documents.models import Document_main, ExportJob
+from documents.services.batch_export import filter_batch_queryset, stream_batch_zip
+
+logger = logging.getLogger(__name__)
+
+
+def batch_export_response(queryset, export_format, kind='main'):
+    """
+    Отдает документы набора одним ZIP-архивом, который передается клиенту
+    по мере готовности файлов.
+
+    Args:
+        queryset (QuerySet): Документы для экспорта
+        export_format (str): Формат файлов ('docx', 'pdf')
+        kind (str): Тип документов ('main', 'gost', 'sto')
+
+    Returns:
+        StreamingHttpResponse: Ответ с ZIP-архивом
+    """
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    logger.info(f"Пакетный экспорт в {export_format}: документов {len(pks)}")
+
+    filename = f"export_{export_format}_{timezone.now():%Y%m%d_%H%M%S}.zip"
+    response = StreamingHttpResponse(stream_batch_zip(pks, export_format, kind), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@require_GET
+def main_batch_export(request):
+    """
+    Пакетный экспорт документов Main в ZIP с фильтром по виду работы, году
+    и кафедре (параметры work_type, year, department; формат — format).
+    Сотрудники получают документы всех пользователей, остальные — только свои.
+
+    Returns:
+        StreamingHttpResponse: Ответ с ZIP-архивом
+    """
+    export_format = request.GET.get('format', 'docx')
+    if export_format not in dict(ExportJob.FORMATS):
+        raise Http404("Неподдерживаемый формат экспорта.")
+
+    queryset = Document_main.objects.all()
+    if not request.user.is_staff:
+        queryset = queryset.filter(owner=request.user)
+    queryset = filter_batch_queryset(queryset, request.GET)
+    if not queryset.exists():
+        raise Http404("Нет документов для экспорта.")
+    return batch_export_response(queryset, export_format)
@@ -1,41 +1,46 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.text import slugify
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib import messages
 import io
 from io import BytesIO, StringIO
 import os
 import logging
-import tempfile
-import base64
-import re
-import mimetypes
 import json
+import hashlib
+from html import escape
 import requests
 from bs4 import BeautifulSoup
 from docx import Document
 from docx.shared import Pt, Inches, Cm, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.style import WD_STYLE_TYPE
-from docx2pdf import convert
-# Импорт DocxTemplate для работы с шаблонами
-from docxtpl import DocxTemplate
-from docx.opc.constants import RELATIONSHIP_TYPE as RT
 from docx.parts.image import ImagePart
 
-# Импортируем htmldocx вместо mammoth
-from htmldocx import HtmlToDocx
-
-# Попытка импортировать pythoncom для Windows
-try:
-    import pythoncom
-except ImportError:
-    pythoncom = None # Устанавливаем в None, если импорт не удался (не Windows)
-
 from documents.models.sto import Document_sto
-from documents.models.main import Document_main
+from documents.services.body_prototypes import body_prototypes
+from documents.services.docx_templates import render_template, resolve_template_path, template_cache
+from documents.services.export_adapters import adapter_for, get_export_adapter
+from documents.services.export_admission import ExportRejected, export_admission
+from documents.services.export_cache import export_cache, fingerprint
+from documents.services.export_flight import export_flight
+from documents.services.image_cache import image_cache
+from documents.services.image_fetcher import image_fetcher
+from documents.services.image_optimizer import optimize_image
+from documents.services.html_frontend import PatchedHtmlToDocx, convert_to_cm, parse_html, split_sections
+from documents.services.docx_composer import DocxComposer
+from documents.services.docx_formatting import apply_style_formatting, set_style_font
+from documents.services.field_replacer import FieldReplacer
+from documents.services.fragment_cache import fragment_cache, pack_fragment, unpack_fragment
+from documents.services.pdf_backends import PdfBackendError, get_pdf_backend
+from documents.services import fast_pdf
+from documents.services.ooxml_emitter import OoxmlEmitter, get_picture_width
+from documents.services.image_resolver import is_local_image, resolve_local_image
 
 # Импортируем модуль AI для получения стилей форматирования
 import ai
@@ -43,17 +48,27 @@ import ai
 # Настройка логгера
 logger = logging.getLogger(__name__)
 
-# Отображение типов работ на названия шаблонов
-WORK_TYPE_TEMPLATES = {
-    'MAG_DIPLOMA': 'magitr_dissertation',
-    'DIPLOMA': 'diplom_work',
-    'BACHELOR': 'bachelor_work',
-    'COURSE': 'kursovaya',
-    'CALC_GRAPH': 'diplo_project',  # используем общий шаблон
-    'PRACTICE': 'otchet_praktika',
-    'LAB': 'laba_work',
-    'REF': 'referat',
-}
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Время хранения метаданных DOI в кэше Django (успешных и неудачных запросов)
+DOI_METADATA_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+DOI_METADATA_FAILURE_TIMEOUT = 60 * 10
+
+# Версия кода экспорта: хэш исходников этого модуля и сервисов конвейера
+# (documents/services). Любая правка конвейера меняет ключи кэша готовых
+# файлов и фрагментов, и старые результаты больше не отдаются.
+def _code_version():
+    services_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'services')
+    paths = [__file__] + sorted(
+        os.path.join(services_dir, name) for name in os.listdir(services_dir) if name.endswith('.py')
+    )
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+EXPORT_CODE_VERSION = _code_version()
 
 # Импорты для низкоуровневой работы с OXML элементами
 from docx.oxml.text.paragraph import CT_P
@@ -77,50 +92,39 @@ def django_mammoth_image_converter(image):
     logger.debug(f"Mammoth встретил изображение с src: {src}")
 
     try:
-        # Проверяем различные типы источников изображений
-        if src and src.startswith(settings.MEDIA_URL):
-            # 1. Изображение из медиа-хранилища Django
-            relative_media_path = src[len(settings.MEDIA_URL):]
-            file_path = os.path.join(settings.MEDIA_ROOT, relative_media_path)
-
-            if os.path.exists(file_path):
-                with open(file_path, 'rb') as f:
-                    image_data = f.read()
-                content_type, _ = mimetypes.guess_type(file_path)
-                logger.debug(f"Загружено изображение из медиа: {file_path}, тип: {content_type}")
-            else:
-                logger.warning(f"Файл изображения не найден: {file_path}")
+        # Проверяем различные типы источников изображений (через общий кэш изображений)
+        if src and is_local_image(src):
+            # 1. Изображение из медиа-хранилища или статики Django
+            cached = resolve_local_image(src)
+            if cached is None:
+                logger.warning(f"Файл изображения не найден: {src}")
                 return None
+            logger.debug(f"Загружено локальное изображение: {src}, тип: {cached.content_type}")
 
         elif src and src.startswith('data:image/'):
             # 2. Изображение в формате base64
             try:
-                header, encoded = src.split(",", 1)
-                content_type = header.split(";")[0].split(":")[1]
-                image_data = base64.b64decode(encoded)
-                logger.debug(f"Декодировано base64 изображение, тип: {content_type}")
+                cached = image_cache.load_data_uri(src)
+                logger.debug(f"Декодировано base64 изображение, тип: {cached.content_type}")
             except Exception as e:
                 logger.error(f"Ошибка при декодировании base64 изображения: {e}")
                 return None
 
         elif src and (src.startswith('http://') or src.startswith('https://')):
             # 3. Изображение по внешнему URL
-            try:
-                response = requests.get(src, stream=True, timeout=10)
-                if response.status_code == 200:
-                    image_data = response.content
-                    content_type = response.headers.get('Content-Type', 'image/jpeg')
-                    logger.debug(f"Загружено изображение по URL: {src}, тип: {content_type}")
-                else:
-                    logger.warning(f"Не удалось загрузить изображение по URL: {src}, статус: {response.status_code}")
-                    return None
-            except Exception as e:
-                logger.error(f"Ошибка при загрузке изображения по URL {src}: {e}")
+            fetched = image_fetcher.fetch(src)
+            if not fetched.ok:
+                logger.warning(f"Не удалось загрузить изображение по URL: {src} ({fetched.error})")
                 return None
+            cached = fetched.image
+            logger.debug(f"Загружено изображение по URL: {src}, тип: {cached.content_type}")
         else:
             logger.warning(f"Неподдерживаемый формат src изображения: {src}")
             return None
 
+        image_data = cached.content
+        content_type = cached.content_type or None
+
         # Проверяем, что мы определили MIME-тип
         if content_type is None:
             logger.warning(f"Не удалось определить MIME-тип изображения: {src}. Изображение будет пропущено.")
@@ -138,7 +142,84 @@ def django_mammoth_image_converter(image):
         logger.error(f"Общая ошибка при обработке изображения {src}: {e}", exc_info=True)
         return None
 
-def process_html_to_docx(html_content, docx_document):
+def image_placeholder_text(src):
+    """Текст, который вставляется вместо изображения, которое не удалось получить."""
+    if src.startswith('data:'):
+        return "[Изображение недоступно]"
+    return f"[Изображение недоступно: {src[:100]}]"
+
+
+def load_images(sources):
+    """
+    Получает изображения по списку src (внешние URL — параллельно, data URL,
+    локальные пути) и готовит их к печати через общий кэш изображений.
+
+    Args:
+        sources (list): src изображений в порядке следования
+        
+    Returns:
+        dict: Номер изображения в sources -> CachedImage; изображений,
+            которые не удалось получить, в словаре нет
+    """
+    images_map = {}
+
+    # Сначала параллельно загружаем все удаленные изображения документа,
+    # затем раскладываем их по местам в исходном порядке
+    fetched_images = image_fetcher.fetch_all(
+        [src for src in sources if src.startswith(('http://', 'https://'))]
+    )
+    original_bytes = optimized_bytes = 0
+
+    for i, src in enumerate(sources):
+        if not src:
+            continue
+
+        logger.info(f"Обрабатываю изображение {i+1}/{len(sources)}: {src[:50]}...")
+
+        try:
+            # Обрабатываем различные форматы src; байты, MIME-тип и размеры
+            # берутся из общего кэша изображений
+            image = None
+            if src.startswith(('http://', 'https://')):
+                # Внешний URL (уже загружен параллельно или взят из кэша)
+                image = fetched_images[src].image
+
+            elif src.startswith('data:image/'):
+                # Data URL (base64): декодируется только при промахе кэша
+                logger.info("Обработка Data URL изображения")
+                try:
+                    image = image_cache.load_data_uri(src)
+                except Exception as e:
+                    logger.error(f"Ошибка при декодировании base64: {e}")
+
+            elif is_local_image(src):
+                # Локальный путь от корня сайта: читаем из хранилища Django,
+                # не обращаясь к собственному веб-серверу
+                logger.info(f"Обработка локального пути: {src}")
+                image = resolve_local_image(src)
+
+            if image is not None:
+                # Уменьшаем до печатного разрешения и перекодируем
+                optimized = optimize_image(image)
+                original_bytes += len(image.content)
+                optimized_bytes += len(optimized.content)
+                images_map[i] = optimized
+            else:
+                # Вместо изображения будет вставлен текст-заглушка
+                logger.warning(f"Изображение не найдено, вставлена заглушка: {src[:100]}")
+
+        except Exception as e:
+            logger.error(f"Ошибка при обработке изображения {src}: {e}", exc_info=True)
+
+    if original_bytes:
+        logger.info(
+            f"Изображения: {original_bytes} -> {optimized_bytes} байт, "
+            f"сэкономлено {original_bytes - optimized_bytes} байт"
+        )
+
+    return images_map
+
+def process_html_to_docx(html_content, docx_document, emitter=None):
     """
     Преобразует HTML-контент в DOCX и добавляет его в существующий документ.
     Изображения загружаются напрямую по URL и вставляются в правильные места,
@@ -147,441 +228,168 @@ def process_html_to_docx(html_content, docx_document):
     Args:
         html_content (str): HTML-контент для преобразования.
         docx_document (Document): Существующий объект python-docx, куда будет добавлен контент.
+        emitter (str): 'native' (собственный эмиттер OOXML) или 'htmldocx' (прежний путь);
+            по умолчанию берется из настройки DOCX_HTML_EMITTER
+            
+    Returns:
+        bool: True, если HTML преобразован полностью; False, если вместо
+            части изображений вставлены заглушки или HTML вставлен как текст
     """
     if not html_content:
         logger.info("HTML контент пуст, нечего добавлять.")
-        return
+        return True
+    
+    if emitter is None:
+        emitter = getattr(settings, 'DOCX_HTML_EMITTER', 'native')
 
     logger.info(f"Обработка HTML контента длиной {len(html_content)} символов")
     
-    # Сохраняем информацию об отступах из HTML перед парсингом
-    # Ищем теги <p> с отступами через регулярные выражения
-    indent_info = {}
-    p_tags = re.finditer(r'<p\s+([^>]*)style="([^"]*)"', html_content)
-    for i, match in enumerate(p_tags):
-        attrs = match.group(1)
-        style = match.group(2)
-        
-        # Генерируем уникальный ID для параграфа
-        p_id = f"p_{i}"
-        
-        # Извлекаем значения отступов из стилей
-        text_indent = re.search(r'text-indent:\s*([0-9.]+)(px|em|cm|mm|pt)', style)
-        margin_left = re.search(r'margin-left:\s*([0-9.]+)(px|em|cm|mm|pt)', style)
-        
-        if text_indent or margin_left:
-            indent_info[p_id] = {
-                'has_indent': True,
-                'text_indent': text_indent.groups() if text_indent else None,
-                'margin_left': margin_left.groups() if margin_left else None
-            }
-            
-            # Добавляем ID к тегу <p> для последующей идентификации
-            html_content = html_content.replace(match.group(0), f'<p id="{p_id}" {attrs}style="{style}"')
-    
-    # Дополнительно ищем параграфы с классом has-indent
-    p_with_class = re.finditer(r'<p\s+([^>]*)class="([^"]*has-indent[^"]*)"([^>]*)>', html_content)
-    for i, match in enumerate(p_with_class, start=len(indent_info)):
-        before_class = match.group(1)
-        class_attr = match.group(2)
-        after_class = match.group(3)
-        
-        # Генерируем уникальный ID для параграфа
-        p_id = f"p_indent_class_{i}"
-        
-        # Добавляем информацию об отступе (стандартный отступ 1.25 см)
-        indent_info[p_id] = {
-            'has_indent': True,
-            'text_indent': ('1.25', 'cm'),
-            'margin_left': None
-        }
-        
-        # Добавляем ID к тегу <p> для последующей идентификации
-        html_content = html_content.replace(
-            match.group(0), 
-            f'<p id="{p_id}" {before_class}class="{class_attr}"{after_class}>'
-        )
-    
-    logger.info(f"Найдено {len(indent_info)} параграфов с отступами")
-    
-    # Используем BeautifulSoup для парсинга HTML
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # Проверяем наличие неразрывных пробелов в тексте (уже преобразованных BeautifulSoup)
-    paragraphs_with_nbsp = {}
-    for p in soup.find_all('p'):
-        p_id = p.get('id', f"auto_{id(p)}")
-        
-        # Проверяем текст на наличие неразрывных пробелов в начале
-        text = p.get_text()
-        nbsp_count = 0
-        for char in text:
-            if char == '\u00A0':  # Неразрывный пробел
-                nbsp_count += 1
-            else:
-                break
-                
-        if nbsp_count > 0:
-            paragraphs_with_nbsp[p_id] = nbsp_count
-            logger.info(f"Параграф {p_id} содержит {nbsp_count} неразрывных пробелов в начале")
-    
-    # Преобразуем обратно в строку для дальнейшей обработки
-    html_content = str(soup)
-    
-    # Патч для библиотеки htmldocx
     try:
-        from htmldocx.h2d import HtmlToDocx as OriginalHtmlToDocx
-        
-        # Создаем патч класса HtmlToDocx
-        class PatchedHtmlToDocx(OriginalHtmlToDocx):
-            def __init__(self, *args, **kwargs):
-                super().__init__(*args, **kwargs)
-                self.run = None  # Добавляем отсутствующий атрибут
-                self.current_paragraph_id = None  # Для отслеживания ID текущего параграфа
-                self.paragraphs_created = []  # Список созданных параграфов
-            
-            def handle_starttag(self, tag, attrs):
-                try:
-                    # Сохраняем ID для параграфов
-                    if tag == 'p':
-                        self.current_paragraph_id = None
-                        for attr in attrs:
-                            if attr[0] == 'id':
-                                self.current_paragraph_id = attr[1]
-                                break
-                        
-                        # Создаем новый параграф
-                        old_paragraph = self.paragraph
-                        super().handle_starttag(tag, attrs)
-                        
-                        # Если был создан новый параграф, сохраняем его и его ID
-                        if self.paragraph != old_paragraph and self.paragraph is not None:
-                            self.paragraphs_created.append((self.paragraph, self.current_paragraph_id))
-                    else:
-                        # Пытаемся выполнить оригинальный метод
-                        super().handle_starttag(tag, attrs)
-                        
-                    # Проверяем, нужно ли инициализировать self.run
-                    if tag in ['br', 'hr'] and self.run is None and self.paragraph is not None:
-                        # Создаем run, если его нет
-                        self.run = self.paragraph.add_run()
-                        
-                except AttributeError as e:
-                    # Если возникла ошибка с атрибутом run, игнорируем ее
-                    if "'NoneType' object has no attribute 'add_break'" in str(e):
-                        logger.warning("Игнорирована ошибка в htmldocx: 'NoneType' object has no attribute 'add_break'")
-                        # Пытаемся создать run и повторить операцию
-                        if self.paragraph is not None:
-                            self.run = self.paragraph.add_run()
-                            if tag == 'br':
-                                self.run.add_break()
-                    elif "'NoneType' object has no attribute" in str(e):
-                        logger.warning(f"Игнорирована ошибка в htmldocx: {str(e)}")
-                    else:
-                        # Другие ошибки пробрасываем дальше
-                        raise
-        
-        # Заменяем оригинальный класс на патченный
-        HtmlToDocx = PatchedHtmlToDocx
-        logger.info("Применен расширенный патч для библиотеки htmldocx")
+        # Разбираем HTML один раз: отступы абзацев, неразрывные пробелы
+        # и изображения собираются за тот же обход дерева
+        parsed = parse_html(html_content)
+        logger.info(f"Найдено {len(parsed.paragraphs)} параграфов с отступами")
+        
+        # Подготавливаем изображения: все байты остаются в памяти, без временных файлов
+        images_map = load_images(parsed.images)
+        
+        if emitter == 'native':
+            # Собственный эмиттер: элементы w:p / w:r / w:tbl создаются напрямую
+            paragraph_count = OoxmlEmitter(docx_document, images_map, image_placeholder_text).emit(parsed)
+            logger.info(f"Создано {paragraph_count} абзацев")
+        else:
+            add_segments_with_htmldocx(parsed, images_map, docx_document)
+        
+        logger.info("HTML успешно преобразован и добавлен в документ")
+        return all(i in images_map for i, src in enumerate(parsed.images) if src)
+
     except Exception as e:
-        logger.warning(f"Не удалось применить патч для htmldocx: {e}")
+        logger.error(f"Ошибка при обработке HTML: {e}", exc_info=True)
+        # В случае ошибки добавляем просто текст как запасной вариант
+        try:
+            plain_text = BeautifulSoup(html_content, 'html.parser').get_text()
+            docx_document.add_paragraph(f"[Ошибка конвертации HTML, вставлен как текст]:\n{plain_text}")
+        except Exception as fallback_e:
+            logger.error(f"Ошибка при аварийной вставке HTML как текста: {fallback_e}")
+            docx_document.add_paragraph("[Ошибка конвертации HTML, не удалось вставить даже как текст]")
+        return False
+
+def add_segments_with_htmldocx(parsed, images_map, docx_document):
+    """
+    Прежний путь преобразования (DOCX_HTML_EMITTER = 'htmldocx'): каждая часть
+    HTML между изображениями отдается отдельному экземпляру htmldocx, а
+    изображения вставляются между частями. Оставлен для сравнения.
     
-    try:
-        # Создаем временную директорию для хранения изображений
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Подготавливаем изображения и сохраняем их во временную директорию
-            soup = BeautifulSoup(html_content, 'html.parser')
-            images_map = {}
-            
-            # Находим все изображения
-            images = soup.find_all('img')
-            for i, img in enumerate(images):
-                src = img.get('src', '')
-                if not src:
-                    continue
+    Args:
+        parsed (ParsedHtml): Результат parse_html
+        images_map (dict): Номер изображения -> CachedImage
+        docx_document (Document): Документ python-docx
+    """
+    # Обрабатываем каждую часть: HTML между изображениями и сами изображения
+    for part_type, content in parsed.segments(set(images_map), image_placeholder_text):
+        if part_type == 'html':
+            events, tables = content
+            try:
+                parser = PatchedHtmlToDocx()
                 
-                logger.info(f"Обрабатываю изображение {i+1}/{len(images)}: {src[:50]}...")
+                # Устанавливаем стиль для таблиц
+                # Проверяем наличие стиля TableGrid в документе
+                table_style = 'TableGrid'
+                if table_style not in docx_document.styles:
+                    try:
+                        # Пробуем создать стиль TableGrid
+                        docx_document.styles.add_style('TableGrid', WD_STYLE_TYPE.TABLE)
+                        logger.info("Создан стиль 'TableGrid' для таблиц")
+                    except Exception:
+                        # Если не удалось, используем Table Normal или оставляем без стиля
+                        table_style = 'Table Normal' if 'Table Normal' in docx_document.styles else None
+                        logger.warning(f"Не удалось создать стиль 'TableGrid', используем '{table_style or 'без стиля'}'")
                 
-                # Генерируем уникальный идентификатор для этого изображения
-                img_id = f"IMG_PLACEHOLDER_{i}"
+                # Устанавливаем стиль таблицы
+                parser.table_style = table_style
                 
-                # Пытаемся загрузить изображение
-                img_path = None
+                # Добавляем текст в документ
+                parser.add_events_to_document(events, tables, docx_document)
                 
-                try:
-                    # Обрабатываем различные форматы src
-                    if src.startswith(('http://', 'https://')):
-                        # Внешний URL
-                        logger.info(f"Загрузка изображения по URL: {src}")
-                        response = requests.get(src, stream=True, timeout=10)
-                        if response.status_code == 200:
-                            # Определяем расширение файла из Content-Type или URL
-                            content_type = response.headers.get('Content-Type', '')
-                            ext = mimetypes.guess_extension(content_type) or '.png'
-                            if ext == '.jpe':
-                                ext = '.jpg'
-                            
-                            # Сохраняем изображение во временную директорию
-                            img_path = os.path.join(temp_dir, f"image_{i}{ext}")
-                            with open(img_path, 'wb') as f:
-                                f.write(response.content)
-                            logger.info(f"Изображение сохранено: {img_path}")
-                        else:
-                            logger.warning(f"Не удалось загрузить изображение, статус: {response.status_code}")
+                # Применяем отступы к созданным параграфам
+                for paragraph, p_id in parser.paragraphs_created:
+                    # Проверяем, есть ли информация об отступах для этого параграфа
+                    info = parsed.paragraphs.get(p_id)
+                    if info is None:
+                        continue
                     
-                    elif src.startswith('data:image/'):
-                        # Data URL (base64)
-                        logger.info("Обработка Data URL изображения")
+                    # Применяем отступ первой строки из text-indent
+                    if info['text_indent']:
+                        value, unit = info['text_indent']
                         try:
-                            header, encoded = src.split(",", 1)
-                            content_type = header.split(";")[0].split(":")[1]
-                            ext = mimetypes.guess_extension(content_type) or '.png'
-                            if ext == '.jpe':
-                                ext = '.jpg'
-                            
-                            # Декодируем base64 и сохраняем изображение
-                            img_path = os.path.join(temp_dir, f"image_{i}{ext}")
-                            with open(img_path, 'wb') as f:
-                                f.write(base64.b64decode(encoded))
-                            logger.info(f"Base64 изображение сохранено: {img_path}")
-                        except Exception as e:
-                            logger.error(f"Ошибка при декодировании base64: {e}")
+                            # Преобразуем значение в сантиметры
+                            cm_value = convert_to_cm(float(value), unit)
+                            # Устанавливаем отступ первой строки напрямую
+                            paragraph.paragraph_format.first_line_indent = Cm(cm_value)
+                            logger.info(f"Установлен отступ первой строки {cm_value} см для параграфа {p_id}")
+                        except (ValueError, TypeError) as e:
+                            logger.warning(f"Не удалось применить отступ первой строки: {e}")
                     
-                    elif src.startswith('/'):
-                        # Локальный путь от корня сайта
-                        logger.info(f"Обработка локального пути: {src}")
-                        
-                        # Если путь начинается с /media/, используем MEDIA_ROOT
-                        if src.startswith('/media/'):
-                            file_path = os.path.join(settings.MEDIA_ROOT, src[7:])
-                        # Иначе пробуем относительно BASE_DIR
-                        else:
-                            file_path = os.path.join(settings.BASE_DIR, src[1:])
-                        
-                        if os.path.exists(file_path):
-                            # Копируем файл во временную директорию
-                            ext = os.path.splitext(file_path)[1] or '.png'
-                            img_path = os.path.join(temp_dir, f"image_{i}{ext}")
-                            with open(file_path, 'rb') as src_file, open(img_path, 'wb') as dst_file:
-                                dst_file.write(src_file.read())
-                            logger.info(f"Локальное изображение скопировано: {img_path}")
-                        else:
-                            # Если файл не найден, пробуем построить URL и загрузить через HTTP
-                            try:
-                                full_url = f"http://localhost:8000{src}"
-                                logger.info(f"Пробую загрузить через HTTP: {full_url}")
-                                response = requests.get(full_url, stream=True, timeout=10)
-                                if response.status_code == 200:
-                                    content_type = response.headers.get('Content-Type', '')
-                                    ext = mimetypes.guess_extension(content_type) or '.png'
-                                    if ext == '.jpe':
-                                        ext = '.jpg'
-                                    
-                                    img_path = os.path.join(temp_dir, f"image_{i}{ext}")
-                                    with open(img_path, 'wb') as f:
-                                        f.write(response.content)
-                                    logger.info(f"Изображение загружено через HTTP: {img_path}")
-                                else:
-                                    logger.warning(f"Не удалось загрузить через HTTP, статус: {response.status_code}")
-                            except Exception as e:
-                                logger.error(f"Ошибка при HTTP загрузке: {e}")
+                    # Применяем отступ слева из margin-left
+                    if info['margin_left']:
+                        value, unit = info['margin_left']
+                        try:
+                            # Преобразуем значение в сантиметры
+                            cm_value = convert_to_cm(float(value), unit)
+                            # Устанавливаем отступ слева напрямую
+                            paragraph.paragraph_format.left_indent = Cm(cm_value)
+                            logger.info(f"Установлен отступ слева {cm_value} см для параграфа {p_id}")
+                        except (ValueError, TypeError) as e:
+                            logger.warning(f"Не удалось применить отступ слева: {e}")
                     
-                    # Если удалось загрузить изображение, сохраняем информацию
-                    if img_path and os.path.exists(img_path):
-                        images_map[img_id] = img_path
-                        # Заменяем тег img на специальный маркер, который не будет интерпретирован как HTML
-                        img_marker = soup.new_string(f"[[IMG:{img_id}]]")
-                        img.replace_with(img_marker)
-                
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке изображения {src}: {e}", exc_info=True)
-            
-            # Преобразуем модифицированный HTML в строку
-            modified_html = str(soup)
-            
-            # Разбиваем HTML на части по маркерам изображений
-            parts = []
-            last_pos = 0
-            
-            for match in re.finditer(r'\[\[IMG:(IMG_PLACEHOLDER_\d+)\]\]', modified_html):
-                img_id = match.group(1)
-                start_pos = match.start()
-                end_pos = match.end()
-                
-                # Добавляем текст до изображения
-                if start_pos > last_pos:
-                    parts.append(('text', modified_html[last_pos:start_pos]))
-                
-                # Добавляем изображение
-                parts.append(('image', img_id))
-                
-                # Обновляем позицию
-                last_pos = end_pos
-            
-            # Добавляем оставшийся текст
-            if last_pos < len(modified_html):
-                parts.append(('text', modified_html[last_pos:]))
+                    # Неразрывные пробелы в начале абзаца превращаем в отступ первой строки
+                    nbsp_count = info['nbsp']
+                    if nbsp_count > 0:
+                        # Устанавливаем текст без неразрывных пробелов
+                        paragraph.text = paragraph.text.lstrip('\u00A0')
+                        # Устанавливаем отступ первой строки напрямую
+                        paragraph.paragraph_format.first_line_indent = Cm(nbsp_count * 0.25)
+                        logger.info(f"Установлен отступ первой строки {nbsp_count * 0.25} см на основе неразрывных пробелов")
+            except Exception as e:
+                logger.error(f"Ошибка при обработке текстовой части: {e}", exc_info=True)
+                # Добавляем текст напрямую в случае ошибки
+                clean_text = ''.join(event[1] for event in events if event[0] == 'data')
+                if clean_text.strip():
+                    docx_document.add_paragraph(clean_text)
+        
+        elif part_type == 'image':
+            img_id = content
+            image = images_map.get(img_id)
             
-            # Обрабатываем каждую часть
-            for part_type, content in parts:
-                if part_type == 'text' and content.strip():
+            if image is not None:
+                # python-docx читает изображение из буфера в памяти
+                image_stream = io.BytesIO(image.content)
+                # Добавляем изображение в новый параграф
+                p = docx_document.add_paragraph()
+                run = p.add_run()
+                try:
+                    # Устанавливаем выравнивание параграфа по центру для изображений
+                    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    
+                    # Определяем размер изображения (кэш уже знает его размеры в пикселях)
                     try:
-                        # Создаем временный HTML без маркеров изображений
-                        parser = HtmlToDocx()
-                        
-                        # Устанавливаем стиль для таблиц
-                        # Проверяем наличие стиля TableGrid в документе
-                        table_style = 'TableGrid'
-                        if table_style not in docx_document.styles:
-                            try:
-                                # Пробуем создать стиль TableGrid
-                                docx_document.styles.add_style('TableGrid', WD_STYLE_TYPE.TABLE)
-                                logger.info("Создан стиль 'TableGrid' для таблиц")
-                            except Exception:
-                                # Если не удалось, используем Table Normal или оставляем без стиля
-                                table_style = 'Table Normal' if 'Table Normal' in docx_document.styles else None
-                                logger.warning(f"Не удалось создать стиль 'TableGrid', используем '{table_style or 'без стиля'}'")
+                        run.add_picture(image_stream, width=get_picture_width(image))
+                    except Exception as img_error:
+                        # Если не удалось определить размер, используем стандартную ширину
+                        logger.warning(f"Не удалось определить размер изображения: {img_error}")
+                        run.add_picture(image_stream, width=Inches(5.0))
                         
-                        # Устанавливаем стиль таблицы
-                        parser.table_style = table_style
-                        
-                        # Добавляем текст в документ
-                        parser.add_html_to_document(content, docx_document)
-                        
-                        # Применяем отступы к созданным параграфам
-                        for paragraph, p_id in parser.paragraphs_created:
-                            # Проверяем, есть ли информация об отступах для этого параграфа
-                            if p_id in indent_info:
-                                info = indent_info[p_id]
-                                
-                                # Получаем текст параграфа
-                                text = paragraph.text
-                                
-                                # Применяем отступ первой строки из text-indent
-                                if info['text_indent']:
-                                    value, unit = info['text_indent']
-                                    try:
-                                        # Преобразуем значение в сантиметры
-                                        cm_value = convert_to_cm(float(value), unit)
-                                        # Устанавливаем отступ первой строки напрямую
-                                        paragraph.paragraph_format.first_line_indent = Cm(cm_value)
-                                        logger.info(f"Установлен отступ первой строки {cm_value} см для параграфа {p_id}")
-                                    except (ValueError, TypeError) as e:
-                                        logger.warning(f"Не удалось применить отступ первой строки: {e}")
-                                
-                                # Применяем отступ слева из margin-left
-                                if info['margin_left']:
-                                    value, unit = info['margin_left']
-                                    try:
-                                        # Преобразуем значение в сантиметры
-                                        cm_value = convert_to_cm(float(value), unit)
-                                        # Устанавливаем отступ слева напрямую
-                                        paragraph.paragraph_format.left_indent = Cm(cm_value)
-                                        logger.info(f"Установлен отступ слева {cm_value} см для параграфа {p_id}")
-                                    except (ValueError, TypeError) as e:
-                                        logger.warning(f"Не удалось применить отступ слева: {e}")
-                            
-                            # Проверяем, есть ли информация о неразрывных пробелах для этого параграфа
-                            auto_id = f"auto_{id(paragraph)}"
-                            if p_id in paragraphs_with_nbsp or auto_id in paragraphs_with_nbsp:
-                                nbsp_count = paragraphs_with_nbsp.get(p_id, paragraphs_with_nbsp.get(auto_id, 0))
-                                if nbsp_count > 0:
-                                    # Получаем текст параграфа без начальных неразрывных пробелов
-                                    text = paragraph.text
-                                    text_without_nbsp = text.lstrip('\u00A0')
-                                    # Устанавливаем текст без неразрывных пробелов
-                                    paragraph.text = text_without_nbsp
-                                    # Устанавливаем отступ первой строки напрямую
-                                    paragraph.paragraph_format.first_line_indent = Cm(nbsp_count * 0.25)
-                                    logger.info(f"Установлен отступ первой строки {nbsp_count * 0.25} см на основе неразрывных пробелов")
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке текстовой части: {e}", exc_info=True)
-                        # Добавляем текст напрямую в случае ошибки
-                        clean_text = BeautifulSoup(content, 'html.parser').get_text()
-                        if clean_text.strip():
-                            docx_document.add_paragraph(clean_text)
-                
-                elif part_type == 'image':
-                    img_id = content
-                    img_path = images_map.get(img_id)
-                    
-                    if img_path and os.path.exists(img_path):
-                        # Добавляем изображение в новый параграф
-                        p = docx_document.add_paragraph()
-                        run = p.add_run()
-                        try:
-                            # Устанавливаем выравнивание параграфа по центру для изображений
-                            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            
-                            # Определяем размер изображения
-                            try:
-                                # Проверяем, доступен ли модуль PIL
-                                try:
-                                    from PIL import Image
-                                    has_pil = True
-                                except ImportError:
-                                    has_pil = False
-                                    logger.warning("Модуль PIL (Pillow) не установлен, размер изображения не будет определен")
-                                
-                                if has_pil:
-                                    with Image.open(img_path) as img:
-                                        width, height = img.size
-                                        # Ограничиваем ширину изображения до 5.5 дюймов (14 см)
-                                        max_width = Inches(5.5)
-                                        if width > max_width.pt:
-                                            # Сохраняем пропорции
-                                            aspect_ratio = height / width
-                                            width_inches = min(width / 72, 5.5)  # 72 DPI для преобразования в дюймы
-                                            run.add_picture(img_path, width=Inches(width_inches))
-                                        else:
-                                            # Если изображение небольшое, добавляем его как есть
-                                            run.add_picture(img_path)
-                                else:
-                                    # Если PIL не доступен, используем стандартную ширину
-                                    run.add_picture(img_path, width=Inches(5.0))
-                            except Exception as img_error:
-                                # Если не удалось определить размер, используем стандартную ширину
-                                logger.warning(f"Не удалось определить размер изображения: {img_error}")
-                                run.add_picture(img_path, width=Inches(5.0))
-                                
-                            logger.info(f"Добавлено изображение: {img_path}")
-                        except Exception as pic_error:
-                            logger.error(f"Ошибка при добавлении изображения: {pic_error}")
-                            # Пытаемся добавить изображение альтернативным способом
-                            try:
-                                run.add_picture(img_path)
-                                logger.info(f"Изображение добавлено альтернативным способом: {img_path}")
-                            except Exception as alt_error:
-                                logger.error(f"Не удалось добавить изображение: {alt_error}")
-                                # Добавляем текст с путем к изображению
-                                run.add_text(f"[Изображение: {os.path.basename(img_path)}]")
-            
-            logger.info("HTML успешно преобразован и добавлен в документ")
-            
-            # ПРИНУДИТЕЛЬНО устанавливаем отступ для всех параграфов
-            for paragraph in docx_document.paragraphs:
-                try:
-                    # Проверяем, что параграф не пустой
-                    if paragraph.text.strip():
-                        # Проверяем наличие стиля
-                        style_name = getattr(paragraph.style, 'name', '') if hasattr(paragraph, 'style') and paragraph.style else ''
-                        # Пропускаем заголовки
-                        if style_name not in ['Heading 1', 'Heading 2', 'Heading 3', 'Heading 4', 'Title']:
-                            paragraph.paragraph_format.first_line_indent = Cm(1.25)
-                            logger.info(f"ПРИНУДИТЕЛЬНО установлен отступ 1.25 см для параграфа: '{paragraph.text[:20]}...'")
-                except Exception as style_error:
-                    logger.warning(f"Ошибка при установке отступа для параграфа: {style_error}")
-    
-    except Exception as e:
-        logger.error(f"Ошибка при обработке HTML: {e}", exc_info=True)
-        # В случае ошибки добавляем просто текст как запасной вариант
-        try:
-            plain_text = BeautifulSoup(html_content, 'html.parser').get_text()
-            docx_document.add_paragraph(f"[Ошибка конвертации HTML, вставлен как текст]:\n{plain_text}")
-        except Exception as fallback_e:
-            logger.error(f"Ошибка при аварийной вставке HTML как текста: {fallback_e}")
-            docx_document.add_paragraph("[Ошибка конвертации HTML, не удалось вставить даже как текст]")
+                    logger.info(f"Добавлено изображение {img_id} ({len(image.content)} байт)")
+                except Exception as pic_error:
+                    logger.error(f"Ошибка при добавлении изображения: {pic_error}")
+                    # Пытаемся добавить изображение альтернативным способом
+                    try:
+                        run.add_picture(image_stream)
+                        logger.info(f"Изображение {img_id} добавлено альтернативным способом")
+                    except Exception as alt_error:
+                        logger.error(f"Не удалось добавить изображение: {alt_error}")
+                        # Добавляем текст-заглушку вместо изображения
+                        run.add_text("[Изображение недоступно]")
 
 def get_docx_template(template_name):
     """
@@ -593,20 +401,10 @@ def get_docx_template(template_name):
     Returns:
         str: Путь к файлу шаблона или None, если шаблон не найден
     """
-    template_path = os.path.join(settings.BASE_DIR, 'templates', 'docx', f"{template_name}.docx")
-    if os.path.exists(template_path):
+    template_path = resolve_template_path(template_name)
+    if template_path:
         logger.info(f"Шаблон найден: {template_path}")
-        return template_path
-    
-    logger.warning(f"Шаблон не найден: {template_path}")
-    # Используем стандартный шаблон, если нужный не найден
-    default_path = os.path.join(settings.BASE_DIR, 'templates', 'docx', 'diplo_project.docx')
-    if os.path.exists(default_path):
-        logger.info(f"Используется стандартный шаблон: {default_path}")
-        return default_path
-    
-    logger.error("Стандартный шаблон не найден")
-    return None
+    return template_path
 
 def ensure_basic_styles(docx):
     """
@@ -639,7 +437,7 @@ def ensure_basic_styles(docx):
         normal_style = docx.styles['Normal']
     
     # Устанавливаем параметры стиля Normal
-    normal_style.font.name = 'Times New Roman'
+    set_style_font(normal_style, 'Times New Roman')
     normal_style.font.size = Pt(12)
     normal_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
     normal_style.paragraph_format.first_line_indent = Cm(1.25)  # Отступ первой строки - 1.25 см
@@ -662,9 +460,13 @@ def ensure_basic_styles(docx):
             else:
                 style = docx.styles[style_name]
                 
-            style.font.name = 'Times New Roman'
+            # Шрифт и цвет задаются явно: встроенные стили заголовков
+            # берут их из темы (Calibri Light, синий) и курсив для Heading 4
+            set_style_font(style, 'Times New Roman')
             style.font.size = params['size']
             style.font.bold = params['bold']
+            style.font.italic = None
+            style.font.color.rgb = RGBColor(0, 0, 0)
             style.paragraph_format.alignment = params['align']
             style.paragraph_format.space_before = Pt(12)
             style.paragraph_format.space_after = Pt(6)
@@ -682,7 +484,7 @@ def ensure_basic_styles(docx):
             else:
                 style = docx.styles[list_style_name]
                 
-            style.font.name = 'Times New Roman'
+            set_style_font(style, 'Times New Roman')
             style.font.size = Pt(12)
             style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
             style.paragraph_format.left_indent = Pt(18)  # Отступ слева для списка
@@ -713,50 +515,27 @@ def replace_document_fields(docx, replacements):
     При замене поля на значение добавляет нужное количество пробелов для сохранения
     размера строки, если значение короче плейсхолдера.
     
+    Документ просматривается один раз (тело, таблицы, надписи, колонтитулы):
+    поля ищутся одним выражением, а поле, разбитое на несколько прогонов,
+    заменяется без слияния прогонов (см. FieldReplacer).
+    
     Args:
         docx (Document): Документ python-docx
         replacements (dict): Словарь с заменами {поле: значение}
+        
+    Returns:
+        int: Число замененных полей
     """
     logger.info("Замена полей в шаблоне с сохранением форматирования")
     
-    # Заменяем поля в параграфах более умным способом
-    for paragraph in docx.paragraphs:
-        # Проверяем, содержит ли параграф какое-либо поле
-        for field, value in replacements.items():
-            if field in paragraph.text:
-                # Преобразуем значение поля в строку и обрабатываем специальные случаи
-                value_str = str(value) if value is not None else ""
-                
-                # Вычисляем разницу в длине между полем и значением
-                length_diff = len(field) - len(value_str)
-                
-                # Если значение короче поля, добавляем пробелы для компенсации
-                if length_diff > 0:
-                    # Добавляем пробелы, чтобы сохранить форматирование
-                    value_str = value_str + ' ' * length_diff
-                
-                # Заменяем поле на значение с компенсированной длиной
-                paragraph.text = paragraph.text.replace(field, value_str)
-    
-    # Заменяем поля в таблицах с тем же подходом
-    for table in docx.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for field, value in replacements.items():
-                        if field in paragraph.text:
-                            # Преобразуем значение поля в строку
-                            value_str = str(value) if value is not None else ""
-                            
-                            # Вычисляем разницу в длине
-                            length_diff = len(field) - len(value_str)
-                            
-                            # Если значение короче поля, добавляем пробелы
-                            if length_diff > 0:
-                                value_str = value_str + ' ' * length_diff
-                            
-                            # Заменяем поле на компенсированное значение
-                            paragraph.text = paragraph.text.replace(field, value_str)
+    padded = {}
+    for field, value in replacements.items():
+        # Преобразуем значение поля в строку и обрабатываем специальные случаи
+        value_str = str(value) if value is not None else ""
+        # Если значение короче поля, добавляем пробелы для компенсации
+        padded[field] = value_str.ljust(len(field))
+    
+    return FieldReplacer(padded).replace(docx)
 
 def apply_document_formatting(docx, standard_name):
     """
@@ -841,137 +620,188 @@ def add_page_numbers(docx):
     except Exception as e:
         logger.error(f"Ошибка при добавлении нумерации страниц: {e}")
 
-def merge_docs(doc_title, doc_body):
+def merge_docs(doc_title, doc_body, move=False):
     """
     Объединяет два документа: копирует все элементы из doc_body в конец doc_title.
-    Обеспечивает корректное копирование всех элементов, включая изображения.
+    Обеспечивает корректное копирование всех элементов, включая изображения,
+    стили, нумерацию списков, сноски и внешние ссылки (см. DocxComposer).
     
     Args:
         doc_title (Document): Документ-приемник (с титульным листом)
         doc_body (Document): Документ-источник (с основным содержимым)
+        move (bool): Переносить элементы вместо глубокого копирования.
+            Документ-источник после этого использовать нельзя.
     """
-    import copy
-    from docx.oxml.section import CT_SectPr
-    from docx.oxml.table import CT_Tbl
-    from docx.oxml.text.paragraph import CT_P
-    
     try:
-        # Получаем тело документа-приемника
-        body_target = doc_title.element.body
-        
-        # Копируем все стили из документа-источника в документ-приемник
-        # Объект Styles не поддерживает метод items(), поэтому обходим стили по-другому
-        try:
-            # Получаем все стили из документа-источника
-            source_styles = doc_body.styles
-            # Получаем все стили из документа-приемника
-            target_styles = doc_title.styles
-            
-            # Проходим по всем стилям в документе-источнике
-            for style in source_styles:
-                style_id = style.style_id
-                # Проверяем, существует ли стиль в документе-приемнике
-                if style_id not in [s.style_id for s in target_styles]:
-                    try:
-                        # Добавляем стиль в документ-приемник
-                        target_styles.add_style(style_id, style.type, style.name)
-                        logger.info(f"Скопирован стиль {style_id} из документа-источника")
-                    except Exception as style_error:
-                        logger.warning(f"Не удалось скопировать стиль {style_id}: {style_error}")
-        except Exception as styles_error:
-            logger.warning(f"Ошибка при копировании стилей: {styles_error}")
-            # Продолжаем выполнение даже если не удалось скопировать стили
-        
-        # Создаем словарь для отображения старых ID изображений на новые
-        image_map = {}
-        
-        # Копируем все изображения из документа-источника
-        # Для этого нужно скопировать все отношения (relationships)
-            # Копируем все изображения из документа-источника
-        for rel_id, rel in list(doc_body.part.rels.items()):
-            if rel.is_external:
-                logger.info(f"Пропущено внешнее отношение: {rel_id}")
-                continue
-
-            if rel.reltype == RT.IMAGE:
-                try:
-                    # Получаем исходную часть изображения
-                    source_image_part = rel.target_part
-                    image_bytes = source_image_part.blob
-
-                    # Добавляем (или находим) эту картинку в пакете целевого документа
-                    new_image_part = doc_title.part.package.image_parts.get_or_add_image_part(
-                        io.BytesIO(image_bytes)
-                    )
-
-                    # Создаём отношение в основном part'е и сразу получаем rId
-                    new_rId = doc_title.part.relate_to(
-                        new_image_part,
-                        RT.IMAGE
-                    )
-
-                    image_map[rel_id] = new_rId
-                    logger.info(
-                        f"Скопировано/использовано изображение {rel_id} (старый) -> "
-                        f"{new_rId} (новый), часть: {new_image_part.partname}, "
-                        f"тип: {new_image_part.content_type}"
-                    )
-                except Exception as img_error:
-                    logger.warning(
-                        f"Ошибка при копировании изображения {rel_id}: {img_error}",
-                        exc_info=True
-                    )
-        
-        # Копируем все элементы из документа-источника
-        for element in doc_body.element.body:
-            # Пропускаем секционные свойства, чтобы не нарушить структуру документа
-            if isinstance(element, CT_SectPr):
-                logger.info("Пропущены секционные свойства при объединении документов")
-                continue
-                
-            # Создаем глубокую копию XML-узла
-            new_el = copy.deepcopy(element)
-            
-            # Обновляем ссылки на изображения в новом элементе
-            try:
-                # Находим все элементы blip в XML-дереве без использования xpath с namespaces
-                # Используем прямой обход XML-дерева
-                def update_blip_refs(element):
-                    # Проверяем, является ли элемент blip
-                    if element.tag.endswith('}blip'):
-                        # Получаем атрибут с namespace для embed
-                        for key, value in element.attrib.items():
-                            if key.endswith('}embed') and value in image_map:
-                                # Заменяем на новый ID
-                                element.attrib[key] = image_map[value]
-                                logger.info(f"Обновлена ссылка на изображение: {value} -> {image_map[value]}")
-                    
-                    # Рекурсивно обходим все дочерние элементы
-                    for child in element:
-                        update_blip_refs(child)
-                
-                # Запускаем обход с корня элемента
-                update_blip_refs(new_el)
-            except Exception as blip_error:
-                logger.warning(f"Ошибка при обновлении ссылок на изображения: {blip_error}")
-            
-            # Добавляем элемент в документ-приемник
-            body_target.append(new_el)
-        
+        DocxComposer(doc_title).append(doc_body, move=move)
         logger.info("Документы успешно объединены")
     except Exception as e:
         logger.error(f"Ошибка при объединении документов: {e}", exc_info=True)
         raise
 
-def apply_formatting_to_paragraphs(doc):
+def new_body_document(standart):
     """
-    Принудительно применяет форматирование ко всем параграфам документа.
+    Создает пустой документ основной части со стилями по ГОСТ и стандарту.
+    Стили настраиваются один раз на профиль оформления (см. body_prototypes),
+    а здесь документ только разбирается из готового прототипа.
+    """
+    doc_body = body_prototypes.get_document(standart)
+    logger.info(f"Основная часть создана из прототипа: {body_prototypes.stats()}")
+    return doc_body
+
+def get_fragment_key(html_content, standart):
+    """
+    Возвращает ключ фрагмента раздела: HTML раздела и профиль оформления
+    (версия кода, стандарт, способ преобразования HTML и обработка изображений).
+    """
+    return fingerprint(
+        'fragment',
+        EXPORT_CODE_VERSION,
+        standart or '',
+        getattr(settings, 'DOCX_HTML_EMITTER', 'native'),
+        getattr(settings, 'EXPORT_IMAGE_OPTIMIZE', True),
+        getattr(settings, 'EXPORT_IMAGE_DPI', None),
+        getattr(settings, 'EXPORT_IMAGE_MAX_WIDTH_CM', None),
+        getattr(settings, 'EXPORT_IMAGE_JPEG_QUALITY', None),
+        html_content,
+    )
+
+def add_content_fragments(doc_body, html_content, standart):
+    """
+    Добавляет HTML основной части по разделам (по заголовкам h1/h2).
+    
+    Раздел, найденный в кэше фрагментов, вставляется из кэша; остальные
+    преобразуются прямо в основную часть, а созданные элементы сохраняются
+    в кэш как DOCX-фрагмент. Фрагменты с заглушками вместо изображений или
+    с ошибкой преобразования не кэшируются, чтобы временный сбой не закрепился.
+    
+    Args:
+        doc_body (Document): Документ основной части (из new_body_document)
+        html_content (str): HTML основной части
+        standart (str): Стандарт оформления
+    """
+    sections = split_sections(html_content)
+    composer = DocxComposer(doc_body)
+    body = doc_body.element.body
+    hits = 0
+    for section_html in sections:
+        key = get_fragment_key(section_html, standart)
+        content = fragment_cache.get_fragment(key)
+        if content is not None:
+            composer.append_elements(*unpack_fragment(content))
+            hits += 1
+            continue
+        
+        # Новые элементы вставляются перед секционными свойствами в конце тела
+        start = len(body) - 1
+        complete = process_html_to_docx(section_html, doc_body)
+        if complete:
+            fragment_cache.put_fragment(key, pack_fragment(doc_body, list(body)[start:len(body) - 1]))
+    
+    logger.info(
+        f"Кэш фрагментов: разделов {len(sections)}, из кэша {hits}, преобразовано {len(sections) - hits}; "
+        f"за процесс {fragment_cache.stats()}"
+    )
+
+def build_body_document(document_obj):
+    """
+    Создает документ с основной частью: стили, содержимое, список литературы
+    и нумерация страниц. Содержимое в виде HTML дает адаптер типа документа.
+    
+    Args:
+        document_obj: Документ из базы данных (Document_main, Document, Document_sto)
+        
+    Returns:
+        Document: Документ python-docx с основной частью
+    """
+    adapter = adapter_for(document_obj)
+    standart = adapter.standart(document_obj)
+    html_content = adapter.body_html(document_obj)
+    doc_body = new_body_document(standart)
+    
+    # Добавляем содержимое документа
+    if html_content:
+        logger.info("Добавление содержимого документа")
+        if getattr(settings, 'EXPORT_FRAGMENT_CACHE', True):
+            add_content_fragments(doc_body, html_content, standart)
+        else:
+            process_html_to_docx(html_content, doc_body)
+    else:
+        doc_body.add_paragraph("Документ не содержит данных")
+    
+    # Добавляем список литературы по DOI (у остальных типов он входит в HTML)
+    if adapter.doi_references:
+        add_references_section(doc_body, document_obj)
+        
+    # Добавляем нумерацию страниц
+    add_page_numbers(doc_body)
+    return doc_body
+
+def compose_export_document(doc_title, doc_body, single_pass=None):
+    """
+    Собирает итоговый документ из отрендеренного титульного листа и основной части.
+    
+    В однопроходном режиме (по умолчанию) элементы основной части переносятся
+    прямо в документ титульного листа без промежуточного сохранения в BytesIO,
+    повторного разбора и глубокого копирования. Прежний режим оставлен для
+    сравнения (DOCX_EXPORT_SINGLE_PASS = False).
+    
+    Args:
+        doc_title (Document): Титульный лист (DocxTemplate.docx или копия из кэша)
+        doc_body (Document): Документ с основной частью
+        single_pass (bool): Режим сборки; по умолчанию берется из настроек
+        
+    Returns:
+        Document: Итоговый документ python-docx
+    """
+    if single_pass is None:
+        single_pass = getattr(settings, 'DOCX_EXPORT_SINGLE_PASS', True)
+    
+    if single_pass:
+        logger.info("Объединение титульного листа и основной части (однопроходный режим)")
+        merge_docs(doc_title, doc_body, move=True)
+        return doc_title
+    
+    # Сохраняем титульный лист в BytesIO и загружаем его как Document
+    title_io = BytesIO()
+    doc_title.save(title_io)
+    title_io.seek(0)
+    doc_title = Document(title_io)
+    logger.info("Титульный лист сохранен в BytesIO и загружен повторно")
+    
+    # Сохраняем основную часть в BytesIO и загружаем ее повторно
+    body_io = BytesIO()
+    doc_body.save(body_io)
+    body_io.seek(0)
+    logger.info("Основная часть сохранена в BytesIO")
+    
+    logger.info("Объединение титульного листа и основной части")
+    merge_docs(doc_title, Document(body_io))
+    return doc_title
+
+def apply_formatting_to_paragraphs(doc, style_driven=None):
+    """
+    Применяет форматирование по ГОСТ ко всем параграфам документа.
     Эта функция вызывается после слияния документов, чтобы убедиться, 
     что все стили применены правильно.
     
+    По умолчанию оформление задается стилями (Body Text, Heading N), а прямое
+    форматирование остается только там, где стиль дает другое значение.
+    Прежнее прямое форматирование каждого абзаца и прогона оставлено для
+    сравнения (DOCX_STYLE_FORMATTING = False).
+    
     Args:
         doc (Document): Документ python-docx
+        style_driven (bool): Режим оформления; по умолчанию берется из настроек
     """
+    if style_driven is None:
+        style_driven = getattr(settings, 'DOCX_STYLE_FORMATTING', True)
+    
+    if style_driven:
+        logger.info("Применение форматирования через стили")
+        apply_style_formatting(doc)
+        return
+    
     logger.info("Принудительное применение форматирования ко всем параграфам")
     
     # Применяем форматирование ко всем параграфам
@@ -1030,21 +860,343 @@ def apply_formatting_to_paragraphs(doc):
     
     logger.info("Форматирование применено ко всем параграфам документа")
 
-@login_required
-def main_export_docx(request, pk):
+def get_export_key(document_obj, template_name, export_format, engine='docx', docx_key=None):
     """
-    Экспорт документа Main в формат DOCX.
+    Возвращает отпечаток экспорта. Ключ DOCX — версия документа: поля
+    документа, версия файла шаблона, метаданные источников и версия кода
+    экспорта. Ключи PDF производные от ключа DOCX, поэтому PDF кэшируется
+    как отдельный результат той же версии документа.
     
     Args:
-        request: HTTP запрос
-        pk (int): ID документа
+        document_obj: Документ из базы данных
+        template_name (str): Название шаблона титульного листа
+        export_format (str): Формат файла ('docx', 'pdf')
+        engine (str): Способ построения PDF ('docx', 'fast')
+        docx_key (str): Уже вычисленный ключ DOCX этого документа
         
     Returns:
-        HttpResponse: Ответ с DOCX файлом
+        str: Ключ кэша (SHA-256)
+    """
+    if docx_key is None:
+        docx_key = fingerprint(
+            'docx',
+            EXPORT_CODE_VERSION,
+            template_cache.get_version(template_name),
+            type(document_obj).__name__,
+            adapter_for(document_obj).fingerprint_data(document_obj),
+            resolve_references(document_obj),
+        )
+    if export_format == 'docx':
+        return docx_key
+    return fingerprint(export_format, engine, docx_key)
+
+def etag_matches(request, etag):
+    """Проверяет, совпадает ли ETag с заголовком If-None-Match запроса."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+def get_export_filename(document_obj, extension):
+    """Возвращает безопасное имя файла экспорта."""
+    safe_filename = slugify(adapter_for(document_obj).filename_base(document_obj) or "document")
+    if not safe_filename:  # Дополнительная проверка на пустое имя
+        safe_filename = f"document_{document_obj.pk}"
+    return f"{safe_filename}.{extension}"
+
+def export_file_response(content, filename, content_type, etag=None):
+    """Формирует ответ с файлом экспорта и (при наличии) строгим ETag."""
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if etag:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def cached_export_response(request, document_obj, template_name, export_format, content_type,
+                           engine='docx', docx_key=None):
     """
-    logger.info(f"Начат экспорт документа Main (ID: {pk}) в DOCX")
+    Отвечает из кэша экспорта, если результат для текущей версии документа уже есть.
     
-    # Проверяем наличие необходимых зависимостей
+    Returns:
+        tuple: (ответ или None, ключ экспорта, ETag)
+    """
+    export_key = get_export_key(document_obj, template_name, export_format, engine, docx_key)
+    etag = quote_etag(export_key)
+    
+    if etag_matches(request, etag):
+        logger.info(f"Документ {document_obj.pk} не изменился, ответ 304 ({export_format})")
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response, export_key, etag
+    
+    content = export_cache.get(export_key, export_format)
+    if content is not None:
+        filename = get_export_filename(document_obj, export_format)
+        return export_file_response(content, filename, content_type, etag), export_key, etag
+    
+    return None, export_key, etag
+
+class ExportError(Exception):
+    """Ошибка экспорта, о которой нужно сообщить пользователю."""
+
+class PdfConversionError(ExportError):
+    """Не удалось сконвертировать готовый DOCX в PDF."""
+
+def get_template_name(document_obj):
+    """Возвращает название шаблона титульного листа по типу работы."""
+    return adapter_for(document_obj).template_name(document_obj)
+
+def get_title_key(template_name, context):
+    """
+    Возвращает ключ отрендеренного титульного листа: версия кода, версия
+    файла шаблона и контекст. Контекст нормализуется при расчете отпечатка
+    (ключи сортируются, даты и прочие значения приводятся к str).
+    """
+    return fingerprint('title', EXPORT_CODE_VERSION, template_cache.get_version(template_name), context)
+
+def render_title_page(document_obj):
+    """
+    Возвращает титульный лист документа. Отрендеренный титульный лист
+    хранится в кэше фрагментов по версии шаблона и контексту, поэтому
+    повторный экспорт без изменений метаданных обходится без Jinja: лист
+    только разбирается из сохраненного DOCX.
+    
+    Args:
+        document_obj: Документ из базы данных
+        
+    Returns:
+        Document: Титульный лист python-docx
+    """
+    adapter = adapter_for(document_obj)
+    template_name = adapter.template_name(document_obj)
+    context = adapter.title_context(document_obj)
+    use_cache = getattr(settings, 'EXPORT_FRAGMENT_CACHE', True)
+    
+    if use_cache:
+        key = get_title_key(template_name, context)
+        content = fragment_cache.get_fragment(key)
+        if content is not None:
+            logger.info("Титульный лист взят из кэша фрагментов")
+            return Document(BytesIO(content))
+    
+    # Берём копию разобранного шаблона из кэша и рендерим её с помощью DocxTemplate
+    doc_template = template_cache.get_template(template_name)
+    if doc_template is None:
+        raise ExportError("Не удалось найти шаблон для документа.")
+    logger.info(f"Кэш шаблонов: {template_cache.stats()}")
+    
+    logger.info("Заполнение шаблона через DocxTemplate")
+    doc_title = render_template(doc_template, context)
+    logger.info("Титульный лист успешно подготовлен")
+    
+    if use_cache:
+        title_io = BytesIO()
+        doc_title.save(title_io)
+        fragment_cache.put_fragment(key, title_io.getvalue())
+    return doc_title
+
+def build_export_document(document_obj):
+    """
+    Собирает итоговый документ python-docx: титульный лист из шаблона,
+    основная часть, список литературы и форматирование. Все, что зависит
+    от типа документа, берется из его адаптера экспорта.
+    
+    Args:
+        document_obj: Документ из базы данных (Document_main, Document, Document_sto)
+        
+    Returns:
+        Document: Итоговый документ python-docx
+    """
+    # Шаг 1: Титульный лист из кэша или из шаблона через DocxTemplate
+    doc_title = render_title_page(document_obj)
+    
+    # Шаг 2: Создаем отдельный документ для основной части
+    doc_body = build_body_document(document_obj)
+    
+    # Шаг 3: Объединяем документы
+    doc_title = compose_export_document(doc_title, doc_body)
+    
+    # Шаг 4: Применяем форматирование после слияния
+    logger.info("Применение форматирования после слияния документов")
+    # Устанавливаем поля для всех секций
+    for section in doc_title.sections:
+        section.left_margin = Cm(3.0)    # левое - 30 мм
+        section.right_margin = Cm(1.0)   # правое - 10 мм
+        section.top_margin = Cm(2.0)     # верхнее - 20 мм
+        section.bottom_margin = Cm(2.0)  # нижнее - 20 мм
+    
+    # Применяем форматирование ко всем параграфам
+    apply_formatting_to_paragraphs(doc_title)
+    return doc_title
+
+def render_docx(document_obj):
+    """
+    Строит DOCX для документа любого типа и возвращает его содержимое.
+    
+    Returns:
+        bytes: Содержимое DOCX файла
+    """
+    doc_title = build_export_document(document_obj)
+    
+    # Шаг 5: Сохраняем итоговый документ в BytesIO
+    final_io = BytesIO()
+    doc_title.save(final_io)
+    logger.info("Итоговый документ сохранен в BytesIO")
+    
+    # Проверяем, что данные есть
+    file_content = final_io.getvalue()
+    if not file_content:
+        logger.error("Итоговый файл имеет нулевой размер")
+        raise ExportError("Ошибка при создании документа: файл не был создан")
+    return file_content
+
+def convert_docx_to_pdf(docx_content):
+    """
+    Конвертирует DOCX в PDF выбранным бэкендом (EXPORT_PDF_BACKEND):
+    docx2pdf в Windows или пул LibreOffice на Linux.
+    
+    Args:
+        docx_content (bytes): Содержимое DOCX файла
+        
+    Returns:
+        bytes: Содержимое PDF файла
+    """
+    backend = get_pdf_backend()
+    logger.info(f"Конвертация DOCX в PDF через {backend.name}")
+    try:
+        return backend.convert(docx_content)
+    except PdfBackendError as pdf_error:
+        raise PdfConversionError(str(pdf_error)) from pdf_error
+
+def references_html(document_obj):
+    """Список литературы в HTML для быстрого PDF (как add_references_section)."""
+    references = resolve_references(document_obj)
+    items = [
+        format_citation_gost(metadata) if metadata else f"DOI: {doi} (не удалось получить метаданные)"
+        for doi, metadata in references
+    ]
+    if not items:
+        return '<h1>Список литературы</h1><p>Список литературы не содержит источников.</p>'
+    return '<h1>Список литературы</h1>' + ''.join(
+        f'<p><b>{i}. </b>{escape(item)}</p>' for i, item in enumerate(items, 1)
+    )
+
+def render_fast_pdf(document_obj):
+    """
+    Строит PDF напрямую из данных документа, без DOCX и конвертации:
+    контекст титульного листа и HTML основной части из адаптера
+    оформляются печатной таблицей стилей по ГОСТ (см. fast_pdf).
+    
+    Returns:
+        bytes: Содержимое PDF файла
+    """
+    adapter = adapter_for(document_obj)
+    html_content = adapter.body_html(document_obj)
+    if adapter.doi_references:
+        html_content += references_html(document_obj)
+    
+    # Изображения загружаются и оптимизируются так же, как для DOCX
+    sources = [img.get('src', '') for img in BeautifulSoup(html_content, 'html.parser').find_all('img')]
+    images_map = load_images(sources)
+    images = {sources[i]: image for i, image in images_map.items()}
+    
+    try:
+        return fast_pdf.render_pdf(
+            adapter.title_context(document_obj), html_content, images, image_placeholder_text
+        )
+    except PdfBackendError as pdf_error:
+        raise PdfConversionError(str(pdf_error)) from pdf_error
+
+EXPORT_CONTENT_TYPES = {
+    'docx': DOCX_CONTENT_TYPE,
+    'pdf': 'application/pdf',
+}
+
+# Способы построения PDF: через DOCX и конвертер или напрямую из HTML
+PDF_ENGINES = ('docx', 'fast')
+
+def render_export(document_obj, export_format, engine='docx', docx_key=None):
+    """
+    Строит файл экспорта в указанном формате. PDF через DOCX строится из
+    DOCX-артефакта той же версии документа: он берется из кэша экспорта
+    или рендерится один раз и сохраняется для следующих запросов DOCX.
+    
+    Args:
+        document_obj: Документ из базы данных
+        export_format (str): Формат файла ('docx', 'pdf')
+        engine (str): Способ построения PDF ('docx', 'fast')
+        docx_key (str): Ключ DOCX-артефакта, если уже вычислен
+        
+    Returns:
+        bytes: Содержимое файла
+    """
+    if export_format == 'docx':
+        return render_docx(document_obj)
+    if export_format == 'pdf':
+        if engine == 'fast':
+            return render_fast_pdf(document_obj)
+        docx_content, _ = export_document(document_obj, 'docx', docx_key)
+        return convert_docx_to_pdf(docx_content)
+    raise ExportError(f"Неподдерживаемый формат экспорта: {export_format}")
+
+def export_document(document_obj, export_format, export_key=None, engine='docx', docx_key=None, user=None,
+                    admission_wait=None):
+    """
+    Возвращает файл экспорта из кэша или строит его и сохраняет в кэш.
+    
+    Одновременные запросы одной версии документа в одном формате
+    объединяются (export_flight): файл строит первый запрос, остальные ждут
+    его и берут результат из кэша экспорта, не занимая слот допуска.
+    Веб-запрос, не дождавшийся результата за EXPORT_FLIGHT_WAIT секунд,
+    получает ExportRejected (503), а не строит файл повторно.
+    
+    Args:
+        document_obj: Документ из базы данных
+        export_format (str): Формат файла ('docx', 'pdf')
+        export_key (str): Ключ экспорта, если уже вычислен
+        engine (str): Способ построения PDF ('docx', 'fast')
+        docx_key (str): Ключ DOCX-артефакта, если уже вычислен
+        user (User): Пользователь, для которого построение проходит допуск
+            export_admission; None — без допуска (пулы экспорта ограничены сами)
+        admission_wait (float): Сколько ждать допуска; задано — ждать и слота
+            пользователя (фоновые задачи). None — EXPORT_QUEUE_WAIT
+    
+    Returns:
+        tuple: (содержимое файла, ключ экспорта)
+    """
+    if export_key is None:
+        if docx_key is None:
+            docx_key = get_export_key(document_obj, get_template_name(document_obj), 'docx')
+        export_key = get_export_key(document_obj, None, export_format, engine, docx_key)
+    elif export_format == 'docx':
+        docx_key = export_key
+    content = export_cache.get(export_key, export_format)
+    if content is not None:
+        return content, export_key
+    
+    def render():
+        if user is not None:
+            # Рендеринг допускается в пределах бюджета памяти и лимита пользователя
+            with export_admission.admit(user, admission_wait, wait_for_user=admission_wait is not None):
+                content = render_export(document_obj, export_format, engine, docx_key)
+        else:
+            content = render_export(document_obj, export_format, engine, docx_key)
+        export_cache.put(export_key, export_format, content)
+        return content
+    
+    # Веб-запрос ждет чужой результат недолго и затем получает 503; фоновые
+    # построения (задачи, пакетный экспорт, прогрев) ждут, пока живет блокировка
+    flight_wait = None if user is not None and admission_wait is None else export_flight.lock_timeout
+    flight_key = f"{type(document_obj).__name__}:{document_obj.pk}:{export_format}:{export_key}"
+    content = export_flight.run(
+        flight_key, render, lambda: export_cache.get(export_key, export_format), flight_wait
+    )
+    return content, export_key
+
+def check_image_dependencies(request):
+    """Проверяет наличие Pillow и при необходимости добавляет его в requirements.txt."""
     try:
         from PIL import Image
         logger.info("Модуль PIL (Pillow) доступен")
@@ -1066,407 +1218,156 @@ def main_export_docx(request, pk):
                     messages.info(request, "Для корректной обработки изображений рекомендуется установить Pillow: pip install Pillow")
             except Exception as req_error:
                 logger.warning(f"Не удалось обновить requirements.txt: {req_error}")
+
+def export_rejected_response(request, rejection):
+    """
+    Ответ на экспорт, не допущенный из-за нагрузки: 429 при заполненной
+    очереди или лимите пользователя, 503 с позицией в очереди, пока экспорт
+    ждет слота. Retry-After подсказывает, когда повторить запрос.
+    
+    Экспорт по обычной ссылке получает страницу с сообщением; при 503 она
+    обновляется сама через Retry-After секунд (заголовок Refresh), и запрос
+    сохраняет место в очереди. Запросы из скриптов получают JSON.
+    """
+    logger.warning(f"Экспорт отклонен ({rejection.status}): {rejection}")
+    context = {
+        'error': str(rejection),
+        'queue_position': rejection.position,
+        'retry_after': rejection.retry_after,
+    }
+    if request.headers.get('X-Requested-With') != 'XMLHttpRequest' and request.accepts('text/html'):
+        response = render(request, 'documents/export_rejected.html', context, status=rejection.status)
+        if rejection.status == 503:
+            response['Refresh'] = str(rejection.retry_after)
+    else:
+        response = JsonResponse(context, status=rejection.status, json_dumps_params={'ensure_ascii': False})
+    response['Retry-After'] = str(rejection.retry_after)
+    return response
+
+def load_export_document(request, adapter, pk):
+    """
+    Загружает документ для экспорта одним планом запросов адаптера
+    (select_related/prefetch_related) с проверкой владельца.
+    """
+    return get_object_or_404(adapter.get_queryset(request.user), pk=pk)
+
+@login_required
+def document_export_docx(request, pk, kind='main'):
+    """
+    Экспорт документа в формат DOCX.
+    
+    Args:
+        request: HTTP запрос
+        pk (int): ID документа
+        kind (str): Тип документа ('main', 'gost', 'sto')
+        
+    Returns:
+        HttpResponse: Ответ с DOCX файлом
+    """
+    adapter = get_export_adapter(kind)
+    logger.info(f"Начат экспорт документа {adapter.label} (ID: {pk}) в DOCX")
+    
+    # Проверяем наличие необходимых зависимостей
+    check_image_dependencies(request)
     
     try:
-        # Получаем документ
-        document = get_object_or_404(Document_main, pk=pk, owner=request.user)
+        # Получаем документ вместе со всеми частями
+        document = load_export_document(request, adapter, pk)
         logger.info(f"Документ найден: {document.title}")
         
-        # Определяем шаблон на основе типа работы
-        template_name = WORK_TYPE_TEMPLATES.get(document.work_type, 'diplo_project')
-        template_path = get_docx_template(template_name)
-        
-        if not template_path:
-            messages.error(request, "Не удалось найти шаблон для документа.")
-            return redirect('documents:main_detail', pk=pk)
-        
-        # Шаг 1: Загружаем титульный документ и рендерим его с помощью DocxTemplate
-        doc_template = DocxTemplate(template_path)
-        
-        # Подготавливаем контекст для шаблона
-        context = {
-            'TITLE': document.title.upper(),
-            'TitleContinue': "",
-            'YEAR': str(document.year),
-            'YearShort': str(document.year)[-2:] if document.year else '__',
-            'STUDENT_NAME': document.student_name or '',
-            'SUPERVISOR': document.supervisor or '',
-            'SupervisorPosition': getattr(document, 'supervisor_position', ''),
-            'SupervisorSignature': '_________',
-            'StudentSignature': '_________',
-            'Institut': document.institute_name or 'Институт космических и информационных технологий',
-            'institut': document.institute_name or 'Институт космических и информационных технологий',  # вариант с маленькой буквы
-            'Kafedra': document.department_name or '',
-            'ZavKaf': getattr(document, 'head_of_department', ''),
-            'Podpis': '_________',
-            'Day': getattr(document, 'day', '___'),
-            'Month': getattr(document, 'month', '________'),
-            'Speciality': f"{document.specialty_code} {document.specialty_name}".strip(),
-            'UNIVERSITY': (document.university_name or 'СИБИРСКИЙ ФЕДЕРАЛЬНЫЙ УНИВЕРСИТЕТ').upper(),
-            'code': document.specialty_code,
-            'head_of_department': getattr(document, 'head_of_department', ''),
-            'speciality_full': f"{document.specialty_code_full} {document.specialty_name}".strip(),
-            'record_number': document.record_number,
-            'reviewer': document.reviewer or '',
-            'reviewer_position': getattr(document, 'reviewer_position', ''),
-            'factory_supervisor': document.factory_supervisor or '',
-        }
-        
-        # Рендерим документ с указанным контекстом
-        logger.info("Заполнение шаблона через DocxTemplate")
-        doc_template.render(context)
-        
-        # Сохраняем титульный лист в BytesIO вместо временного файла
-        title_io = BytesIO()
-        doc_template.save(title_io)
-        title_io.seek(0)
-        logger.info("Титульный лист сохранен в BytesIO")
-        
-        # Загружаем сохраненный титульный лист как Document
-        doc_title = Document(title_io)
-        logger.info("Титульный лист успешно подготовлен")
-        
-        # Шаг 2: Создаем отдельный документ для основной части
-        doc_body = Document()
-        
-        # Проверяем и создаем базовые стили только для основного текста
-        ensure_basic_styles(doc_body)
-        
-        # Применяем стили форматирования на основе стандарта (только для основного текста)
-        if document.standart:
-            logger.info(f"Применение стилей форматирования для стандарта: {document.standart}")
-            apply_document_formatting(doc_body, document.standart)
-        
-        # Добавляем содержимое документа
-        if document.data:
-            logger.info("Добавление содержимого документа")
-            process_html_to_docx(document.data, doc_body)
-        else:
-            doc_body.add_paragraph("Документ не содержит данных")
+        # Если документ не менялся, отвечаем 304 или готовым файлом из кэша
+        cached_response, export_key, etag = cached_export_response(
+            request, document, get_template_name(document), 'docx', DOCX_CONTENT_TYPE
+        )
+        if cached_response is not None:
+            return cached_response
         
-        # Добавляем список литературы
-        add_references_section(doc_body, document)
-            
-        # Добавляем нумерацию страниц
-        add_page_numbers(doc_body)
-        
-        # Сохраняем основную часть в BytesIO вместо временного файла
-        body_io = BytesIO()
-        doc_body.save(body_io)
-        body_io.seek(0)
-        logger.info("Основная часть сохранена в BytesIO")
-        
-        # Шаг 3: Объединяем документы
-        logger.info("Объединение титульного листа и основной части")
-        merge_docs(doc_title, Document(body_io))
-        
-        # Шаг 4: Применяем форматирование после слияния
-        logger.info("Применение форматирования после слияния документов")
-        # Устанавливаем поля для всех секций
-        for section in doc_title.sections:
-            section.left_margin = Cm(3.0)    # левое - 30 мм
-            section.right_margin = Cm(1.0)   # правое - 10 мм
-            section.top_margin = Cm(2.0)     # верхнее - 20 мм
-            section.bottom_margin = Cm(2.0)  # нижнее - 20 мм
-        
-        # Применяем форматирование ко всем параграфам
-        apply_formatting_to_paragraphs(doc_title)
-        
-        # Шаг 5: Сохраняем итоговый документ в BytesIO
-        final_io = BytesIO()
-        doc_title.save(final_io)
-        final_io.seek(0)
-        logger.info("Итоговый документ сохранен в BytesIO")
-        
-        # Проверяем, что данные есть
-        file_content = final_io.getvalue()
-        if not file_content or len(file_content) == 0:
-            logger.error("Итоговый файл имеет нулевой размер")
-            messages.error(request, "Ошибка при создании документа: файл не был создан")
-            return redirect('documents:main_detail', pk=pk)
-        
-        # Формируем имя файла
-        safe_filename = slugify(document.document_name or document.title)
-        if not safe_filename:  # Дополнительная проверка на пустое имя
-            safe_filename = f"document_{pk}"
-        filename = f"{safe_filename}.docx"
+        file_content, _ = export_document(document, 'docx', export_key, user=request.user)
         
         # Отправляем файл пользователю с правильным Content-Disposition
-        response = HttpResponse(
-            file_content,
-            content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        filename = get_export_filename(document, 'docx')
+        response = export_file_response(file_content, filename, DOCX_CONTENT_TYPE, etag)
         
-        logger.info(f"Экспорт документа Main в DOCX успешно завершен. Имя файла: {filename}")
+        logger.info(f"Экспорт документа {adapter.label} в DOCX успешно завершен. Имя файла: {filename}")
         return response
-        
+    
+    except ExportRejected as rejection:
+        return export_rejected_response(request, rejection)
+    except ExportError as e:
+        messages.error(request, str(e))
+        return redirect(adapter.detail_url, pk=pk)
     except Exception as e:
-        logger.error(f"Ошибка при экспорте документа Main в DOCX: {e}", exc_info=True)
+        logger.error(f"Ошибка при экспорте документа {adapter.label} в DOCX: {e}", exc_info=True)
         messages.error(request, f"Ошибка при экспорте документа: {str(e)}")
-        return redirect('documents:main_detail', pk=pk)
+        return redirect(adapter.detail_url, pk=pk)
 
 @login_required
-def main_export_pdf(request, pk):
+def document_export_pdf(request, pk, kind='main'):
     """
-    Экспорт документа Main в формат PDF.
+    Экспорт документа в формат PDF. Параметр engine=fast строит PDF
+    напрямую из HTML, без DOCX и конвертера.
     
     Args:
         request: HTTP запрос
         pk (int): ID документа
+        kind (str): Тип документа ('main', 'gost', 'sto')
         
     Returns:
         HttpResponse: Ответ с PDF файлом
     """
-    logger.info(f"Начат экспорт документа Main (ID: {pk}) в PDF") 
+    adapter = get_export_adapter(kind)
+    engine = request.GET.get('engine', 'docx')
+    if engine not in PDF_ENGINES:
+        engine = 'docx'
+    logger.info(f"Начат экспорт документа {adapter.label} (ID: {pk}) в PDF ({engine})") 
     
     # Проверяем наличие необходимых зависимостей
-    try:
-        from PIL import Image
-        logger.info("Модуль PIL (Pillow) доступен")
-    except ImportError:
-        logger.warning("Модуль PIL (Pillow) не установлен. Рекомендуется установить для корректной обработки изображений")
-        # Проверяем наличие файла requirements.txt
-        requirements_path = os.path.join(settings.BASE_DIR, 'requirements.txt')
-        if os.path.exists(requirements_path):
-            logger.info("Добавление Pillow в requirements.txt")
-            try:
-                with open(requirements_path, 'r') as f:
-                    requirements = f.read()
-                
-                # Проверяем, есть ли уже Pillow в requirements.txt
-                if 'Pillow' not in requirements and 'pillow' not in requirements:
-                    with open(requirements_path, 'a') as f:
-                        f.write("\n# Добавлено автоматически для обработки изображений\nPillow>=9.0.0\n")
-                    logger.info("Pillow добавлен в requirements.txt")
-                    messages.info(request, "Для корректной обработки изображений рекомендуется установить Pillow: pip install Pillow")
-            except Exception as req_error:
-                logger.warning(f"Не удалось обновить requirements.txt: {req_error}")
+    check_image_dependencies(request)
     
-    com_initialized = False
-    if pythoncom:
-        try:
-            pythoncom.CoInitialize()
-            com_initialized = True
-            logger.info("COM успешно инициализирован.")
-        except Exception as e:
-            logger.warning(f"Ошибка при инициализации COM: {e}")
-            pass
-            
     try:
-        document_obj = get_object_or_404(Document_main, pk=pk, owner=request.user)
+        document_obj = load_export_document(request, adapter, pk)
         logger.info(f"Документ найден: {document_obj.title}")
         
-        # Для PDF нам нужны реальные файлы для конвертации docx2pdf
-        # Но мы будем использовать BytesIO где возможно и минимизировать использование временных файлов
-        
-        # Создаем DOCX документ в памяти
-        title_io = BytesIO()
-        body_io = BytesIO()
-        
-        template_name = WORK_TYPE_TEMPLATES.get(document_obj.work_type, 'diplo_project')
-        template_path = get_docx_template(template_name)
-        
-        if not template_path:
-            messages.error(request, "Не удалось найти шаблон для документа.")
-            return redirect('documents:main_detail', pk=pk)
-        
-        # 1. Рендеринг шаблона DocxTemplate для титульного листа
-        doc_template = DocxTemplate(template_path)
-        context = {
-            'TITLE': document_obj.title.upper(),
-            'TitleContinue': "",
-            'YEAR': str(document_obj.year),
-            'YearShort': str(document_obj.year)[-2:] if document_obj.year else '__',
-            'STUDENT_NAME': document_obj.student_name or '',
-            'SUPERVISOR': document_obj.supervisor or '',
-            'SupervisorPosition': getattr(document_obj, 'supervisor_position', ''),
-            'SupervisorSignature': '_________',
-            'StudentSignature': '_________',
-            'Institut': document_obj.institute_name or 'Институт космических и информационных технологий',
-            'institut': document_obj.institute_name or 'Институт космических и информационных технологий',
-            'Kafedra': document_obj.department_name or '',
-            'ZavKaf': getattr(document_obj, 'head_of_department', ''),
-            'Podpis': '_________',
-            'Day': getattr(document_obj, 'day', '___'),
-            'Month': getattr(document_obj, 'month', '________'),
-            'Speciality': f"{document_obj.specialty_code} {document_obj.specialty_name}".strip(),
-            'UNIVERSITY': (document_obj.university_name or 'СИБИРСКИЙ ФЕДЕРАЛЬНЫЙ УНИВЕРСИТЕТ').upper(),
-            'code': document_obj.specialty_code,
-            'head_of_department': getattr(document_obj, 'head_of_department', ''),
-            'speciality_full': f"{document_obj.specialty_code_full} {document_obj.specialty_name}".strip(),
-            'record_number': document_obj.record_number,
-            'reviewer': document_obj.reviewer or '',
-            'reviewer_position': getattr(document_obj, 'reviewer_position', ''),
-            'factory_supervisor': document_obj.factory_supervisor or '',
-        }
-        logger.info("Заполнение шаблона через DocxTemplate")
-        doc_template.render(context)
-        
-        # Сохраняем титульный лист в BytesIO
-        doc_template.save(title_io)
-        title_io.seek(0)
-        logger.info("Титульный лист сохранен в BytesIO")
-        
-        # Загружаем сохраненный титульный лист как Document
-        doc_title = Document(title_io)
-        logger.info("Титульный лист успешно подготовлен")
-        
-        # 2. Создаем отдельный документ для основной части
-        doc_body = Document()
-        
-        # Проверяем и создаем базовые стили для основного текста
-        ensure_basic_styles(doc_body)
+        # Если документ не менялся, отвечаем 304 или готовым файлом из кэша.
+        # Ключ PDF производный от ключа DOCX той же версии документа
+        template_name = get_template_name(document_obj)
+        docx_key = get_export_key(document_obj, template_name, 'docx')
+        cached_response, export_key, etag = cached_export_response(
+            request, document_obj, template_name, 'pdf', 'application/pdf', engine, docx_key
+        )
+        if cached_response is not None:
+            return cached_response
         
-        # Применяем стили форматирования на основе стандарта
-        if document_obj.standart:
-            logger.info(f"Применение стилей форматирования для стандарта: {document_obj.standart}")
-            apply_document_formatting(doc_body, document_obj.standart)
+        # PDF строится из DOCX-артефакта: если DOCX уже экспортировался,
+        # выполняется только конвертация. Результат сохраняется в кэш
+        try:
+            pdf_content, _ = export_document(document_obj, 'pdf', export_key, engine, docx_key, user=request.user)
+        except PdfConversionError as pdf_error:
+            logger.error(str(pdf_error), exc_info=True)
+            messages.error(request, str(pdf_error))
+            
+            # В случае ошибки конвертации предлагаем скачать DOCX
+            docx_content, _ = export_document(document_obj, 'docx', docx_key, user=request.user)
+            filename = get_export_filename(document_obj, 'docx')
+            logger.info(f"Предоставлен DOCX файл вместо PDF из-за ошибки конвертации. Имя файла: {filename}")
+            return export_file_response(docx_content, filename, DOCX_CONTENT_TYPE)
         
-        # Добавляем содержимое документа
-        if document_obj.data:
-            logger.info("Добавление содержимого документа")
-            process_html_to_docx(document_obj.data, doc_body)
-        else:
-            doc_body.add_paragraph("Документ не содержит данных")
+        # Отправляем PDF пользователю
+        filename = get_export_filename(document_obj, 'pdf')
+        response = export_file_response(pdf_content, filename, 'application/pdf', etag)
         
-        # Добавляем список литературы
-        add_references_section(doc_body, document_obj)
-            
-        # Добавляем нумерацию страниц
-        add_page_numbers(doc_body)
-        
-        # Сохраняем основную часть в BytesIO
-        doc_body.save(body_io)
-        body_io.seek(0)
-        logger.info("Основная часть сохранена в BytesIO")
-        
-        # 3. Объединяем документы
-        logger.info("Объединение титульного листа и основной части")
-        merge_docs(doc_title, Document(body_io))
-        
-        # 4. Применяем форматирование после слияния
-        logger.info("Применение форматирования после слияния документов")
-        # Устанавливаем поля для всех секций
-        for section in doc_title.sections:
-            section.left_margin = Cm(3.0)    # левое - 30 мм
-            section.right_margin = Cm(1.0)   # правое - 10 мм
-            section.top_margin = Cm(2.0)     # верхнее - 20 мм
-            section.bottom_margin = Cm(2.0)  # нижнее - 20 мм
-        
-        # Применяем форматирование ко всем параграфам
-        apply_formatting_to_paragraphs(doc_title)
-        
-        # Для конвертации в PDF нам нужен временный файл DOCX
-        with tempfile.NamedTemporaryFile(suffix='.docx', delete=False) as docx_temp:
-            docx_path = docx_temp.name
-            logger.info(f"Сохранение объединенного документа во временный файл: {docx_path}")
-            
-            # Сохраняем объединенный документ во временный файл
-            doc_title.save(docx_path)
-            
-            # Закрываем файл перед конвертацией
-            docx_temp.close()
-            
-            # Проверяем, что файл создан и имеет размер
-            if not os.path.exists(docx_path) or os.path.getsize(docx_path) == 0:
-                logger.error("Объединенный DOCX файл не создан или имеет нулевой размер")
-                messages.error(request, "Ошибка при создании документа: файл не был создан")
-                # Удаляем временный файл
-                try:
-                    os.unlink(docx_path)
-                except:
-                    pass
-                return redirect('documents:main_detail', pk=pk)
-            
-            # Создаем временный файл для PDF
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_temp:
-                pdf_path = pdf_temp.name
-                pdf_temp.close()  # Закрываем файл перед конвертацией
-                
-                # Конвертация в PDF
-                logger.info(f"Конвертация DOCX в PDF: {docx_path} -> {pdf_path}")
-                try:
-                    convert(docx_path, pdf_path)
-                    logger.info(f"PDF файл создан: {pdf_path}")
-                    
-                    # Проверяем, что PDF файл создан и имеет размер
-                    if not os.path.exists(pdf_path) or os.path.getsize(pdf_path) == 0:
-                        logger.error("PDF файл не создан или имеет нулевой размер")
-                        messages.error(request, "Ошибка при создании PDF: файл не был создан")
-                        # Удаляем временные файлы
-                        try:
-                            os.unlink(docx_path)
-                            os.unlink(pdf_path)
-                        except:
-                            pass
-                        return redirect('documents:main_detail', pk=pk)
-                    
-                    safe_filename = slugify(document_obj.document_name or document_obj.title or "document")
-                    if not safe_filename:
-                        safe_filename = f"document_{pk}"
-                    filename = f"{safe_filename}.pdf" 
-                    
-                    # Читаем PDF в память и отправляем пользователю
-                    with open(pdf_path, 'rb') as pdf_file:
-                        pdf_content = pdf_file.read()
-                        
-                    # Удаляем временные файлы
-                    try:
-                        os.unlink(docx_path)
-                        os.unlink(pdf_path)
-                    except Exception as cleanup_error:
-                        logger.warning(f"Не удалось удалить временные файлы: {cleanup_error}")
-                    
-                    # Отправляем PDF пользователю
-                    response = HttpResponse(pdf_content, content_type='application/pdf')
-                    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                    
-                    logger.info(f"Экспорт документа Main в PDF успешно завершен. Имя файла: {filename}")
-                    return response
-                    
-                except Exception as pdf_error:
-                    logger.error(f"Ошибка при конвертации в PDF: {pdf_error}", exc_info=True)
-                    messages.error(request, f"Ошибка при конвертации в PDF: {str(pdf_error)}")
-                    
-                    # Удаляем временные файлы
-                    try:
-                        os.unlink(docx_path)
-                        os.unlink(pdf_path)
-                    except:
-                        pass
-                    
-                    # В случае ошибки конвертации предлагаем скачать DOCX
-                    safe_filename = slugify(document_obj.document_name or document_obj.title or "document")
-                    if not safe_filename:
-                        safe_filename = f"document_{pk}"
-                    filename = f"{safe_filename}.docx"
-                    
-                    # Читаем DOCX в память
-                    with open(docx_path, 'rb') as docx_file:
-                        docx_content = docx_file.read()
-                    
-                    # Отправляем DOCX пользователю
-                    response = HttpResponse(
-                        docx_content,
-                        content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-                    )
-                    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                    
-                    logger.info(f"Предоставлен DOCX файл вместо PDF из-за ошибки конвертации. Имя файла: {filename}")
-                    return response
-                
+        logger.info(f"Экспорт документа {adapter.label} в PDF успешно завершен. Имя файла: {filename}")
+        return response
+    
+    except ExportRejected as rejection:
+        return export_rejected_response(request, rejection)
+    except ExportError as e:
+        messages.error(request, str(e))
+        return redirect(adapter.detail_url, pk=pk)
     except Exception as e:
-        logger.error(f"Ошибка при экспорте документа Main в PDF: {e}", exc_info=True)
+        logger.error(f"Ошибка при экспорте документа {adapter.label} в PDF: {e}", exc_info=True)
         messages.error(request, f"Ошибка при экспорте документа: {str(e)}")
-        return redirect('documents:main_detail', pk=pk)
-    finally:
-        if com_initialized:
-            try:
-                pythoncom.CoUninitialize()
-                logger.info("COM успешно деинициализирован.")
-            except Exception as e:
-                logger.warning(f"Ошибка при деинициализации COM: {e}")
+        return redirect(adapter.detail_url, pk=pk)
 
 def get_metadata_from_doi(doi):
     """
@@ -1480,6 +1381,21 @@ def get_metadata_from_doi(doi):
     """
     logger.info(f"Получение метаданных для DOI: {doi}")
     
+    # Метаданные публикации не меняются, поэтому держим их в кэше Django
+    cache_key = f"doi-metadata:{hashlib.sha256(doi.encode('utf-8')).hexdigest()}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logger.info(f"Метаданные для DOI {doi} взяты из кэша")
+        return cached.get('message')
+    
+    metadata = _fetch_metadata_from_doi(doi)
+    # Неудачный запрос кэшируем ненадолго, чтобы не повторять его на каждом экспорте
+    timeout = DOI_METADATA_CACHE_TIMEOUT if metadata is not None else DOI_METADATA_FAILURE_TIMEOUT
+    cache.set(cache_key, {'message': metadata}, timeout)
+    return metadata
+
+def _fetch_metadata_from_doi(doi):
+    """Выполняет запрос к CrossRef API без кэширования."""
     try:
         # Формируем URL для запроса к CrossRef API
         url = f"https://api.crossref.org/works/{doi}"
@@ -1607,6 +1523,22 @@ def format_citation_gost(metadata):
         logger.error(f"Ошибка при форматировании ссылки по ГОСТ: {e}", exc_info=True)
         return f"Ошибка форматирования ссылки: {str(e)}"
 
+def get_doi_list(document_obj):
+    """
+    Возвращает список DOI документа.
+    DOI хранятся в поле references_doi как строка с разделителями-запятыми.
+    """
+    if not getattr(document_obj, 'references_doi', None):
+        return []
+    return [doi.strip() for doi in document_obj.references_doi.split(',') if doi.strip()]
+
+def resolve_references(document_obj):
+    """
+    Возвращает список пар (DOI, метаданные) для документа.
+    Метаданные равны None, если их не удалось получить.
+    """
+    return [(doi, get_metadata_from_doi(doi)) for doi in get_doi_list(document_obj)]
+
 def add_references_section(docx_document, document_obj):
     """
     Добавляет раздел со списком литературы в документ.
@@ -1623,23 +1555,15 @@ def add_references_section(docx_document, document_obj):
         heading = docx_document.add_paragraph("Список литературы", style='Heading 1')
         heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
         
-        # Получаем список DOI из документа
-        # Предполагаем, что DOI хранятся в поле references_doi как строка с разделителями
-        doi_list = []
-        if hasattr(document_obj, 'references_doi') and document_obj.references_doi:
-            # Разбиваем строку на отдельные DOI
-            doi_list = [doi.strip() for doi in document_obj.references_doi.split(',') if doi.strip()]
+        references = resolve_references(document_obj)
         
         # Если список DOI пуст, добавляем информационное сообщение
-        if not doi_list:
+        if not references:
             docx_document.add_paragraph("Список литературы не содержит источников.", style='Normal')
             return
         
         # Обрабатываем каждый DOI и добавляем ссылку в документ
-        for i, doi in enumerate(doi_list, 1):
-            # Получаем метаданные по DOI
-            metadata = get_metadata_from_doi(doi)
-            
+        for i, (doi, metadata) in enumerate(references, 1):
             if metadata:
                 # Форматируем ссылку по ГОСТ
                 citation = format_citation_gost(metadata)
@@ -1653,33 +1577,8 @@ def add_references_section(docx_document, document_obj):
                 p.add_run(f"{i}. ").bold = True
                 p.add_run(f"DOI: {doi} (не удалось получить метаданные)")
         
-        logger.info(f"Добавлено {len(doi_list)} источников в список литературы")
+        logger.info(f"Добавлено {len(references)} источников в список литературы")
         
     except Exception as e:
         logger.error(f"Ошибка при добавлении раздела со списком литературы: {e}", exc_info=True)
         docx_document.add_paragraph("Ошибка при формировании списка литературы", style='Normal')
-
-def convert_to_cm(value, unit):
-    """
-    Преобразует значение из различных единиц измерения в сантиметры.
-    
-    Args:
-        value (float): Числовое значение
-        unit (str): Единица измерения (px, em, cm, mm, pt)
-        
-    Returns:
-        float: Значение в сантиметрах
-    """
-    if unit == 'cm':
-        return value
-    elif unit == 'mm':
-        return value / 10.0
-    elif unit == 'pt':
-        return value * 0.0352778  # 1 pt = 0.0352778 см
-    elif unit == 'px':
-        return value * 0.0264583  # Примерно 96 px = 2.54 см
-    elif unit == 'em':
-        return value * 0.42333  # Примерно 1 em = 12pt = 0.42333 см
-    else:
-        # По умолчанию предполагаем пиксели
-        return value * 0.0264583
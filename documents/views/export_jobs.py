@@ -0,0 +1,70 @@
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_POST
+
+from documents.models import Document_main, ExportJob
+from documents.services.export_jobs import export_pool, fail_stale_jobs, get_job_lease
+
+
+def export_job_payload(job):
+    """Сериализует задачу экспорта для ответа API."""
+    payload = {
+        'id': job.pk,
+        'format': job.format,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'status_url': reverse('documents:export_job_status', kwargs={'job_id': job.pk}),
+        # Сколько секунд клиенту имеет смысл опрашивать статус
+        'timeout': get_job_lease(),
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        payload['download_url'] = reverse('documents:export_job_download', kwargs={'job_id': job.pk})
+    if job.status == ExportJob.STATUS_FAILED:
+        payload['error'] = job.error
+    return payload
+
+
+@login_required
+@require_POST
+def export_job_submit(request, pk, export_format):
+    """
+    Ставит экспорт документа Main в очередь и сразу возвращает задачу.
+
+    Args:
+        request: HTTP запрос
+        pk (int): ID документа
+        export_format (str): Формат файла ('docx', 'pdf')
+
+    Returns:
+        JsonResponse: Задача экспорта со ссылкой для опроса статуса (202)
+    """
+    if export_format not in dict(ExportJob.FORMATS):
+        raise Http404("Неподдерживаемый формат экспорта.")
+
+    document = get_object_or_404(Document_main, pk=pk, owner=request.user)
+    job = ExportJob.objects.create(owner=request.user, document=document, format=export_format)
+    transaction.on_commit(lambda: export_pool.submit(job.pk))
+    return JsonResponse(export_job_payload(job), status=202)
+
+
+@login_required
+@require_GET
+def export_job_status(request, job_id):
+    """Возвращает текущий статус задачи экспорта."""
+    job = get_object_or_404(ExportJob, pk=job_id, owner=request.user)
+    if job.status == ExportJob.STATUS_RUNNING and fail_stale_jobs(ExportJob.objects.filter(pk=job.pk)):
+        job.refresh_from_db()
+    return JsonResponse(export_job_payload(job))
+
+
+@login_required
+@require_GET
+def export_job_download(request, job_id):
+    """Отдает готовый файл задачи экспорта."""
+    job = get_object_or_404(ExportJob, pk=job_id, owner=request.user, status=ExportJob.STATUS_DONE)
+    if not job.file:
+        raise Http404("Файл экспорта не найден.")
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
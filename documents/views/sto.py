@@ -6,8 +6,7 @@ from documents.models import Document_sto
 from documents.forms import DocumentForm, AbstractForm, SectionFormSet, BibliographyFormSet, AppendixFormSet
 from django.http import Http404
 from django.http import HttpResponse
-from docxtpl import DocxTemplate
-import os
+from documents.services.docx_templates import template_cache
 from io import BytesIO
 
 
@@ -19,9 +18,10 @@ def generate_title_page(request, pk):
     except Document_sto.DoesNotExist:
         raise Http404("Документ не найден.")
 
-    # Путь к шаблону
-    template_path = os.path.join('templates', 'docx', 'diplo_project.docx')
-    tpl = DocxTemplate(template_path)
+    # Копия разобранного шаблона из процессного кэша
+    tpl = template_cache.get_template('diplo_project')
+    if tpl is None:
+        raise Http404("Шаблон титульного листа не найден.")
 
     context = {
         "institute_name": doc.institute_name or "________",
@@ -149,4 +149,126 @@ CKEDITOR_CONFIGS = {
         'filebrowserUploadUrl': '/ckeditor/upload/',
         'filebrowserBrowseUrl': '/ckeditor/browse/',
     },
-}
\ No newline at end of file
+}
+
+# Экспорт DOCX: сборка титульного листа и основной части без промежуточных
+# сохранений в BytesIO. False — прежний режим (для сравнения).
+DOCX_EXPORT_SINGLE_PASS = True
+
+# Кэш готовых файлов экспорта (DOCX/PDF) с адресацией по содержимому
+EXPORT_CACHE_DIR = BASE_DIR / 'export_cache'
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Фоновые задачи экспорта: пул воркеров ('process' или 'thread') и каталог готовых файлов
+EXPORT_WORKER_BACKEND = 'process'
+EXPORT_WORKERS = 2
+EXPORT_JOBS_DIR = BASE_DIR / 'export_jobs'
+# Задача, которая выполняется дольше EXPORT_JOB_LEASE секунд, считается прерванной
+# (воркер завершился аварийно); завершенные задачи и их файлы хранятся
+# EXPORT_JOBS_RETENTION секунд, очистка — не чаще раза в EXPORT_JOBS_CLEANUP_INTERVAL
+EXPORT_JOB_LEASE = 15 * 60
+EXPORT_JOBS_RETENTION = 24 * 60 * 60
+EXPORT_JOBS_CLEANUP_INTERVAL = 60 * 60
+
+# Параллельная загрузка изображений при экспорте: размер пула потоков,
+# одновременных запросов к одному хосту, таймаут запроса и общий срок (с)
+EXPORT_IMAGE_FETCH_WORKERS = 8
+EXPORT_IMAGE_FETCH_PER_HOST = 4
+EXPORT_IMAGE_FETCH_TIMEOUT = 10
+EXPORT_IMAGE_FETCH_DEADLINE = 30
+
+# Общий кэш изображений для экспорта (загруженные, декодированные и локальные):
+# каталог, лимит объема и срок свежести загруженных по сети, если сервер не задал max-age (с)
+EXPORT_IMAGE_CACHE_DIR = BASE_DIR / 'image_cache'
+EXPORT_IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+EXPORT_IMAGE_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Подготовка изображений перед вставкой в DOCX: уменьшение до печатной ширины
+# (см) при заданном разрешении (dpi) и качество JPEG для фотографий
+EXPORT_IMAGE_OPTIMIZE = True
+EXPORT_IMAGE_DPI = 300
+EXPORT_IMAGE_MAX_WIDTH_CM = 17
+EXPORT_IMAGE_JPEG_QUALITY = 85
+
+# Преобразование HTML из CKEditor в DOCX: 'native' — собственный эмиттер OOXML,
+# 'htmldocx' — прежний путь через htmldocx (для сравнения)
+DOCX_HTML_EMITTER = 'native'
+
+# Оформление абзацев по ГОСТ после сборки документа: True — через стили
+# (Body Text, Heading N) с прямым форматированием только для отличий,
+# False — прежнее прямое форматирование каждого абзаца и прогона
+DOCX_STYLE_FORMATTING = True
+
+# Кэш DOCX-фрагментов разделов основной части (разделы начинаются с заголовков
+# h1/h2): при правке одного раздела заново преобразуется только он. В том же
+# кэше хранятся отрендеренные титульные листы (по версии шаблона и контексту).
+# Каталог и лимит объема; False — преобразовывать весь HTML целиком и
+# рендерить титульный лист при каждом экспорте
+EXPORT_FRAGMENT_CACHE = True
+EXPORT_FRAGMENT_CACHE_DIR = BASE_DIR / 'fragment_cache'
+EXPORT_FRAGMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Конвертация DOCX в PDF: 'docx2pdf' (Microsoft Word, Windows/macOS),
+# 'libreoffice' (пул процессов LibreOffice) или 'auto' — docx2pdf в Windows,
+# иначе LibreOffice, если найден soffice. Пул: число процессов (у каждого
+# свой профиль во временном каталоге или EXPORT_PDF_PROFILE_DIR), число
+# ожидающих запросов сверх занятых процессов, таймауты конвертации и запуска (с)
+# и перезапуск процесса после заданного числа конвертаций. Пул создается
+# один раз в каждом процессе Django; в воркерах EXPORT_WORKER_BACKEND = 'process'
+# он состоит из EXPORT_PDF_WORKERS_PER_EXPORT_PROCESS процессов
+EXPORT_PDF_BACKEND = 'auto'
+EXPORT_PDF_SOFFICE = 'soffice'
+EXPORT_PDF_WORKERS = 2
+EXPORT_PDF_WORKERS_PER_EXPORT_PROCESS = 1
+EXPORT_PDF_QUEUE_DEPTH = 8
+EXPORT_PDF_TIMEOUT = 120
+EXPORT_PDF_START_TIMEOUT = 60
+EXPORT_PDF_MAX_CONVERSIONS = 200
+
+# Быстрый PDF (?engine=fast): строится из HTML через xhtml2pdf без DOCX
+# и конвертера. Семейства шрифтов с кириллицей в порядке предпочтения —
+# пути к обычному, полужирному, курсивному и полужирному курсивному
+# начертаниям; пусто — Times New Roman, Liberation Serif, DejaVu Serif
+EXPORT_FAST_PDF_FONTS = ()
+
+# Допуск экспортов DOCX/PDF по бюджету памяти: одновременно рендерится не
+# больше EXPORT_MEMORY_BUDGET_MB // EXPORT_MEMORY_PER_EXPORT_MB документов и не
+# больше EXPORT_USER_CONCURRENCY на пользователя. Остальные встают в очередь
+# по порядку прихода и ждут слота до EXPORT_QUEUE_WAIT секунд, затем получают
+# 503 с позицией и Retry-After = EXPORT_QUEUE_RETRY_AFTER секунд (страница
+# обновляется сама); повторный запрос сохраняет место. Место теряется, если
+# запрос не повторили за EXPORT_QUEUE_TICKET_TIMEOUT секунд. Если ожидают уже
+# EXPORT_QUEUE_LENGTH запросов — 429 с Retry-After. Фоновые задачи проходят
+# тот же допуск и ждут слота в воркере до EXPORT_JOB_ADMISSION_WAIT секунд.
+# Слоты и очередь хранятся в кэше EXPORT_ADMISSION_CACHE: для нескольких
+# процессов он должен быть общим (Redis, Memcached, база данных). Слот
+# освобождается сам через EXPORT_ADMISSION_LEASE секунд, если процесс
+# завершился аварийно
+EXPORT_ADMISSION_CACHE = 'default'
+EXPORT_MEMORY_BUDGET_MB = 2048
+EXPORT_MEMORY_PER_EXPORT_MB = 256
+EXPORT_USER_CONCURRENCY = 1
+EXPORT_QUEUE_LENGTH = 20
+EXPORT_QUEUE_WAIT = 10
+EXPORT_QUEUE_RETRY_AFTER = 5
+EXPORT_QUEUE_TICKET_TIMEOUT = 60
+EXPORT_ADMISSION_LEASE = 600
+EXPORT_JOB_ADMISSION_WAIT = 5 * 60
+
+# Объединение одинаковых экспортов (повторные нажатия кнопки): файл строит
+# первый запрос, остальные до EXPORT_FLIGHT_WAIT секунд ждут его результат
+# и затем получают 503 с Retry-After, не строя файл повторно; фоновые задачи
+# ждут, пока живет блокировка. Блокировка хранится в кэше
+# EXPORT_ADMISSION_CACHE и снимается сама через EXPORT_FLIGHT_LOCK_TIMEOUT
+# секунд, если процесс завершился аварийно
+EXPORT_FLIGHT_WAIT = 10
+EXPORT_FLIGHT_LOCK_TIMEOUT = 600
+
+# Прогрев экспорта после сохранения документа (Main, ГОСТ, СТО): через
+# EXPORT_WARM_AHEAD_DELAY секунд после последнего сохранения файлы в форматах
+# EXPORT_WARM_AHEAD_FORMATS строятся в пуле экспорта, и скачивание берет их
+# из кэша. Серия сохранений дает один рендеринг; поколения документов
+# хранятся в кэше EXPORT_ADMISSION_CACHE. По умолчанию выключен
+EXPORT_WARM_AHEAD = False
+EXPORT_WARM_AHEAD_DELAY = 5
+EXPORT_WARM_AHEAD_FORMATS = ('docx',)